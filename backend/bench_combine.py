@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Combine Pipeline Benchmark
+
+Times the staged and the streaming combine on the same segments:
+
+  staged     download every segment, preflight (re-encode mismatches),
+             stream-copy concat, then upload the finished file
+  streaming  combine_pipeline: download, per-segment preflight + remux,
+             concat into fragmented MP4 and upload all overlap
+
+Segments are served by a local HTTP server and the upload goes to a local
+sink, both throttled to the given bandwidth, so network and CPU time are
+both part of the measurement. Source segments are generated with ffmpeg's
+lavfi test sources (see bench_normalize.py); --mismatched gives some of them
+another frame size so the preflight has to re-encode them. The streaming
+wall time should approach the slowest stage rather than the sum of them.
+
+Usage:
+  python bench_combine.py
+  python bench_combine.py --segments 12 --download-mbps 40 --upload-mbps 20
+  python bench_combine.py --mismatched 2 --runs 3
+"""
+
+import argparse
+import asyncio
+import functools
+import http.server
+import shutil
+import socketserver
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import AsyncIterator, List
+
+import httpx
+
+from bench_normalize import make_sources
+from combine_pipeline import CHUNK_SIZE, prepare_segments, stream_combine
+from video_segments import prepare_for_concat
+
+DOWNLOAD_CONCURRENCY = 4  # as main.DOWNLOAD_CONCURRENCY
+
+
+class ThrottledHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files at `rate` bytes/s per connection"""
+    rate = 0
+
+    def copyfile(self, source, outputfile):
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            time.sleep(len(chunk) / self.rate)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(directory: Path, rate: float) -> socketserver.ThreadingTCPServer:
+    handler = type('Handler', (ThrottledHandler,), {'rate': rate})
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), functools.partial(handler, directory=str(directory)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_mismatched(source: Path) -> Path:
+    """Same content at 720x1280: breaks the stream-copy concat, forces a re-encode"""
+    output = source.with_name(f"{source.stem}_720.mp4")
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', '-i', str(source), '-vf', 'scale=720:1280',
+                    '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-c:a', 'copy',
+                    str(output)], check=True)
+    return output
+
+
+async def throttled_upload(chunks: AsyncIterator[bytes], rate: float) -> int:
+    """Upload stand-in: consumes the stream at `rate` bytes/s"""
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        await asyncio.sleep(len(chunk) / rate)
+    return total
+
+
+async def file_chunks(path: Path) -> AsyncIterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def download(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str, path: Path) -> Path:
+    async with semaphore:
+        response = await client.get(url)
+        response.raise_for_status()
+        path.write_bytes(response.content)
+        return path
+
+
+async def run_staged(urls: List[str], work_dir: Path, upload_rate: float) -> float:
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    async with httpx.AsyncClient(timeout=600.0) as client:
+        files = await asyncio.gather(*(download(client, semaphore, url, work_dir / f"segment_{i}.mp4")
+                                       for i, url in enumerate(urls)))
+    files, _ = await prepare_for_concat(list(files), work_dir)
+
+    concat_file = work_dir / "concat.txt"
+    concat_file.write_text(''.join(f"file '{f.absolute()}'\n" for f in files))
+    output = work_dir / "final_video.mp4"
+    await asyncio.to_thread(subprocess.run, [
+        'ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', str(concat_file),
+        '-c', 'copy', '-movflags', '+faststart', str(output)
+    ], check=True)
+
+    await throttled_upload(file_chunks(output), upload_rate)
+    return time.perf_counter() - start
+
+
+async def run_streaming(urls: List[str], work_dir: Path, upload_rate: float) -> float:
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    async with httpx.AsyncClient(timeout=600.0) as client:
+        prepared = prepare_segments(
+            [download(client, semaphore, url, work_dir / f"download_{i}.mp4") for i, url in enumerate(urls)],
+            work_dir
+        )
+        await stream_combine(prepared, work_dir, lambda chunks: throttled_upload(chunks, upload_rate))
+    return time.perf_counter() - start
+
+
+def fresh_dir(work_dir: Path, name: str) -> Path:
+    path = work_dir / name
+    shutil.rmtree(path, ignore_errors=True)
+    path.mkdir()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark staged vs streaming combine')
+    parser.add_argument('--segments', type=int, default=8)
+    parser.add_argument('--seconds', type=int, default=8, help='Duration of each segment')
+    parser.add_argument('--mismatched', type=int, default=0, help='Segments given another frame size')
+    parser.add_argument('--download-mbps', type=float, default=50.0, help='Per-connection download bandwidth')
+    parser.add_argument('--upload-mbps', type=float, default=50.0)
+    parser.add_argument('--runs', type=int, default=1, help='Runs per mode (best is reported)')
+    parser.add_argument('--keep', action='store_true', help='Keep the work directory')
+    args = parser.parse_args()
+
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        print("❌ ffmpeg/ffprobe not found on PATH")
+        return
+
+    work_dir = Path(tempfile.mkdtemp(prefix='sparkfluence_bench_'))
+    server = None
+    try:
+        print(f"📦 Generating {args.segments} x {args.seconds}s source segments in {work_dir} ...")
+        sources = make_sources(work_dir, args.segments, args.seconds)
+        for i in range(min(args.mismatched, args.segments)):
+            sources[-1 - i] = make_mismatched(sources[-1 - i])
+        total_bytes = sum(path.stat().st_size for path in sources)
+
+        download_rate = args.download_mbps * 1e6 / 8
+        upload_rate = args.upload_mbps * 1e6 / 8
+        server = serve(work_dir, download_rate)
+        urls = [f"http://127.0.0.1:{server.server_address[1]}/{path.name}" for path in sources]
+
+        # Lower bounds of the network stages alone
+        download_seconds = total_bytes / (download_rate * min(DOWNLOAD_CONCURRENCY, args.segments))
+        upload_seconds = total_bytes / upload_rate
+        print(f"🎯 {total_bytes / 1e6:.1f} MB, {args.mismatched} mismatched, download "
+              f"{args.download_mbps:g} Mbit/s x {DOWNLOAD_CONCURRENCY}, upload {args.upload_mbps:g} Mbit/s "
+              f"(network alone: download ≥{download_seconds:.1f}s, upload ≥{upload_seconds:.1f}s)\n")
+
+        results = []
+        for name, run in (('staged', run_staged), ('streaming', run_streaming)):
+            best = min(asyncio.run(run(urls, fresh_dir(work_dir, name), upload_rate)) for _ in range(args.runs))
+            results.append((name, best))
+
+        baseline = results[0][1]
+        print(f"{'mode':<12} {'wall s':>8} {'vs staged':>10}")
+        for name, seconds in results:
+            print(f"{name:<12} {seconds:>8.2f} {baseline / seconds:>9.2f}x")
+    finally:
+        if server:
+            server.shutdown()
+        if args.keep:
+            print(f"\n📁 Kept {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Segment Normalization Benchmark
+
+Compares three ways of re-encoding N segments to one target format:
+
+  pool    concurrent per-segment encodes (video_segments.conform_segments,
+          cores split between workers), then a stream-copy concat
+  serial  per-segment encodes one after another, each with all cores
+  single  one ffmpeg process: all segments -> concat filter -> one encode
+
+Source segments are generated with ffmpeg's lavfi test sources (1080x1920
+24fps, AAC), so the benchmark needs nothing but ffmpeg/ffprobe on PATH.
+
+Usage:
+  python bench_normalize.py
+  python bench_normalize.py --segments 12 --seconds 8 --resolution 720p --fps 30
+  python bench_normalize.py --workers 2 4 8 --preset ultrafast
+"""
+
+import argparse
+import asyncio
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from video_segments import (
+    CPU_COUNT, ENCODE_CRF, ENCODE_PRESET, choose_reference, conform_segments, normalize_target,
+    probe_segments, target_size, thread_budget
+)
+
+
+def make_sources(work_dir: Path, count: int, seconds: int) -> List[Path]:
+    """Synthetic 1080x1920 segments with moving content (so the encoder has work to do)"""
+    files = []
+    for i in range(count):
+        path = work_dir / f"source_{i}.mp4"
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'lavfi', '-i', f"testsrc2=size=1080x1920:rate=24:duration={seconds}",
+            '-f', 'lavfi', '-i', f"sine=frequency={220 + 40 * i}:sample_rate=48000:duration={seconds}",
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-ac', '2', '-shortest', str(path)
+        ], check=True)
+        files.append(path)
+    return files
+
+
+def concat_copy(files: List[Path], work_dir: Path) -> Path:
+    """Lossless join of the normalized segments"""
+    concat_file = work_dir / "concat.txt"
+    concat_file.write_text(''.join(f"file '{f.absolute()}'\n" for f in files))
+    output = work_dir / "pool_output.mp4"
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', str(concat_file),
+                    '-c', 'copy', str(output)], check=True)
+    return output
+
+
+def run_pool(sources: List[Path], work_dir: Path, args, workers: int, threads: int = 0) -> float:
+    """Concurrent per-segment encodes + stream-copy concat; returns wall seconds"""
+    out_dir = work_dir / f"pool_{workers}_{threads}"
+    out_dir.mkdir(exist_ok=True)
+
+    async def encode():
+        infos = await probe_segments(sources)
+        width, height = target_size(args.resolution, args.aspect_ratio)
+        reference = normalize_target(choose_reference(infos), width, height, args.fps)
+        replaced = await conform_segments(infos, reference, out_dir, args.preset, workers, threads or None)
+        return [replaced.get(i, path) for i, path in enumerate(sources)]
+
+    start = time.perf_counter()
+    files = asyncio.run(encode())
+    concat_copy(files, out_dir)
+    return time.perf_counter() - start
+
+
+def run_single(sources: List[Path], work_dir: Path, args) -> float:
+    """One ffmpeg process decoding every segment into one encode; returns wall seconds"""
+    width, height = target_size(args.resolution, args.aspect_ratio)
+    cmd = ['ffmpeg', '-y', '-v', 'error']
+    for source in sources:
+        cmd += ['-i', str(source)]
+    chains = [
+        f"[{i}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={args.fps}[v{i}]"
+        for i in range(len(sources))
+    ]
+    inputs = ''.join(f"[v{i}][{i}:a]" for i in range(len(sources)))
+    graph = ';'.join(chains) + f";{inputs}concat=n={len(sources)}:v=1:a=1[v][a]"
+    cmd += [
+        '-filter_complex', graph, '-map', '[v]', '-map', '[a]',
+        '-c:v', 'libx264', '-preset', args.preset, '-crf', str(ENCODE_CRF), '-threads', str(CPU_COUNT),
+        '-pix_fmt', 'yuv420p', '-c:a', 'aac', str(work_dir / "single_output.mp4")
+    ]
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parallel segment normalization')
+    parser.add_argument('--segments', type=int, default=8)
+    parser.add_argument('--seconds', type=int, default=8, help='Duration of each segment')
+    parser.add_argument('--resolution', default='720p')
+    parser.add_argument('--aspect-ratio', default='9:16')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--preset', default=ENCODE_PRESET)
+    parser.add_argument('--workers', type=int, nargs='+', default=[CPU_COUNT],
+                        help='Pool sizes to measure (threads per encode = cores // workers)')
+    parser.add_argument('--keep', action='store_true', help='Keep the work directory')
+    args = parser.parse_args()
+
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        print("❌ ffmpeg/ffprobe not found on PATH")
+        return
+
+    work_dir = Path(tempfile.mkdtemp(prefix='sparkfluence_bench_'))
+    try:
+        print(f"📦 Generating {args.segments} x {args.seconds}s source segments in {work_dir} ...")
+        sources = make_sources(work_dir, args.segments, args.seconds)
+        video_seconds = args.segments * args.seconds
+        print(f"🎯 Target {args.resolution} {args.aspect_ratio} {args.fps}fps, preset {args.preset}, "
+              f"{CPU_COUNT} cores\n")
+
+        results = [('single (1 process)', run_single(sources, work_dir, args))]
+        results.append((f"serial (1 x {CPU_COUNT} thr)", run_pool(sources, work_dir, args, 1, CPU_COUNT)))
+        for workers in args.workers:
+            _, threads = thread_budget(args.segments, workers)
+            results.append((f"pool ({workers} x {threads} thr)", run_pool(sources, work_dir, args, workers)))
+            if threads > 1:
+                # Oversubscribed: every worker uses all cores
+                results.append((f"pool ({workers} x {CPU_COUNT} thr)",
+                                run_pool(sources, work_dir, args, workers, CPU_COUNT)))
+
+        baseline = results[0][1]
+        print(f"{'mode':<24} {'wall s':>8} {'x realtime':>11} {'vs single':>10}")
+        for name, seconds in results:
+            print(f"{name:<24} {seconds:>8.2f} {video_seconds / seconds:>11.2f} {baseline / seconds:>9.2f}x")
+    finally:
+        if args.keep:
+            print(f"\n🔖 Kept {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+Sparkfluence Combine Artifact Cache
+Per-project intermediate files, so a re-combine only redoes what changed.
+
+Users often regenerate one segment and combine again. For every project the
+cache keeps, under COMBINE_CACHE_DIR/<project_id>/:
+
+    manifest.json       format key, reference format, segment fingerprints,
+                        output key
+    <fingerprint>.mp4   each segment as it went into the concat (downloaded,
+                        re-encoded to the reference if needed)
+    output.mp4          the last combined video (after BGM)
+
+A segment's fingerprint is a hash of its URL and the validators the server
+returns for it (ETag / Last-Modified / Content-Length, one HEAD request),
+so a segment regenerated under the same URL is still seen as changed.
+On a re-combine only segments with a new fingerprint are downloaded and
+conformed to the cached reference format; the concat is a cheap stream
+copy. When nothing changed the last output is reused as is.
+
+The manifest is only valid for the options that shape the segments
+(resolution, aspect ratio, fps, preset); other options invalidate it.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from video_segments import SegmentInfo
+
+logger = logging.getLogger(__name__)
+
+COMBINE_CACHE_DIR = Path(os.getenv('COMBINE_CACHE_DIR', str(Path(tempfile.gettempdir()) / "sparkfluence_combine_cache")))
+COMBINE_CACHE_MAX_AGE = int(os.getenv('COMBINE_CACHE_MAX_AGE_DAYS', '7')) * 86400  # projects untouched this long are dropped
+MANIFEST_VERSION = 1
+FINGERPRINT_CONCURRENCY = 8
+
+# Response headers that change when the object behind a URL changes
+VALIDATOR_HEADERS = ('etag', 'last-modified', 'content-length')
+
+
+def cache_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:24]
+
+
+async def segment_fingerprint(client: httpx.AsyncClient, url: str) -> Optional[str]:
+    """Hash of the URL and its validators; None when the server gives no validator (never cached)"""
+    try:
+        response = await client.head(url, follow_redirects=True)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.warning(f"[CACHE] HEAD failed for {url[:100]}: {e}")
+        return None
+    validators = {h: response.headers.get(h) for h in VALIDATOR_HEADERS if response.headers.get(h)}
+    if not validators.keys() & {'etag', 'last-modified'}:
+        return None
+    return cache_key(url, validators)
+
+
+async def segment_fingerprints(urls: List[str]) -> List[Optional[str]]:
+    """Fingerprints of all segment URLs (HEAD requests in parallel)"""
+    semaphore = asyncio.Semaphore(FINGERPRINT_CONCURRENCY)
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        async def fingerprint(url: str) -> Optional[str]:
+            async with semaphore:
+                return await segment_fingerprint(client, url)
+
+        return list(await asyncio.gather(*(fingerprint(url) for url in urls)))
+
+
+def link_or_copy(source: Path, target: Path):
+    """Hard link when source and target share a filesystem, copy otherwise"""
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy(source, target)
+
+
+class ProjectArtifactCache:
+    """Intermediate combine artifacts of every project"""
+
+    def __init__(self, root: Path = COMBINE_CACHE_DIR):
+        self.root = root
+        self.locks: Dict[str, asyncio.Lock] = {}
+
+    def project_dir(self, project_id: str) -> Path:
+        safe_id = ''.join(c for c in project_id if c.isalnum() or c in '-_') or 'default'
+        return self.root / safe_id
+
+    def lock(self, project_id: str) -> asyncio.Lock:
+        """Serializes combines of one project (they share its artifacts)"""
+        return self.locks.setdefault(self.project_dir(project_id).name, asyncio.Lock())
+
+    def load(self, project_id: str, format_key: str) -> Optional[Dict[str, Any]]:
+        """The project's manifest, if it was written for the same format key"""
+        try:
+            manifest = json.loads((self.project_dir(project_id) / 'manifest.json').read_text())
+        except (OSError, ValueError):
+            return None
+        if manifest.get('version') != MANIFEST_VERSION or manifest.get('format_key') != format_key:
+            return None
+        return manifest
+
+    def cached_segments(self, project_id: str, manifest: Optional[Dict[str, Any]]) -> Dict[str, Path]:
+        """fingerprint -> cached segment file, for the files that still exist"""
+        if not manifest:
+            return {}
+        project_dir = self.project_dir(project_id)
+        files = {fp: project_dir / f"{fp}.mp4" for fp in manifest.get('segments', [])}
+        return {fp: path for fp, path in files.items() if path.is_file()}
+
+    def reference(self, manifest: Optional[Dict[str, Any]]) -> Optional[SegmentInfo]:
+        """The format every cached segment was conformed to"""
+        if not manifest or not manifest.get('reference'):
+            return None
+        ref = manifest['reference']
+        return SegmentInfo(-1, Path(), 0.0, ref['video'], ref.get('audio'))
+
+    def cached_output(self, project_id: str, manifest: Optional[Dict[str, Any]], output_key: str) -> Optional[Path]:
+        """The last combined video, if it was made from exactly these inputs"""
+        if not manifest or manifest.get('output_key') != output_key:
+            return None
+        output = self.project_dir(project_id) / 'output.mp4'
+        return output if output.is_file() else None
+
+    def store(self, project_id: str, format_key: str, reference: SegmentInfo,
+              segments: List[Tuple[Optional[str], Path]], output_key: Optional[str] = None, output: Optional[Path] = None):
+        """
+        Replace the project's artifacts. segments: (fingerprint, file) in
+        order; segments without a fingerprint are not cached.
+        """
+        project_dir = self.project_dir(project_id)
+        project_dir.mkdir(parents=True, exist_ok=True)
+
+        fingerprints = []
+        for fingerprint, path in segments:
+            if not fingerprint:
+                continue
+            target = project_dir / f"{fingerprint}.mp4"
+            if path.resolve() != target.resolve():
+                link_or_copy(path, target)
+            fingerprints.append(fingerprint)
+
+        if output is not None and output_key:
+            output_target = project_dir / 'output.mp4'
+            if output.resolve() != output_target.resolve():
+                link_or_copy(output, output_target)
+        else:
+            output_key = None
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'format_key': format_key,
+            'reference': {'video': reference.video, 'audio': reference.audio},
+            'segments': fingerprints,
+            'output_key': output_key,
+            'updated_at': time.time()
+        }
+        tmp = project_dir / 'manifest.json.tmp'
+        tmp.write_text(json.dumps(manifest))
+        tmp.replace(project_dir / 'manifest.json')
+
+        # Segments no longer part of the project
+        keep = {f"{fp}.mp4" for fp in fingerprints} | {'manifest.json', 'output.mp4'}
+        for path in project_dir.iterdir():
+            if path.name not in keep:
+                path.unlink(missing_ok=True)
+
+        self.evict_stale()
+
+    def touch(self, project_id: str):
+        """Mark the project's artifacts as used (eviction is by last use)"""
+        try:
+            (self.project_dir(project_id) / 'manifest.json').touch()
+        except OSError:
+            pass
+
+    def evict_stale(self):
+        """Drop projects that were not combined for COMBINE_CACHE_MAX_AGE"""
+        cutoff = time.time() - COMBINE_CACHE_MAX_AGE
+        try:
+            project_dirs = list(self.root.iterdir())
+        except OSError:
+            return
+        for project_dir in project_dirs:
+            manifest = project_dir / 'manifest.json'
+            try:
+                stale = manifest.stat().st_mtime < cutoff
+            except OSError:
+                stale = True
+            lock = self.locks.get(project_dir.name)
+            if stale and project_dir.is_dir() and not (lock and lock.locked()):
+                shutil.rmtree(project_dir, ignore_errors=True)
+                logger.info(f"[CACHE] Evicted {project_dir.name}")
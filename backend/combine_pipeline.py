@@ -0,0 +1,213 @@
+"""
+Sparkfluence Streaming Combine Pipeline
+Overlaps download, concat and upload of a combine job.
+
+The staged pipeline (main.process_video_combination) downloads every
+segment, concatenates, mixes BGM and only then uploads, so the network and
+the CPU take turns being idle. In streaming mode:
+
+1. all segments download concurrently; each one is probed, re-encoded to
+   the reference if it doesn't match, and remuxed to MPEG-TS with its
+   timestamps offset by the duration before it, as soon as it arrives
+2. the TS segments are written, in order, to the stdin of a single ffmpeg
+   process as soon as each is ready
+3. that ffmpeg writes fragmented MP4 (moov first, then moof/mdat pairs) to
+   stdout, which is teed to a local file and streamed into the upload
+   while encoding continues
+
+End-to-end latency approaches the slowest stage instead of the sum of all
+stages (see bench_combine.py). The reference for the stream-copy check is segment 0 (or the
+normalization target): the full-duration majority vote of the preflight
+would need every segment first.
+"""
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+from video_segments import (
+    ENCODE_PRESET, SegmentInfo, conform_segment, probe_segment, resolve_target, run_command, thread_budget
+)
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+OUTPUT_QUEUE_CHUNKS = 64  # output chunks buffered between ffmpeg and a slow upload
+
+# Fragmented MP4: playable while it is still being written, no seek back to patch the moov
+FRAGMENTED_MP4_FLAGS = 'frag_keyframe+empty_moov+default_base_moof'
+
+
+def prepare_segments(downloads: List[Awaitable[Path]], work_dir: Path, resolution: Optional[str] = None,
+                     aspect_ratio: str = '9:16', fps: Optional[int] = None,
+                     preset: str = ENCODE_PRESET) -> List["asyncio.Task[SegmentInfo]"]:
+    """
+    One task per segment: wait for its download, probe it, re-encode it if it
+    doesn't match the reference and remux it to MPEG-TS at its offset in the
+    output. Tasks finish in any order (the returned infos point at the .ts
+    files); await them in order.
+    """
+    loop = asyncio.get_running_loop()
+    reference: asyncio.Future = loop.create_future()
+    # offsets[i]: start of segment i in the output, known once segments 0..i-1 are probed
+    offsets = [loop.create_future() for _ in downloads]
+    if offsets:
+        offsets[0].set_result(0.0)
+    concurrency, threads = thread_budget(len(downloads))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def fail(future: asyncio.Future, error: BaseException):
+        if not future.done():
+            future.set_exception(error if isinstance(error, Exception) else Exception("Segment cancelled"))
+
+    async def prepare(index: int, download: Awaitable[Path]) -> SegmentInfo:
+        following = offsets[index + 1] if index + 1 < len(offsets) else None
+        try:
+            info = await probe_segment(index, await download)
+            offset = await offsets[index]
+        except BaseException as e:
+            if index == 0:
+                fail(reference, e)
+            if following:
+                fail(following, e)
+            raise
+        if following:
+            following.set_result(offset + info.duration)
+        if index == 0:
+            reference.set_result(resolve_target(info, resolution, aspect_ratio, fps))
+
+        target = await reference
+        if info.signature != target.signature:
+            async with semaphore:
+                path = await conform_segment(info, target, work_dir, threads, preset)
+            info = SegmentInfo(info.index, path, info.duration, target.video, target.audio)
+        ts_file = await remux_to_ts(info, offset, work_dir)
+        return SegmentInfo(info.index, ts_file, info.duration, info.video, info.audio)
+
+    tasks = [asyncio.create_task(prepare(i, d)) for i, d in enumerate(downloads)]
+    # Failures are reported by the segment tasks themselves; don't warn about the futures
+    for future in (reference, *offsets):
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return tasks
+
+
+def output_command(bgm_file: Optional[Path], bgm_volume: float) -> List[str]:
+    """ffmpeg reading concatenated MPEG-TS on stdin and writing fragmented MP4 to stdout"""
+    cmd = ['ffmpeg', '-y', '-f', 'mpegts', '-i', 'pipe:0']
+    if bgm_file:
+        cmd += [
+            '-i', str(bgm_file),
+            '-filter_complex', f'[1:a]volume={bgm_volume}[a1];[0:a][a1]amix=inputs=2:duration=first:normalize=1[a]',
+            '-map', '0:v', '-map', '[a]',
+            '-c:v', 'copy', '-c:a', 'aac'
+        ]
+    else:
+        cmd += ['-map', '0', '-c', 'copy', '-bsf:a', 'aac_adtstoasc']
+    cmd += ['-movflags', FRAGMENTED_MP4_FLAGS, '-f', 'mp4', 'pipe:1']
+    return cmd
+
+
+async def remux_to_ts(info: SegmentInfo, offset: float, work_dir: Path) -> Path:
+    """Copy a segment into MPEG-TS with timestamps starting at `offset` seconds"""
+    output = work_dir / f"segment_{info.index}.ts"
+    returncode, _, stderr = await run_command([
+        'ffmpeg', '-y', '-i', str(info.path), '-c', 'copy',
+        '-output_ts_offset', f"{offset:.6f}", '-f', 'mpegts', str(output)
+    ])
+    if returncode != 0:
+        raise Exception(f"FFmpeg remux of segment {info.index} failed: {stderr[-500:]}")
+    return output
+
+
+async def feed_segments(prepared: List["asyncio.Task[SegmentInfo]"], process: asyncio.subprocess.Process,
+                        on_segment: Optional[Callable[[int], None]] = None):
+    """Write the remuxed segments, in order, into ffmpeg's stdin as soon as each is ready"""
+    try:
+        for task in prepared:
+            info = await task
+            with open(info.path, 'rb') as f:
+                while True:
+                    chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            info.path.unlink(missing_ok=True)
+            if on_segment:
+                on_segment(info.index)
+    except BaseException:
+        # Closing stdin would let ffmpeg finish a truncated video: kill it instead
+        if process.returncode is None:
+            process.kill()
+        raise
+    process.stdin.close()
+
+
+async def stream_combine(
+    prepared: List["asyncio.Task[SegmentInfo]"],
+    work_dir: Path,
+    upload: Callable[[AsyncIterator[bytes]], Awaitable[str]],
+    bgm_file: Optional[Path] = None,
+    bgm_volume: float = 0.15,
+    on_segment: Optional[Callable[[int], None]] = None
+) -> Tuple[str, Path]:
+    """
+    Run the output ffmpeg fed by `prepared` and stream its output into
+    upload(chunks). The chunk iterator raises instead of ending when ffmpeg
+    fails, so an upload never completes with a truncated video.
+    Returns (upload result, local copy of the output).
+    """
+    output_file = work_dir / "final_video.mp4"
+    stderr_file = work_dir / "ffmpeg_stream.log"
+    queue: asyncio.Queue = asyncio.Queue(maxsize=OUTPUT_QUEUE_CHUNKS)
+
+    with open(stderr_file, 'wb') as stderr:
+        process = await asyncio.create_subprocess_exec(
+            *output_command(bgm_file, bgm_volume),
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=stderr
+        )
+
+    async def read_output():
+        """Tee ffmpeg's stdout to the local file and the upload queue"""
+        with open(output_file, 'wb') as f:
+            while True:
+                chunk = await process.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                await asyncio.to_thread(f.write, chunk)
+                await queue.put(chunk)
+        if await process.wait() != 0:
+            error = Exception(f"FFmpeg streaming concat failed: {stderr_file.read_text(errors='replace')[-500:]}")
+            await queue.put(error)
+            raise error
+        await queue.put(None)
+
+    async def chunks() -> AsyncIterator[bytes]:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    tasks = [
+        asyncio.create_task(feed_segments(prepared, process, on_segment)),
+        asyncio.create_task(read_output()),
+        asyncio.create_task(upload(chunks()))
+    ]
+    try:
+        *_, result = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in (*tasks, *prepared):
+            if task.done() and not task.cancelled():
+                task.exception()  # retrieved: the first failure is re-raised below
+            task.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+    logger.info("Streaming combine successful")
+    return result, output_file
@@ -0,0 +1,242 @@
+"""
+Sparkfluence Edge Function Resilience
+Circuit breakers, adaptive timeouts and hedged requests around Supabase
+Edge Function calls (job_worker.SupabaseClient.invoke_function).
+
+- circuit breaker per function: after EDGE_BREAKER_FAILURES consecutive
+  failures (timeouts, connection errors, 5xx) calls fail fast with
+  CircuitOpenError for EDGE_BREAKER_COOLDOWN seconds, then a single trial
+  call (half-open) decides whether the circuit closes again. Workers leave
+  their jobs queued meanwhile instead of spending retries on them
+- adaptive timeout, for idempotent calls only: once a function has
+  EDGE_MIN_SAMPLES recent latencies its timeout is EDGE_TIMEOUT_FACTOR x
+  p99, clamped to [EDGE_MIN_TIMEOUT, EDGE_MAX_TIMEOUT]; until then
+  EDGE_MAX_TIMEOUT. A timed-out call counts as a sample at the timeout, so
+  the timeout widens again when the function slows down. Non-idempotent
+  calls (generate-images / generate-videos) keep the flat EDGE_MAX_TIMEOUT:
+  cutting one off early doesn't stop the provider, and the retry would pay
+  for the generation twice
+- hedging, for idempotent calls only (check-video-status): when the first
+  request hasn't answered after the function's p95, a second one is sent
+  and whichever answers first wins. Hedges are capped at EDGE_HEDGE_RATIO
+  of the function's calls so a slow function doesn't get double load
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger('EdgeResilience')
+
+EDGE_MAX_TIMEOUT = float(os.getenv('EDGE_MAX_TIMEOUT', '120'))  # seconds, also the timeout before enough samples
+EDGE_MIN_TIMEOUT = float(os.getenv('EDGE_MIN_TIMEOUT', '10'))
+EDGE_TIMEOUT_FACTOR = 2.0  # timeout = factor x p99
+EDGE_LATENCY_SAMPLES = 100  # recent latencies kept per function
+EDGE_MIN_SAMPLES = 20  # before this many, no adaptive timeout and no hedging
+EDGE_BREAKER_FAILURES = int(os.getenv('EDGE_BREAKER_FAILURES', '5'))  # consecutive failures that open the circuit
+EDGE_BREAKER_COOLDOWN = float(os.getenv('EDGE_BREAKER_COOLDOWN', '60'))  # seconds open before a trial call
+EDGE_HEDGE_RATIO = 0.1  # max share of calls that get a hedge
+
+
+class CircuitOpenError(Exception):
+    """The function's circuit is open: the call was not made."""
+
+    def __init__(self, function: str, retry_after: float):
+        super().__init__(f"Circuit open for {function}, retry in {retry_after:.0f}s")
+        self.function = function
+        self.retry_after = retry_after
+
+
+class EdgeFunctionTimeout(Exception):
+    """The function did not answer within its (adaptive) timeout."""
+
+
+def is_failure(error: BaseException) -> bool:
+    """Errors that say the function is unhealthy (not the request: 4xx are the caller's problem)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (EdgeFunctionTimeout, httpx.TransportError))
+
+
+class CircuitBreaker:
+    """closed -> open after consecutive failures -> half-open (one trial call) after the cooldown"""
+
+    def __init__(self, failures: Optional[int] = None, cooldown: Optional[float] = None):
+        self.threshold = failures or EDGE_BREAKER_FAILURES
+        self.cooldown = cooldown or EDGE_BREAKER_COOLDOWN
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+
+    def available(self) -> bool:
+        """Whether a call would be let through (without taking the half-open trial)"""
+        if self.state == 'open':
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not (self.state == 'half_open' and self.trial_running)
+
+    def allow(self) -> bool:
+        """Let a call through? In half-open state only the first caller gets the trial"""
+        if self.state == 'open':
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = 'half_open'
+            self.trial_running = False
+        if self.state == 'half_open':
+            if self.trial_running:
+                return False
+            self.trial_running = True
+        return True
+
+    def retry_after(self) -> float:
+        return max(self.cooldown - (time.monotonic() - self.opened_at), 0.0)
+
+    def success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.trial_running = False
+
+    def failure(self) -> bool:
+        """Record a failure; True when this opened the circuit"""
+        self.failures += 1
+        self.trial_running = False
+        if self.state == 'half_open' or self.failures >= self.threshold:
+            opened = self.state != 'open'
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            return opened
+        return False
+
+
+class EdgeFunction:
+    """Latency history, breaker and hedge budget of one function"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker()
+        self.latencies: Deque[float] = deque(maxlen=EDGE_LATENCY_SAMPLES)
+        self.calls = 0
+        self.hedges = 0
+        self.adaptive = False  # adaptive timeout (idempotent calls); flat EDGE_MAX_TIMEOUT otherwise
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < EDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def timeout(self) -> float:
+        p99 = self.percentile(0.99) if self.adaptive else None
+        if p99 is None:
+            return EDGE_MAX_TIMEOUT
+        return min(max(p99 * EDGE_TIMEOUT_FACTOR, EDGE_MIN_TIMEOUT), EDGE_MAX_TIMEOUT)
+
+    def hedge_delay(self) -> Optional[float]:
+        """p95 latency, when a hedge is allowed for the next call"""
+        if self.hedges >= EDGE_HEDGE_RATIO * self.calls:
+            return None
+        return self.percentile(0.95)
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "p50_seconds": round(p50, 2) if p50 is not None else None,
+            "p95_seconds": round(p95, 2) if p95 is not None else None,
+            "timeout_seconds": round(self.timeout(), 1),
+            "calls": self.calls,
+            "hedges": self.hedges
+        }
+
+
+class EdgeResilience:
+    """Guards every Edge Function call of one client"""
+
+    def __init__(self):
+        self.functions: Dict[str, EdgeFunction] = {}
+
+    def function(self, name: str) -> EdgeFunction:
+        if name not in self.functions:
+            self.functions[name] = EdgeFunction(name)
+        return self.functions[name]
+
+    def available(self, name: str) -> bool:
+        """False while the function's circuit is open (callers can skip work that needs it)"""
+        return self.function(name).breaker.available()
+
+    async def call(self, name: str, send: Callable[[float], Awaitable[Any]], idempotent: bool = False) -> Any:
+        """
+        send(timeout) makes one request. Raises CircuitOpenError without
+        calling when the circuit is open, EdgeFunctionTimeout when the
+        function doesn't answer in time, or whatever send raised.
+        """
+        fn = self.function(name)
+        if not fn.breaker.allow():
+            raise CircuitOpenError(name, fn.breaker.retry_after())
+
+        fn.calls += 1
+        fn.adaptive = idempotent
+        timeout = fn.timeout()
+        hedge_delay = fn.hedge_delay() if idempotent else None
+        start = time.monotonic()
+        try:
+            if hedge_delay is not None:
+                result = await self._hedged(fn, send, timeout, hedge_delay)
+            else:
+                result = await self._attempt(name, send, timeout)
+        except Exception as e:
+            if isinstance(e, EdgeFunctionTimeout):
+                fn.latencies.append(timeout)  # at least this slow: keeps the timeout from only learning fast calls
+            if is_failure(e):
+                if fn.breaker.failure():
+                    logger.warning(f"[EDGE] Circuit opened for {name} after {fn.breaker.failures} failures: {e}")
+            else:
+                fn.breaker.success()  # it answered
+            raise
+        except BaseException:
+            fn.breaker.trial_running = False  # cancelled: neither outcome
+            raise
+
+        fn.breaker.success()
+        fn.latencies.append(time.monotonic() - start)
+        return result
+
+    @staticmethod
+    async def _attempt(name: str, send: Callable[[float], Awaitable[Any]], timeout: float) -> Any:
+        try:
+            return await asyncio.wait_for(send(timeout), timeout)
+        except asyncio.TimeoutError:
+            raise EdgeFunctionTimeout(f"{name} timed out after {timeout:.1f}s")
+
+    async def _hedged(self, fn: EdgeFunction, send: Callable[[float], Awaitable[Any]],
+                      timeout: float, delay: float) -> Any:
+        """First request, plus a second one if the first is slower than `delay`; first answer wins"""
+        first = asyncio.create_task(self._attempt(fn.name, send, timeout))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        fn.hedges += 1
+        logger.info(f"[EDGE] Hedging {fn.name} after {delay:.1f}s")
+        pending = {first, asyncio.create_task(self._attempt(fn.name, send, timeout))}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: fn.stats() for name, fn in self.functions.items()}
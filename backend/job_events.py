@@ -0,0 +1,327 @@
+"""
+Sparkfluence Job Event Stream
+Pushes job progress to clients over Server-Sent Events instead of polling.
+
+Topics:
+    combine:{job_id}        in-memory combine jobs (main.jobs)
+    images:{session_id}     image_generation_jobs of a session
+    videos:{session_id}     video_generation_jobs of a session
+
+Every topic keeps the last known state of its jobs and a ring buffer of
+recent events. Changes are published as deltas (only the fields that
+changed) and fanned out in-process to every connected client:
+
+- combine jobs publish from update_job_status / process_video_combination
+- the background worker publishes every job update it makes (update
+  listener), which is what keeps sessions live
+- a slow safety poll per watched session (not per client), every
+  JOB_EVENTS_POLL_INTERVAL seconds, picks up changes made elsewhere, e.g.
+  Edge Functions updating the DB or a worker in another process
+
+The broker is per process: with uvicorn --workers N every process keeps its
+own topics and polls the sessions its clients watch. Worker events only
+reach clients connected to the process running the worker (the elected
+leader with WORKER_MODE=embedded); elsewhere, and with
+WORKER_MODE=standalone, sessions update at the safety poll's pace.
+
+Browsers' EventSource can't send headers, so instead of the API key in the
+URL (which ends up in access logs) clients fetch a short-lived stream token
+bound to the topic (issue_stream_token) and pass it as ?token=.
+
+Event ids are "<epoch>-<seq>"; a client reconnecting with Last-Event-ID
+gets the events it missed, or a fresh snapshot when they are no longer
+buffered (or the server restarted). A comment heartbeat keeps idle
+connections open through proxies.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger('JobEvents')
+
+# Stream settings
+HEARTBEAT_INTERVAL = 15  # seconds between keep-alive comments
+RECONNECT_DELAY_MS = 2000  # client retry hint
+EVENT_BUFFER_SIZE = 200  # events kept per topic for Last-Event-ID resume
+SUBSCRIBER_QUEUE_SIZE = 100  # undelivered events per client before it is resynced
+SESSION_POLL_INTERVAL = float(os.getenv('JOB_EVENTS_POLL_INTERVAL', '10'))  # safety poll per session (worker events are pushed)
+TOPIC_IDLE_TTL = 60  # seconds a topic (and its resume buffer) outlives its last client
+SNAPSHOT_TIMEOUT = 10  # seconds to wait for the first upstream fetch
+STREAM_TOKEN_TTL = int(os.getenv('STREAM_TOKEN_TTL', '300'))  # seconds a stream token can open a stream
+
+# Job tables and the topic prefix of their sessions
+SESSION_TABLES = {
+    'image_generation_jobs': 'images',
+    'video_generation_jobs': 'videos'
+}
+
+# Columns that change on every write and are not progress
+IGNORED_FIELDS = {'updated_at'}
+
+RESYNC = object()  # queued when a client fell too far behind
+
+
+def summarize_jobs(jobs: List[Dict]) -> Dict[str, Any]:
+    """Status counts of a session's jobs, same shape as GET /api/jobs/{job_type}/{session_id}"""
+    pending = sum(1 for j in jobs if j.get('status') == 0)
+    processing = sum(1 for j in jobs if j.get('status') == 1)
+    return {
+        "summary": {
+            "total": len(jobs),
+            "pending": pending,
+            "processing": processing,
+            "completed": sum(1 for j in jobs if j.get('status') == 2),
+            "failed": sum(1 for j in jobs if j.get('status') == 3)
+        },
+        "all_complete": pending == 0 and processing == 0
+    }
+
+
+def issue_stream_token(secret: str, topic: str, ttl: int = STREAM_TOKEN_TTL) -> str:
+    """Token opening `topic` until now + ttl: "<expires>.<hmac-sha256(secret, topic:expires)>"""
+    expires = int(time.time()) + ttl
+    signature = hmac.new(secret.encode(), f"{topic}:{expires}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def verify_stream_token(secret: str, topic: str, token: str) -> bool:
+    """Whether `token` was issued for `topic` and has not expired"""
+    expires, _, signature = token.partition('.')
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = hmac.new(secret.encode(), f"{topic}:{expires}".encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected)
+
+
+def format_event(event_id: Optional[str], event: str, data: Any) -> str:
+    """One SSE message"""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class Topic:
+    """State, resume buffer and subscribers of one combine job or session"""
+
+    def __init__(self, name: str, key: str):
+        self.name = name
+        self.key = key  # field identifying a job in published rows
+        self.seq = 0
+        self.buffer: Deque[Tuple[int, str, Any]] = deque(maxlen=EVENT_BUFFER_SIZE)
+        self.state: Dict[str, Dict] = {}
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.ready = asyncio.Event()
+        self.wake = asyncio.Event()  # set when a client joins: poll now instead of after the interval
+        self.watcher: Optional[asyncio.Task] = None
+        self.idle_since: Optional[float] = None
+
+    @property
+    def is_session(self) -> bool:
+        return not self.name.startswith('combine:')
+
+    def snapshot(self) -> Dict[str, Any]:
+        jobs = sorted(self.state.values(), key=lambda j: (j.get('segment_number') or 0, str(j.get(self.key))))
+        if not self.is_session:
+            return jobs[0] if jobs else {}
+        return {"jobs": jobs, **summarize_jobs(jobs)}
+
+
+class JobEventBroker:
+    """In-process fan-out of job progress events"""
+
+    def __init__(self, fetch_session_jobs: Optional[Callable[[str, str], Awaitable[List[Dict]]]] = None):
+        """fetch_session_jobs(job_type, session_id) reads a session's jobs from the database"""
+        self.fetch_session_jobs = fetch_session_jobs
+        self.epoch = uuid.uuid4().hex[:8]
+        self.topics: Dict[str, Topic] = {}
+
+    # ---------- publishing ----------
+
+    def publish(self, name: str, event: str, data: Any):
+        """Append an event to a topic and hand it to every subscriber (no-op if nobody watches)"""
+        topic = self.topics.get(name)
+        if topic is None:
+            return
+        topic.seq += 1
+        item = (topic.seq, event, data)
+        topic.buffer.append(item)
+        for queue in list(topic.subscribers):
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and let it resync from a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+    def update_jobs(self, name: str, rows: List[Dict]):
+        """Merge job rows into a topic's state and publish what changed"""
+        topic = self.topics.get(name)
+        if topic is None:
+            return
+
+        changed_any = False
+        for row in rows:
+            job_id = str(row.get(topic.key))
+            previous = topic.state.get(job_id)
+            delta = {
+                k: v for k, v in row.items()
+                if k not in IGNORED_FIELDS and (previous is None or previous.get(k) != v)
+            }
+            if not delta:
+                continue
+            topic.state[job_id] = {**(previous or {}), **row}
+            delta[topic.key] = row.get(topic.key)
+            self.publish(name, 'job', delta)
+            changed_any = True
+
+        if not changed_any:
+            return
+        if topic.is_session:
+            summary = summarize_jobs(list(topic.state.values()))
+            self.publish(name, 'summary', summary)
+            if summary['all_complete']:
+                self.publish(name, 'complete', summary)
+        else:
+            job = next(iter(topic.state.values()))
+            if job.get('status') in ('completed', 'failed'):
+                self.publish(name, 'complete', job)
+
+    def publish_combine_job(self, job: Dict):
+        """Publish the current state of an in-memory combine job"""
+        self.update_jobs(f"combine:{job['job_id']}", [dict(job)])
+
+    def publish_row(self, table: str, row: Dict):
+        """Publish a job row written by the worker (SupabaseClient update listener)"""
+        prefix = SESSION_TABLES.get(table)
+        if prefix and row and row.get('session_id'):
+            self.update_jobs(f"{prefix}:{row['session_id']}", [row])
+
+    # ---------- subscribing ----------
+
+    def _topic(self, name: str, key: str) -> Topic:
+        topic = self.topics.get(name)
+        if topic is None:
+            topic = self.topics[name] = Topic(name, key)
+        return topic
+
+    def _replay(self, topic: Topic, last_event_id: Optional[str]) -> Optional[List[Tuple[int, str, Any]]]:
+        """Buffered events after last_event_id, or None when a snapshot is needed"""
+        if not last_event_id:
+            return None
+        epoch, _, seq = last_event_id.partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > topic.seq:
+            return None
+        missed = [item for item in topic.buffer if item[0] > seq]
+        oldest = topic.buffer[0][0] if topic.buffer else topic.seq + 1
+        if seq + 1 < oldest and topic.seq > seq:
+            return None  # the gap is no longer buffered
+        return missed
+
+    def _event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    async def _watch_session(self, topic: Topic, job_type: str, session_id: str):
+        """Snapshot and safety poll of a session, shared by all of its clients"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if topic.subscribers:
+                topic.idle_since = None
+                try:
+                    rows = await self.fetch_session_jobs(job_type, session_id)
+                    self.update_jobs(topic.name, rows)
+                except Exception as e:
+                    logger.warning(f"[EVENTS] Poll of {topic.name} failed: {e}")
+                topic.ready.set()
+            else:
+                topic.idle_since = topic.idle_since or loop.time()
+                if loop.time() - topic.idle_since > TOPIC_IDLE_TTL:
+                    self.topics.pop(topic.name, None)
+                    return
+            topic.wake.clear()
+            try:
+                await asyncio.wait_for(topic.wake.wait(), SESSION_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _expire_when_idle(self, topic: Topic):
+        """Drop a combine topic once no client has watched it for TOPIC_IDLE_TTL"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(TOPIC_IDLE_TTL / 4)
+            if topic.subscribers:
+                topic.idle_since = None
+                continue
+            topic.idle_since = topic.idle_since or loop.time()
+            if loop.time() - topic.idle_since > TOPIC_IDLE_TTL:
+                self.topics.pop(topic.name, None)
+                return
+
+    def watch_combine_job(self, job: Dict) -> Topic:
+        topic = self._topic(f"combine:{job['job_id']}", 'job_id')
+        if topic.watcher is None:
+            topic.state.setdefault(job['job_id'], dict(job))
+            topic.ready.set()
+            topic.watcher = asyncio.create_task(self._expire_when_idle(topic))
+        return topic
+
+    def watch_session(self, job_type: str, session_id: str) -> Topic:
+        topic = self._topic(f"{job_type}:{session_id}", 'id')
+        if topic.watcher is None:
+            topic.watcher = asyncio.create_task(self._watch_session(topic, job_type, session_id))
+        return topic
+
+    async def stream(self, topic: Topic, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """SSE messages for one client: replay or snapshot, then live deltas and heartbeats"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        topic.subscribers.add(queue)
+        if not topic.ready.is_set():
+            topic.wake.set()  # first client: fetch the snapshot right away
+        try:
+            yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+            try:
+                await asyncio.wait_for(topic.ready.wait(), SNAPSHOT_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+
+            sent = topic.seq
+            replay = self._replay(topic, last_event_id)
+            if replay is None:
+                yield format_event(self._event_id(sent), 'snapshot', topic.snapshot())
+            else:
+                for seq, event, data in replay:
+                    yield format_event(self._event_id(seq), event, data)
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                if item is RESYNC:
+                    sent = topic.seq
+                    yield format_event(self._event_id(sent), 'snapshot', topic.snapshot())
+                    continue
+
+                seq, event, data = item
+                if seq <= sent:
+                    continue  # already covered by the snapshot / replay
+                sent = seq
+                yield format_event(self._event_id(seq), event, data)
+        finally:
+            topic.subscribers.discard(queue)
@@ -5,14 +5,20 @@ Runs as a separate process alongside the FastAPI server.
 """
 
 import asyncio
+import hashlib
 import logging
 import os
+import socket
+import time
+import unicodedata
 import httpx
-from datetime import datetime, timezone
-from typing import Optional, Dict, Any, List
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Callable, Tuple
 from dotenv import load_dotenv
 import json
 
+from edge_resilience import CircuitOpenError, EdgeResilience
+
 # Load environment variables
 load_dotenv()
 
@@ -42,6 +48,58 @@ RATE_LIMIT_DELAY = 60  # seconds to wait after rate limit
 IMAGE_PROCESS_DELAY = 5  # seconds between image jobs
 VIDEO_PROCESS_DELAY = 10  # seconds between video jobs
 
+# Where the BackgroundWorker runs:
+#   embedded    inside the API (main.py); with several API processes only the
+#               elected leader runs it (WorkerLeadership)
+#   standalone  as its own process(es): python job_worker.py; the API runs none
+#   disabled    nowhere (e.g. API-only deployments)
+WORKER_MODE = os.getenv('WORKER_MODE', 'embedded')
+WORKER_MODES = ('embedded', 'standalone', 'disabled')
+LEADER_LEASE_SECONDS = int(os.getenv('LEADER_LEASE_SECONDS', '30'))
+LEADER_RENEW_INTERVAL = 10  # seconds; standbys retry at the same pace
+
+# Job leases: a claimed job belongs to this worker until its lease expires
+WORKER_ID = os.getenv('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))
+VEO_LEASE_SECONDS = int(os.getenv('VEO_LEASE_SECONDS', '1800'))  # submitted VEO render, not renewed
+LEASE_HEARTBEAT_INTERVAL = int(os.getenv('LEASE_HEARTBEAT_INTERVAL', '60'))  # seconds
+LEASE_REAP_INTERVAL = int(os.getenv('LEASE_REAP_INTERVAL', '60'))  # seconds between reclaims of expired leases
+LEASE_ORPHAN_AFTER = int(os.getenv('LEASE_ORPHAN_AFTER', '3600'))  # processing rows without a lease
+
+# Archival: finished jobs move to the *_archive tables (keeps queue tables small)
+JOB_ARCHIVE_AFTER_DAYS = int(os.getenv('JOB_ARCHIVE_AFTER_DAYS', '90'))  # 0 = never
+JOB_ARCHIVE_INTERVAL = int(os.getenv('JOB_ARCHIVE_INTERVAL', '3600'))  # seconds between runs
+JOB_ARCHIVE_BATCH_SIZE = 5000  # rows per table per statement
+JOB_ARCHIVE_MAX_BATCHES = 20  # per run, so a backlog doesn't stall the cycle
+
+# Image dedupe: a job whose fingerprint was generated within the TTL reuses that image (0 = off)
+IMAGE_DEDUPE_TTL = int(os.getenv('IMAGE_DEDUPE_TTL', '86400'))  # seconds
+IMAGE_DEDUPE_MAX_ENTRIES = 1000  # in-memory results kept
+
+# Inputs that determine the generated image
+IMAGE_FINGERPRINT_FIELDS = (
+    'visual_prompt', 'segment_type', 'style', 'aspect_ratio', 'provider',
+    'character_ref_png', 'character_description', 'shot_type', 'emotion'
+)
+# Column defaults, so a job row and the dict it was inserted from hash alike
+IMAGE_FINGERPRINT_DEFAULTS = {'style': 'cinematic', 'aspect_ratio': '9:16', 'shot_type': 'B-ROLL'}
+# Free text keeps its case; enum-like fields don't
+IMAGE_FINGERPRINT_CASED = {'visual_prompt', 'character_description', 'character_ref_png'}
+
+
+def image_request_fingerprint(job: Dict) -> str:
+    """Hash of an image job's normalized generation inputs (unicode form, whitespace, case of enum fields)."""
+    parts = []
+    for field in IMAGE_FINGERPRINT_FIELDS:
+        value = job.get(field)
+        if value is None:
+            value = IMAGE_FINGERPRINT_DEFAULTS.get(field, '')
+        value = ' '.join(unicodedata.normalize('NFKC', str(value)).split())
+        if field not in IMAGE_FINGERPRINT_CASED:
+            value = value.lower()
+        parts.append(value)
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
 
 class SupabaseClient:
     """Simple Supabase client for database operations."""
@@ -55,6 +113,12 @@ class SupabaseClient:
             'Content-Type': 'application/json',
             'Prefer': 'return=representation'
         }
+        self.update_listeners: List[Callable[[str, Dict], None]] = []
+        self.edge = EdgeResilience()
+    
+    def add_update_listener(self, listener: Callable[[str, Dict], None]):
+        """Call listener(table, row) with every row this client updates (e.g. to push progress events)."""
+        self.update_listeners.append(listener)
     
     async def select(self, table: str, filters: Dict = None, order: str = None, limit: int = None) -> List[Dict]:
         """Select records from table."""
@@ -76,6 +140,14 @@ class SupabaseClient:
             response.raise_for_status()
             return response.json()
     
+    async def select_where(self, table: str, params: Dict[str, str]) -> List[Dict]:
+        """Select records with raw PostgREST query params (e.g. {'status': 'in.(0,1)', 'order': 'id'})."""
+        async with httpx.AsyncClient() as client:
+            url = f"{self.url}/rest/v1/{table}"
+            response = await client.get(url, headers=self.headers, params=params)
+            response.raise_for_status()
+            return response.json()
+    
     async def select_pending(self, table: str, limit: int = 1) -> List[Dict]:
         """Select pending jobs (status=0) ordered by segment_number.
         Prioritizes completing one session before moving to another."""
@@ -87,6 +159,7 @@ class SupabaseClient:
             processing_url = f"{self.url}/rest/v1/{table}"
             processing_params = {
                 'status': 'eq.1',  # PROCESSING
+                'lease_expires_at': f'gt.{datetime.now(timezone.utc).isoformat()}',  # not a crashed worker's job
                 'limit': '1',
                 'select': 'session_id'
             }
@@ -118,9 +191,13 @@ class SupabaseClient:
     
     async def update(self, table: str, id: str, data: Dict) -> Dict:
         """Update a record by ID."""
+        rows = await self.update_where(table, {'id': f'eq.{id}'}, data)
+        return rows[0] if rows else {}
+    
+    async def update_where(self, table: str, params: Dict[str, str], data: Dict) -> List[Dict]:
+        """Update every record matching raw PostgREST filters. Returns the updated rows."""
         async with httpx.AsyncClient() as client:
             url = f"{self.url}/rest/v1/{table}"
-            params = {'id': f'eq.{id}'}
             
             response = await client.patch(
                 url, 
@@ -129,21 +206,121 @@ class SupabaseClient:
                 json=data
             )
             response.raise_for_status()
-            result = response.json()
-            return result[0] if result else {}
-    
-    async def invoke_function(self, function_name: str, body: Dict) -> Dict:
-        """Invoke a Supabase Edge Function."""
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            url = f"{self.url}/functions/v1/{function_name}"
-            headers = {
-                'Authorization': f'Bearer {self.key}',
-                'Content-Type': 'application/json'
-            }
-            
-            response = await client.post(url, headers=headers, json=body)
+            rows = response.json()
+        
+        for row in rows:
+            for listener in self.update_listeners:
+                try:
+                    listener(table, row)
+                except Exception as e:
+                    logger.warning(f"Update listener failed: {e}")
+        return rows
+    
+    async def rpc(self, function_name: str, params: Dict = None) -> Any:
+        """Call a Postgres function through PostgREST."""
+        async with httpx.AsyncClient() as client:
+            url = f"{self.url}/rest/v1/rpc/{function_name}"
+            response = await client.post(url, headers=self.headers, json=params or {})
             response.raise_for_status()
             return response.json()
+    
+    async def invoke_function(self, function_name: str, body: Dict, idempotent: bool = False) -> Dict:
+        """Invoke a Supabase Edge Function (circuit breaker; adaptive timeout and hedging if idempotent)."""
+        async def send(timeout: float) -> Dict:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                url = f"{self.url}/functions/v1/{function_name}"
+                headers = {
+                    'Authorization': f'Bearer {self.key}',
+                    'Content-Type': 'application/json'
+                }
+                
+                response = await client.post(url, headers=headers, json=body)
+                response.raise_for_status()
+                return response.json()
+        
+        return await self.edge.call(function_name, send, idempotent)
+
+
+class JobLeases:
+    """Claims, heartbeats and reclaiming of job leases (worker_id + lease_expires_at)."""
+    
+    def __init__(self, db: SupabaseClient, worker_id: str = WORKER_ID):
+        self.db = db
+        self.worker_id = worker_id
+    
+    def lease(self, seconds: int = JOB_LEASE_SECONDS) -> Dict:
+        """Fields holding a job for this worker for `seconds`."""
+        expires = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+        return {'worker_id': self.worker_id, 'lease_expires_at': expires.isoformat()}
+    
+    @staticmethod
+    def released() -> Dict:
+        """Fields of a job nobody holds."""
+        return {'worker_id': None, 'lease_expires_at': None}
+    
+    async def claim(self, table: str, job_id: str, data: Dict = None) -> Optional[Dict]:
+        """Take a pending job (conditional on it still being pending). None if another worker got it first."""
+        rows = await self.db.update_where(table, {
+            'id': f'eq.{job_id}',
+            'status': f"eq.{JOB_STATUS['PENDING']}"
+        }, {**(data or {}), 'status': JOB_STATUS['PROCESSING'], **self.lease()})
+        return rows[0] if rows else None
+    
+    async def renew(self, table: str, ids: List[str], seconds: int = JOB_LEASE_SECONDS) -> int:
+        """Extend the leases this worker still holds on `ids`. Returns how many were extended."""
+        if not ids:
+            return 0
+        rows = await self.db.update_where(table, {
+            'id': f"in.({','.join(ids)})",
+            'worker_id': f'eq.{self.worker_id}',
+            'status': f"eq.{JOB_STATUS['PROCESSING']}"
+        }, {'lease_expires_at': self.lease(seconds)['lease_expires_at']})
+        return len(rows)
+    
+    def heartbeat(self, table: str, ids: List[str]) -> "asyncio.Task":
+        """Renew the leases on `ids` (the list may grow) until the task is cancelled."""
+        async def beat():
+            while True:
+                await asyncio.sleep(LEASE_HEARTBEAT_INTERVAL)
+                try:
+                    await self.renew(table, list(ids))
+                except Exception as e:
+                    logger.warning(f"[LEASE] Heartbeat for {ids} failed: {e}")
+        return asyncio.create_task(beat())
+    
+    async def reclaim_expired(self) -> List[Dict]:
+        """Return jobs with expired leases to pending (failed when out of retries), all tables at once."""
+        return await self.db.rpc('reclaim_expired_job_leases', {
+            'max_retries': MAX_RETRIES,
+            'orphan_after_seconds': LEASE_ORPHAN_AFTER
+        }) or []
+
+
+class GenerationResultCache:
+    """Recently generated images by request fingerprint (in-process, expires after IMAGE_DEDUPE_TTL)."""
+    
+    def __init__(self, ttl: int = IMAGE_DEDUPE_TTL, max_entries: int = IMAGE_DEDUPE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # fingerprint -> (expires, image_url, image_data, source job id)
+        self.entries: Dict[str, Tuple[float, str, Optional[Dict], str]] = {}
+    
+    def get(self, fingerprint: str) -> Optional[Tuple[str, Optional[Dict], str]]:
+        entry = self.entries.get(fingerprint)
+        if not entry:
+            return None
+        if entry[0] < datetime.now(timezone.utc).timestamp():
+            del self.entries[fingerprint]
+            return None
+        return entry[1:]
+    
+    def put(self, fingerprint: str, image_url: str, image_data: Optional[Dict], job_id: str):
+        if self.ttl <= 0:
+            return
+        self.entries.pop(fingerprint, None)
+        self.entries[fingerprint] = (datetime.now(timezone.utc).timestamp() + self.ttl, image_url, image_data, job_id)
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]  # oldest first
 
 
 class ImageJobWorker:
@@ -153,9 +330,15 @@ class ImageJobWorker:
         self.db = db
         self.is_rate_limited = False
         self.rate_limit_until: Optional[datetime] = None
+        self.leases = JobLeases(db)
+        self.results = GenerationResultCache()
     
     async def process_pending_job(self) -> bool:
-        """Process one pending image job. Returns True if job was processed."""
+        """Process one pending image job. Returns True if job was processed.
+        
+        Jobs whose fingerprint was generated within IMAGE_DEDUPE_TTL complete
+        from that image; pending jobs with the job's fingerprint are claimed
+        and completed from the same provider call."""
         
         # Check rate limit
         if self.is_rate_limited and self.rate_limit_until:
@@ -163,6 +346,10 @@ class ImageJobWorker:
                 return False
             self.is_rate_limited = False
         
+        # generate-images known to be down: leave the queue alone instead of spending retries
+        if not self.db.edge.available('generate-images'):
+            return False
+        
         # Get next pending job
         jobs = await self.db.select_pending('image_generation_jobs', limit=1)
         
@@ -171,14 +358,30 @@ class ImageJobWorker:
         
         job = jobs[0]
         job_id = job['id']
+        fingerprint = job.get('request_fingerprint') or image_request_fingerprint(job)
+        
+        # Mark as processing (unless another worker claimed it first)
+        if not await self.leases.claim('image_generation_jobs', job_id, {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'request_fingerprint': fingerprint
+        }):
+            return False
         logger.info(f"[IMAGE] Processing job {job_id} - Segment {job['segment_number']}")
         
+        held = [job_id]
+        heartbeat = self.leases.heartbeat('image_generation_jobs', held)
+        duplicates: List[str] = []
         try:
-            # Mark as processing
-            await self.db.update('image_generation_jobs', job_id, {
-                'status': JOB_STATUS['PROCESSING'],
-                'started_at': datetime.now(timezone.utc).isoformat()
-            })
+            # Same request generated recently? No provider call needed
+            previous = await self._find_result(fingerprint)
+            if previous:
+                image_url, image_data, source_id = previous
+                await self.db.update('image_generation_jobs', job_id, self._completion(image_url, image_data, source_id))
+                logger.info(f"[IMAGE] ♻️ Job {job_id} reused the image of job {source_id}")
+                return True
+            
+            duplicates = await self._claim_duplicates(fingerprint, job_id)
+            held.extend(duplicates)
             
             # Call generate-images Edge Function
             result = await self.db.invoke_function('generate-images', {
@@ -209,6 +412,9 @@ class ImageJobWorker:
                         'metadata': json.dumps(image_data) if isinstance(image_data, dict) else None
                     })
                     logger.info(f"[IMAGE] ✅ Job {job_id} completed: {image_url[:50]}...")
+                    self.results.put(fingerprint, image_url, image_data if isinstance(image_data, dict) else None, job_id)
+                    coalesced, duplicates = duplicates, []
+                    await self._complete_duplicates(coalesced, image_url, image_data, job_id)
                     return True
             
             # Check for rate limit error
@@ -221,6 +427,10 @@ class ImageJobWorker:
             await self._handle_failure(job_id, job, error_msg)
             return True
             
+        except CircuitOpenError as e:
+            await self._handle_unavailable(job_id, e)
+            return False
+        
         except httpx.HTTPStatusError as e:
             error_msg = f"HTTP {e.response.status_code}: {e.response.text[:200]}"
             if e.response.status_code == 429:
@@ -233,6 +443,90 @@ class ImageJobWorker:
             logger.error(f"[IMAGE] Error processing job {job_id}: {e}")
             await self._handle_failure(job_id, job, str(e))
             return False
+        
+        finally:
+            heartbeat.cancel()
+            # The provider call failed: claimed duplicates go back to the queue on their own
+            if duplicates:
+                await self._release_duplicates(duplicates)
+    
+    @staticmethod
+    def _completion(image_url: str, image_data: Any, source_id: str) -> Dict:
+        """Update completing a job with the image generated for job source_id."""
+        metadata = json.loads(image_data) if isinstance(image_data, str) else image_data
+        metadata = dict(metadata) if isinstance(metadata, dict) else {}
+        metadata['deduplicated_from'] = source_id
+        return {
+            'status': JOB_STATUS['COMPLETED'],
+            'image_url': image_url,
+            'completed_at': datetime.now(timezone.utc).isoformat(),
+            'error_message': None,
+            'metadata': json.dumps(metadata)
+        }
+    
+    async def _find_result(self, fingerprint: str) -> Optional[Tuple[str, Any, str]]:
+        """(image_url, image data, job id) of a job with this fingerprint completed within the TTL."""
+        if IMAGE_DEDUPE_TTL <= 0:
+            return None
+        
+        cached = self.results.get(fingerprint)
+        if cached:
+            return cached
+        
+        # Generated by another worker, or before a restart
+        since = datetime.now(timezone.utc) - timedelta(seconds=IMAGE_DEDUPE_TTL)
+        rows = await self.db.select_where('image_generation_jobs', {
+            'request_fingerprint': f'eq.{fingerprint}',
+            'status': f"eq.{JOB_STATUS['COMPLETED']}",
+            'image_url': 'not.is.null',
+            'completed_at': f'gte.{since.isoformat()}',
+            'select': 'id,image_url,metadata',
+            'order': 'completed_at.desc',
+            'limit': '1'
+        })
+        if not rows:
+            return None
+        return rows[0]['image_url'], rows[0].get('metadata'), rows[0]['id']
+    
+    async def _claim_duplicates(self, fingerprint: str, job_id: str) -> List[str]:
+        """Mark pending jobs with the same fingerprint as processing; they wait for this job's result."""
+        claimed = await self.db.update_where('image_generation_jobs', {
+            'request_fingerprint': f'eq.{fingerprint}',
+            'status': f"eq.{JOB_STATUS['PENDING']}",
+            'id': f'neq.{job_id}'
+        }, {
+            'status': JOB_STATUS['PROCESSING'],
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            **self.leases.lease()
+        })
+        ids = [row['id'] for row in claimed]
+        if ids:
+            logger.info(f"[IMAGE] Coalesced {len(ids)} duplicate job(s) into job {job_id}")
+        return ids
+    
+    async def _complete_duplicates(self, ids: List[str], image_url: str, image_data: Any, source_id: str):
+        """Complete the claimed duplicates with the image generated for source_id."""
+        if not ids:
+            return
+        try:
+            await self.db.update_where('image_generation_jobs', {
+                'id': f"in.({','.join(ids)})"
+            }, self._completion(image_url, image_data, source_id))
+            logger.info(f"[IMAGE] ✅ {len(ids)} duplicate job(s) completed from job {source_id}")
+        except Exception as e:
+            # Back in the queue they complete from the result cache
+            logger.warning(f"[IMAGE] Completing duplicates of job {source_id} failed: {e}")
+            await self._release_duplicates(ids)
+    
+    async def _release_duplicates(self, ids: List[str]):
+        """Put claimed duplicates back to pending."""
+        try:
+            await self.db.update_where('image_generation_jobs', {
+                'id': f"in.({','.join(ids)})",
+                'status': f"eq.{JOB_STATUS['PROCESSING']}"
+            }, {'status': JOB_STATUS['PENDING'], **self.leases.released()})
+        except Exception as e:
+            logger.error(f"[IMAGE] Releasing duplicate jobs {ids} failed: {e}")
     
     async def _handle_rate_limit(self, job_id: str, job: Dict):
         """Handle rate limit - put job back to pending, set cooldown."""
@@ -247,7 +541,16 @@ class ImageJobWorker:
         await self.db.update('image_generation_jobs', job_id, {
             'status': JOB_STATUS['PENDING'],
             'retry_count': job.get('retry_count', 0) + 1,
-            'error_message': 'RATE_LIMIT: Will retry automatically'
+            'error_message': 'RATE_LIMIT: Will retry automatically',
+            **self.leases.released()
+        })
+    
+    async def _handle_unavailable(self, job_id: str, error: CircuitOpenError):
+        """Edge Function circuit open - put job back to pending without using a retry."""
+        logger.warning(f"[IMAGE] {error}; job {job_id} back to pending")
+        await self.db.update('image_generation_jobs', job_id, {
+            'status': JOB_STATUS['PENDING'],
+            **self.leases.released()
         })
     
     async def _handle_failure(self, job_id: str, job: Dict, error_msg: str):
@@ -260,7 +563,8 @@ class ImageJobWorker:
             await self.db.update('image_generation_jobs', job_id, {
                 'status': JOB_STATUS['PENDING'],
                 'retry_count': retry_count,
-                'error_message': f"Retry {retry_count}: {error_msg[:500]}"
+                'error_message': f"Retry {retry_count}: {error_msg[:500]}",
+                **self.leases.released()
             })
         else:
             # Max retries exceeded
@@ -280,6 +584,7 @@ class VideoJobWorker:
         self.db = db
         self.is_rate_limited = False
         self.rate_limit_until: Optional[datetime] = None
+        self.leases = JobLeases(db)
     
     async def process_pending_job(self) -> bool:
         """Process one pending video job. Returns True if job was processed."""
@@ -290,6 +595,10 @@ class VideoJobWorker:
                 return False
             self.is_rate_limited = False
         
+        # generate-videos known to be down: leave the queue alone instead of spending retries
+        if not self.db.edge.available('generate-videos'):
+            return False
+        
         # Get next pending job
         jobs = await self.db.select_pending('video_generation_jobs', limit=1)
         
@@ -305,13 +614,14 @@ class VideoJobWorker:
             logger.warning(f"[VIDEO] Job {job_id} waiting for image")
             return False
         
+        # Mark as processing (unless another worker claimed it first)
+        if not await self.leases.claim('video_generation_jobs', job_id, {
+            'started_at': datetime.now(timezone.utc).isoformat()
+        }):
+            return False
+        
+        heartbeat = self.leases.heartbeat('video_generation_jobs', [job_id])
         try:
-            # Mark as processing
-            await self.db.update('video_generation_jobs', job_id, {
-                'status': JOB_STATUS['PROCESSING'],
-                'started_at': datetime.now(timezone.utc).isoformat()
-            })
-            
             # Call generate-videos Edge Function with process_single mode
             result = await self.db.invoke_function('generate-videos', {
                 'mode': 'process_single',
@@ -326,7 +636,13 @@ class VideoJobWorker:
                 
                 if veo_uuid:
                     logger.info(f"[VIDEO] Job {job_id} submitted to VEO: {veo_uuid}")
-                    # Job is now processing in VEO, will be polled by check_processing_jobs
+                    # Job is now processing in VEO, will be polled by check_processing_jobs;
+                    # the render gets one long lease instead of heartbeats
+                    heartbeat.cancel()
+                    try:
+                        await self.leases.renew('video_generation_jobs', [job_id], VEO_LEASE_SECONDS)
+                    except Exception as e:
+                        logger.warning(f"[LEASE] Extending lease of job {job_id} for VEO failed: {e}")
                     return True
                 
                 # Check if already completed
@@ -344,6 +660,10 @@ class VideoJobWorker:
             await self._handle_failure(job_id, job, error_msg)
             return True
             
+        except CircuitOpenError as e:
+            await self._handle_unavailable(job_id, e)
+            return False
+        
         except httpx.HTTPStatusError as e:
             error_msg = f"HTTP {e.response.status_code}: {e.response.text[:200]}"
             if e.response.status_code == 429:
@@ -356,9 +676,15 @@ class VideoJobWorker:
             logger.error(f"[VIDEO] Error processing job {job_id}: {e}")
             await self._handle_failure(job_id, job, str(e))
             return False
+        
+        finally:
+            heartbeat.cancel()
     
     async def check_processing_jobs(self) -> int:
         """Check status of jobs currently being processed by VEO. Returns count checked."""
+        if not self.db.edge.available('check-video-status'):
+            return 0
+        
         async with httpx.AsyncClient() as client:
             # Get processing jobs with VEO UUID
             url = f"{self.db.url}/rest/v1/video_generation_jobs"
@@ -383,10 +709,11 @@ class VideoJobWorker:
         
         try:
             # Call check-video-status Edge Function
+            # Read-only towards VEO and idempotent on the DB: safe to hedge
             result = await self.db.invoke_function('check-video-status', {
                 'video_uuids': uuids,
                 'update_db': True
-            })
+            }, idempotent=True)
             
             if result.get('success'):
                 videos = result.get('data', {}).get('videos', [])
@@ -415,7 +742,17 @@ class VideoJobWorker:
             'status': JOB_STATUS['PENDING'],
             'retry_count': job.get('retry_count', 0) + 1,
             'error_message': 'RATE_LIMIT: Will retry automatically',
-            'veo_uuid': None
+            'veo_uuid': None,
+            **self.leases.released()
+        })
+    
+    async def _handle_unavailable(self, job_id: str, error: CircuitOpenError):
+        """Edge Function circuit open - put job back to pending without using a retry."""
+        logger.warning(f"[VIDEO] {error}; job {job_id} back to pending")
+        await self.db.update('video_generation_jobs', job_id, {
+            'status': JOB_STATUS['PENDING'],
+            'veo_uuid': None,
+            **self.leases.released()
         })
     
     async def _handle_failure(self, job_id: str, job: Dict, error_msg: str):
@@ -428,7 +765,8 @@ class VideoJobWorker:
                 'status': JOB_STATUS['PENDING'],
                 'retry_count': retry_count,
                 'error_message': f"Retry {retry_count}: {error_msg[:500]}",
-                'veo_uuid': None
+                'veo_uuid': None,
+                **self.leases.released()
             })
         else:
             logger.error(f"[VIDEO] Job {job_id} failed permanently: {error_msg[:200]}")
@@ -521,6 +859,9 @@ class BackgroundWorker:
         self.image_worker = ImageJobWorker(self.db)
         self.video_worker = VideoJobWorker(self.db)
         self.notifier = NotificationService(self.db)
+        self.leases = JobLeases(self.db)
+        self.last_reclaim = float('-inf')
+        self.last_archive = float('-inf')
         self.running = False
     
     async def start(self):
@@ -530,6 +871,7 @@ class BackgroundWorker:
         logger.info("🚀 Sparkfluence Background Worker Started")
         logger.info(f"   Poll interval: {POLL_INTERVAL}s")
         logger.info(f"   Max retries: {MAX_RETRIES}")
+        logger.info(f"   Worker id: {WORKER_ID} (lease {JOB_LEASE_SECONDS}s, VEO lease {VEO_LEASE_SECONDS}s)")
         logger.info("=" * 50)
         
         while self.running:
@@ -543,6 +885,16 @@ class BackgroundWorker:
     async def _process_cycle(self):
         """One processing cycle."""
         
+        # 0. Return jobs of crashed workers to the queue
+        if time.monotonic() - self.last_reclaim >= LEASE_REAP_INTERVAL:
+            self.last_reclaim = time.monotonic()
+            await self._reclaim_expired_leases()
+        
+        # 0b. Move old finished jobs out of the queue tables
+        if JOB_ARCHIVE_AFTER_DAYS > 0 and time.monotonic() - self.last_archive >= JOB_ARCHIVE_INTERVAL:
+            self.last_archive = time.monotonic()
+            await self._archive_finished_jobs()
+        
         # 1. Process pending IMAGE jobs (priority 1)
         image_processed = await self.image_worker.process_pending_job()
         if image_processed:
@@ -560,12 +912,103 @@ class BackgroundWorker:
         if image_processed or video_processed:
             logger.debug(f"Cycle complete: image={image_processed}, video={video_processed}")
     
+    async def _reclaim_expired_leases(self):
+        """Reap jobs whose worker stopped renewing its lease."""
+        try:
+            reclaimed = await self.leases.reclaim_expired()
+        except Exception as e:
+            logger.warning(f"[LEASE] Reclaiming expired leases failed: {e}")
+            return
+        for row in reclaimed:
+            outcome = 'failed (out of retries)' if row['job_status'] == JOB_STATUS['FAILED'] else 'back to pending'
+            logger.warning(f"[LEASE] Reclaimed {row['job_table']} job {row['job_id']}: {outcome}")
+    
+    async def _archive_finished_jobs(self):
+        """Archive finished jobs older than JOB_ARCHIVE_AFTER_DAYS, batch by batch."""
+        totals: Dict[str, int] = {}
+        try:
+            for _ in range(JOB_ARCHIVE_MAX_BATCHES):
+                batch = await self.db.rpc('archive_finished_generation_jobs', {
+                    'older_than_days': JOB_ARCHIVE_AFTER_DAYS,
+                    'batch_size': JOB_ARCHIVE_BATCH_SIZE
+                }) or []
+                for row in batch:
+                    totals[row['job_table']] = totals.get(row['job_table'], 0) + row['archived_count']
+                if all(row['archived_count'] < JOB_ARCHIVE_BATCH_SIZE for row in batch):
+                    break
+        except Exception as e:
+            logger.warning(f"[ARCHIVE] Archiving finished jobs failed: {e}")
+        for table, count in totals.items():
+            if count:
+                logger.info(f"[ARCHIVE] Moved {count} finished {table} rows to the archive")
+    
     def stop(self):
         """Stop the worker."""
         self.running = False
         logger.info("Background worker stopping...")
 
 
+class WorkerLeadership:
+    """Lease-based leader election among API processes: only the leader runs the BackgroundWorker."""
+    
+    def __init__(self, db: SupabaseClient, name: str = 'background_worker', holder: str = WORKER_ID):
+        self.db = db
+        self.name = name
+        self.holder = holder
+        self.is_leader = False
+        self.renewed_at = float('-inf')
+    
+    async def try_acquire(self) -> bool:
+        """Take or renew the lease. True while this process holds it."""
+        return bool(await self.db.rpc('try_acquire_worker_leadership', {
+            'lock_name': self.name,
+            'holder_id': self.holder,
+            'lease_seconds': LEADER_LEASE_SECONDS
+        }))
+    
+    async def release(self):
+        """Give the lease up so a standby takes over without waiting for it to expire."""
+        try:
+            await self.db.rpc('release_worker_leadership', {'lock_name': self.name, 'holder_id': self.holder})
+        except Exception as e:
+            logger.warning(f"[LEADER] Releasing leadership failed: {e}")
+    
+    async def run(self, worker: 'BackgroundWorker'):
+        """Campaign for leadership; run `worker` while leader, stop it as soon as the lease may be lost."""
+        worker_task: Optional[asyncio.Task] = None
+        try:
+            while True:
+                try:
+                    if await self.try_acquire():
+                        self.renewed_at = time.monotonic()
+                    elif self.is_leader:
+                        logger.warning(f"[LEADER] {self.holder} lost leadership")
+                        self.renewed_at = float('-inf')
+                except Exception as e:
+                    logger.warning(f"[LEADER] Leadership check failed: {e}")
+                
+                # Unconfirmed for a whole renew interval before expiry: another process may take over
+                leader = time.monotonic() - self.renewed_at < LEADER_LEASE_SECONDS - LEADER_RENEW_INTERVAL
+                if leader and not self.is_leader:
+                    logger.info(f"[LEADER] {self.holder} is the worker leader")
+                    worker_task = asyncio.create_task(worker.start())
+                elif not leader and self.is_leader:
+                    logger.info(f"[LEADER] {self.holder} stepping down")
+                    worker.stop()
+                    worker_task.cancel()  # interrupted jobs are reclaimed through their leases
+                    worker_task = None
+                self.is_leader = leader
+                
+                await asyncio.sleep(LEADER_RENEW_INTERVAL)
+        finally:
+            if worker_task:
+                worker.stop()
+                worker_task.cancel()
+            if self.is_leader:
+                self.is_leader = False
+                await asyncio.shield(self.release())
+
+
 async def main():
     """Entry point for background worker."""
     worker = BackgroundWorker()
@@ -1,10 +1,11 @@
-from fastapi import FastAPI, HTTPException, Header, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Header, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, List, Optional, Dict, Any
 import subprocess
 import os
+import re
 import uuid
 import httpx
 from pathlib import Path
@@ -27,27 +28,52 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Import background worker
-from job_worker import BackgroundWorker
+from job_worker import WORKER_MODE, WORKER_MODES, BackgroundWorker, WorkerLeadership, image_request_fingerprint
+from job_events import STREAM_TOKEN_TTL, JobEventBroker, issue_stream_token, summarize_jobs, verify_stream_token
+from video_delivery import RangeFileResponse, accel_redirect_response
+from video_segments import ENCODE_PRESET, X264_PRESETS, prepare_for_concat, target_size
+from combine_pipeline import prepare_segments, stream_combine
+from combine_cache import ProjectArtifactCache, cache_key, link_or_copy, segment_fingerprints
+from scratch_space import ScratchSpace
+from queue_metrics import PENDING, PROCESSING, COMPLETED, FAILED, QueueMetrics
 
 # Global worker instance
 background_worker: Optional[BackgroundWorker] = None
+worker_leadership: Optional[WorkerLeadership] = None
 worker_task: Optional[asyncio.Task] = None
+sweeper_task: Optional[asyncio.Task] = None
+metrics_task: Optional[asyncio.Task] = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown events."""
-    global background_worker, worker_task
+    global background_worker, worker_leadership, worker_task, sweeper_task, metrics_task
     
     # Startup
     logger.info("Starting Sparkfluence Video Backend...")
+    sweeper_task = asyncio.create_task(scratch.run_sweeper())
+    # Periodic metrics refresh on the worker leader only (or everywhere when there is no election);
+    # other processes refresh on demand in GET /api/worker/queues
+    metrics_task = asyncio.create_task(queue_metrics.run(
+        lambda: worker_leadership is None or worker_leadership.is_leader
+    ))
     
-    # Start background worker if Supabase is configured
-    if os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_SERVICE_ROLE_KEY'):
+    # Start background worker if Supabase is configured (embedded mode: elected leader only)
+    if WORKER_MODE not in WORKER_MODES:
+        logger.error(f"Unknown WORKER_MODE '{WORKER_MODE}' - background worker disabled")
+    elif WORKER_MODE == 'standalone':
+        logger.info("WORKER_MODE=standalone - background worker runs as its own process (python job_worker.py)")
+    elif WORKER_MODE == 'disabled':
+        logger.info("WORKER_MODE=disabled - background worker not started")
+    elif os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_SERVICE_ROLE_KEY'):
         try:
             background_worker = BackgroundWorker()
-            worker_task = asyncio.create_task(background_worker.start())
-            logger.info("Background job worker started")
+            background_worker.db.add_update_listener(job_events.publish_row)
+            background_worker.db.add_update_listener(queue_metrics.record_row)
+            worker_leadership = WorkerLeadership(background_worker.db)
+            worker_task = asyncio.create_task(worker_leadership.run(background_worker))
+            logger.info("Background job worker standing for leader election")
         except Exception as e:
             logger.error(f"Failed to start background worker: {e}")
     else:
@@ -56,6 +82,8 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown
+    sweeper_task.cancel()
+    metrics_task.cancel()
     if background_worker:
         background_worker.stop()
     if worker_task:
@@ -88,6 +116,43 @@ jobs: Dict[str, Dict[str, Any]] = {}
 # Store completed video paths for serving
 completed_videos: Dict[str, str] = {}
 
+# Local video storage (fallback when Supabase Storage is not configured)
+VIDEO_STORAGE_DIR = Path(os.getenv('VIDEO_STORAGE_DIR', str(Path(tempfile.gettempdir()) / "sparkfluence_videos")))
+# When set (e.g. "/internal-videos/"), /api/video/{id} answers with X-Accel-Redirect
+# and nginx serves the file from VIDEO_STORAGE_DIR (see nginx.conf)
+VIDEO_ACCEL_REDIRECT_PREFIX = os.getenv('VIDEO_ACCEL_REDIRECT_PREFIX')
+
+# Combined video outputs
+STORAGE_BUCKET = 'final-videos'
+STORAGE_CONTENT_TYPES = {
+    '.mp4': 'video/mp4',
+    '.m4s': 'video/iso.segment',
+    '.m3u8': 'application/vnd.apple.mpegurl'
+}
+HLS_MANIFEST = 'playlist.m3u8'
+# Names a client may ask for under VIDEO_STORAGE_DIR: no separators, no '.'/'..'
+STORAGE_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+STORAGE_FILE_PATTERN = re.compile(r'[A-Za-z0-9_-]+(\.mp4|\.m4s|\.m3u8)')
+RENDITION_UPLOAD_CONCURRENCY = 4
+DOWNLOAD_CONCURRENCY = 4  # segment downloads at once
+
+# Render lanes: previews get their own slots so they never wait behind full renders
+FULL_RENDER_CONCURRENCY = int(os.getenv('FULL_RENDER_CONCURRENCY', '2'))
+PREVIEW_RENDER_CONCURRENCY = int(os.getenv('PREVIEW_RENDER_CONCURRENCY', '1'))
+render_lanes = {
+    'full': asyncio.Semaphore(FULL_RENDER_CONCURRENCY),
+    'preview': asyncio.Semaphore(PREVIEW_RENDER_CONCURRENCY)
+}
+
+# Previews stream-copy every segment that matches the majority format and
+# re-encode only the rest with the fastest settings. Set PREVIEW_RESOLUTION
+# (e.g. 360p) to downscale everything instead: ~80x the CPU of a copy, but
+# ~15x fewer bytes to upload on slow links.
+PREVIEW_RESOLUTION = os.getenv('PREVIEW_RESOLUTION')  # unset: stream copy
+PREVIEW_FPS = 15  # only with PREVIEW_RESOLUTION
+PREVIEW_CRF = 32
+PREVIEW_PRESET = 'ultrafast'
+
 # Supabase client helper
 class SupabaseHelper:
     def __init__(self):
@@ -113,16 +178,59 @@ class SupabaseHelper:
     
     async def select(self, table: str, filters: Dict = None) -> List[Dict]:
         """Select records from table."""
+        return await self.select_where(table, {k: f"eq.{v}" for k, v in (filters or {}).items()})
+    
+    async def select_where(self, table: str, params: Dict[str, str]) -> List[Dict]:
+        """Select records with raw PostgREST query params."""
         async with httpx.AsyncClient() as client:
             url = f"{self.url}/rest/v1/{table}"
-            params = {k: f"eq.{v}" for k, v in (filters or {}).items()}
             response = await client.get(url, headers=self.headers, params=params)
             response.raise_for_status()
             return response.json()
+    
+    async def count_where(self, table: str, params: Dict[str, str]) -> int:
+        """Count records with raw PostgREST query params (no rows transferred, no max-rows cap)."""
+        async with httpx.AsyncClient() as client:
+            url = f"{self.url}/rest/v1/{table}"
+            headers = {**self.headers, 'Prefer': 'count=exact'}
+            response = await client.head(url, headers=headers, params=params)
+            response.raise_for_status()
+            # Content-Range: 0-24/1234 (or */0 when nothing matches)
+            return int(response.headers.get('content-range', '*/0').rsplit('/', 1)[-1])
 
 supabase = SupabaseHelper()
 
 
+def job_table(job_type: str) -> str:
+    """Table of a session job type ('images' or 'videos')."""
+    return 'image_generation_jobs' if job_type == 'images' else 'video_generation_jobs'
+
+
+async def fetch_session_jobs(job_type: str, session_id: str) -> List[Dict]:
+    jobs = await supabase.select(job_table(job_type), {'session_id': session_id})
+    if not jobs:
+        # Old finished sessions live in the archive (job_worker archives them)
+        archived = await supabase.select(f"{job_table(job_type)}_archive", {'session_id': session_id})
+        jobs = sorted((row['job'] for row in archived), key=lambda job: job.get('segment_number') or 0)
+    return jobs
+
+
+# Progress push (SSE) for combine jobs and job sessions
+job_events = JobEventBroker(fetch_session_jobs)
+
+# Per-project segments / outputs of previous combines
+combine_cache = ProjectArtifactCache()
+
+# Queue depth / throughput for autoscaling (GET /api/worker/queues)
+queue_metrics = QueueMetrics(
+    supabase.select_where if supabase.url and supabase.key else None,
+    supabase.count_where if supabase.url and supabase.key else None
+)
+
+# Combine work dirs, disk admission, fallback video quota
+scratch = ScratchSpace(VIDEO_STORAGE_DIR, on_evict=lambda video_id: completed_videos.pop(video_id, None))
+
+
 # Models
 class VideoSegment(BaseModel):
     type: str
@@ -132,6 +240,17 @@ class VideoSegment(BaseModel):
 class CombineOptions(BaseModel):
     bgm_url: Optional[str] = None
     bgm_volume: float = 0.15
+    hls: bool = False  # also publish a fragmented-MP4 HLS rendition (manifest_url)
+    hls_segment_seconds: int = 4
+    # Normalization: re-encode segments that differ from this target (None keeps the segments' own)
+    resolution: Optional[str] = None  # '720p', '1080p', ...
+    aspect_ratio: str = '9:16'
+    fps: Optional[int] = None
+    preset: str = ENCODE_PRESET  # x264 preset of the re-encodes
+    # Overlap download, concat and upload (fragmented MP4 output, see combine_pipeline.py)
+    streaming: bool = False
+    # Quick low-resolution proxy to check ordering and BGM (own render lane, not cached)
+    preview: bool = False
 
 class CombineVideoRequest(BaseModel):
     project_id: str
@@ -144,6 +263,7 @@ class JobStatusResponse(BaseModel):
     progress_percentage: int
     current_step: str
     final_video_url: Optional[str] = None
+    manifest_url: Optional[str] = None
     error_message: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
 
@@ -208,12 +328,16 @@ async def root():
 async def health_check():
     supabase_configured = bool(os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
     worker_running = background_worker is not None and background_worker.running if background_worker else False
+    worker_standby = worker_leadership is not None and not worker_leadership.is_leader
     
     return {
         "status": "healthy",
         "ffmpeg_available": check_ffmpeg_available(),
         "supabase_configured": supabase_configured,
-        "background_worker": "running" if worker_running else "stopped"
+        "background_worker": "running" if worker_running else ("standby" if worker_standby else "stopped"),
+        "worker_mode": WORKER_MODE,
+        # Walks VIDEO_STORAGE_DIR, keep it off the event loop
+        "scratch": await asyncio.to_thread(scratch.stats)
     }
 
 
@@ -226,12 +350,34 @@ async def worker_status(api_key: str = Header(..., alias="x-api-key")):
         "success": True,
         "data": {
             "running": background_worker.running if background_worker else False,
+            "mode": WORKER_MODE,
+            "leader": worker_leadership.is_leader if worker_leadership else False,
             "image_rate_limited": background_worker.image_worker.is_rate_limited if background_worker else False,
-            "video_rate_limited": background_worker.video_worker.is_rate_limited if background_worker else False
+            "video_rate_limited": background_worker.video_worker.is_rate_limited if background_worker else False,
+            "edge_functions": background_worker.db.edge.stats() if background_worker else {}
         }
     }
 
 
+@app.get("/api/worker/queues")
+async def worker_queues(api_key: str = Header(..., alias="x-api-key")):
+    """
+    Queue depth, throughput and drain-time estimate per queue (autoscaling signal).
+    Image / video figures come from the DB; combine figures cover this process only.
+    """
+    verify_api_key(api_key)
+    
+    try:
+        await queue_metrics.refresh_if_stale()
+    except Exception as e:
+        logger.warning(f"[METRICS] Queue refresh failed: {e}")
+    
+    return {
+        "success": True,
+        "data": queue_metrics.snapshot()
+    }
+
+
 # ==================== NEW: Async Job Creation Endpoints ====================
 
 @app.post("/api/jobs/images")
@@ -262,10 +408,14 @@ async def create_image_jobs(
             'language': request.language,
             'status': 0  # PENDING
         })
+        # Identical requests share one provider call (see ImageJobWorker)
+        jobs_data[-1]['request_fingerprint'] = image_request_fingerprint(jobs_data[-1])
     
     try:
         # Insert jobs into database
         created = await supabase.insert('image_generation_jobs', jobs_data)
+        for row in created:
+            queue_metrics.record_row('image_generation_jobs', row)
         
         return {
             "success": True,
@@ -314,6 +464,8 @@ async def create_video_jobs(
     
     try:
         created = await supabase.insert('video_generation_jobs', jobs_data)
+        for row in created:
+            queue_metrics.record_row('video_generation_jobs', row)
         
         return {
             "success": True,
@@ -340,30 +492,14 @@ async def get_session_jobs(
     if job_type not in ['images', 'videos']:
         raise HTTPException(status_code=400, detail="job_type must be 'images' or 'videos'")
     
-    table = 'image_generation_jobs' if job_type == 'images' else 'video_generation_jobs'
-    
     try:
-        jobs = await supabase.select(table, {'session_id': session_id})
-        
-        # Calculate summary
-        total = len(jobs)
-        pending = sum(1 for j in jobs if j['status'] == 0)
-        processing = sum(1 for j in jobs if j['status'] == 1)
-        completed = sum(1 for j in jobs if j['status'] == 2)
-        failed = sum(1 for j in jobs if j['status'] == 3)
+        jobs = await fetch_session_jobs(job_type, session_id)
         
         return {
             "success": True,
             "data": {
                 "jobs": jobs,
-                "summary": {
-                    "total": total,
-                    "pending": pending,
-                    "processing": processing,
-                    "completed": completed,
-                    "failed": failed
-                },
-                "all_complete": pending == 0 and processing == 0
+                **summarize_jobs(jobs)
             }
         }
     except Exception as e:
@@ -381,9 +517,29 @@ async def combine_final_video(
 ):
     verify_api_key(api_key)
 
+    options = request.options
+    if options.preset not in X264_PRESETS:
+        raise HTTPException(status_code=400, detail=f"Invalid preset: {options.preset}")
+    if options.fps is not None and not 1 <= options.fps <= 120:
+        raise HTTPException(status_code=400, detail=f"Invalid fps: {options.fps}")
+    if options.resolution:
+        try:
+            target_size(options.resolution, options.aspect_ratio)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     # Create job ID
     job_id = f"job_{uuid.uuid4().hex[:12]}"
 
+    # Refuse early instead of failing halfway with a full disk
+    estimated_bytes = scratch.estimate_job_bytes(sum(s.duration_seconds for s in request.segments))
+    if not scratch.admit(job_id, estimated_bytes):
+        raise HTTPException(
+            status_code=503,
+            detail="Not enough scratch space for this video right now, try again later",
+            headers={"Retry-After": "60"}
+        )
+
     # Initialize job status
     jobs[job_id] = {
         "job_id": job_id,
@@ -391,9 +547,11 @@ async def combine_final_video(
         "progress_percentage": 0,
         "current_step": "Initializing",
         "final_video_url": None,
+        "manifest_url": None,
         "error_message": None,
         "metadata": None
     }
+    queue_metrics.record('combine', job_id, PENDING)
 
     # Start background processing
     background_tasks.add_task(
@@ -409,8 +567,9 @@ async def combine_final_video(
         "data": {
             "job_id": job_id,
             "status": "processing",
-            "estimated_time_seconds": 30,
-            "polling_endpoint": f"/api/job-status/{job_id}"
+            "estimated_time_seconds": 10 if request.options.preview else 30,
+            "polling_endpoint": f"/api/job-status/{job_id}",
+            "events_endpoint": f"/api/job-events/{job_id}"
         }
     }
 
@@ -433,24 +592,154 @@ async def get_job_status(
     }
 
 
-@app.get("/api/video/{video_id}")
+# ==================== Progress Push (Server-Sent Events) ====================
+# EventSource cannot send headers, so the API key and resume token are also
+# accepted as query parameters. Reconnecting clients send Last-Event-ID and
+# get the events they missed (or a fresh snapshot).
+
+def event_stream_response(stream) -> StreamingResponse:
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # disable proxy buffering (nginx)
+        }
+    )
+
+
+def verify_stream_access(topic: str, api_key: Optional[str], token: Optional[str]):
+    """Event streams take the API key header, or a stream token for that topic (EventSource can't send headers)."""
+    if api_key or not token:
+        verify_api_key(api_key or "")
+        return
+    secret = os.getenv('BACKEND_API_KEY')
+    if not secret:
+        raise HTTPException(status_code=500, detail="API key not configured")
+    if not verify_stream_token(secret, topic, token):
+        raise HTTPException(status_code=401, detail="Invalid or expired stream token")
+
+
+def stream_token_response(topic: str, api_key: str) -> Dict[str, Any]:
+    verify_api_key(api_key)
+    return {
+        "success": True,
+        "data": {
+            "token": issue_stream_token(os.getenv('BACKEND_API_KEY'), topic),
+            "expires_in": STREAM_TOKEN_TTL
+        }
+    }
+
+
+@app.post("/api/job-events/{job_id}/token")
+async def job_events_token(job_id: str, api_key: str = Header(..., alias="x-api-key")):
+    """Short-lived token for opening /api/job-events/{job_id}?token=... from a browser."""
+    return stream_token_response(f"combine:{job_id}", api_key)
+
+
+@app.post("/api/events/{job_type}/{session_id}/token")
+async def session_events_token(job_type: str, session_id: str, api_key: str = Header(..., alias="x-api-key")):
+    """Short-lived token for opening /api/events/{job_type}/{session_id}?token=... from a browser."""
+    if job_type not in ['images', 'videos']:
+        raise HTTPException(status_code=400, detail="job_type must be 'images' or 'videos'")
+    return stream_token_response(f"{job_type}:{session_id}", api_key)
+
+
+@app.get("/api/job-events/{job_id}")
+async def stream_job_events(
+    job_id: str,
+    api_key: Optional[str] = Header(None, alias="x-api-key"),
+    token: Optional[str] = Query(None),
+    last_event_id: Optional[str] = Header(None, alias="last-event-id"),
+    last_event_id_param: Optional[str] = Query(None, alias="last_event_id")
+):
+    """Stream progress of a combine job (replaces polling /api/job-status/{job_id})."""
+    verify_stream_access(f"combine:{job_id}", api_key, token)
+
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    topic = job_events.watch_combine_job(jobs[job_id])
+    return event_stream_response(job_events.stream(topic, last_event_id or last_event_id_param))
+
+
+@app.get("/api/events/{job_type}/{session_id}")
+async def stream_session_events(
+    job_type: str,
+    session_id: str,
+    api_key: Optional[str] = Header(None, alias="x-api-key"),
+    token: Optional[str] = Query(None),
+    last_event_id: Optional[str] = Header(None, alias="last-event-id"),
+    last_event_id_param: Optional[str] = Query(None, alias="last_event_id")
+):
+    """Stream job changes of a session (replaces polling /api/jobs/{job_type}/{session_id})."""
+    verify_stream_access(f"{job_type}:{session_id}", api_key, token)
+
+    if job_type not in ['images', 'videos']:
+        raise HTTPException(status_code=400, detail="job_type must be 'images' or 'videos'")
+    
+    if not supabase.url or not supabase.key:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    topic = job_events.watch_session(job_type, session_id)
+    return event_stream_response(job_events.stream(topic, last_event_id or last_event_id_param))
+
+
+@app.api_route("/api/video/{video_id}", methods=["GET", "HEAD"])
 async def serve_video(video_id: str):
-    """Serve local video file for development"""
-    if video_id not in completed_videos:
-        raise HTTPException(status_code=404, detail="Video not found")
+    """Serve local video file (Range/206, conditional requests, optional nginx hand-off)"""
+    video_path = completed_videos.get(video_id)
+    if video_path is None:
+        # Survive restarts: fall back to the storage directory (ids are file stems)
+        candidate = VIDEO_STORAGE_DIR / f"{video_id}.mp4"
+        if not STORAGE_ID_PATTERN.fullmatch(video_id) or not candidate.is_file():
+            raise HTTPException(status_code=404, detail="Video not found")
+        video_path = str(candidate)
     
-    video_path = completed_videos[video_id]
     if not os.path.exists(video_path):
         raise HTTPException(status_code=404, detail="Video file not found")
+    scratch.touch_video(video_id)
     
-    return FileResponse(
-        video_path,
-        media_type="video/mp4",
-        headers={
-            "Accept-Ranges": "bytes",
-            "Content-Disposition": f"inline; filename={video_id}.mp4"
-        }
-    )
+    headers = {"Content-Disposition": f"inline; filename={video_id}.mp4"}
+    if VIDEO_ACCEL_REDIRECT_PREFIX:
+        return accel_redirect_response(
+            VIDEO_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + Path(video_path).name,
+            headers=headers
+        )
+    
+    return RangeFileResponse(video_path, media_type="video/mp4", headers=headers)
+
+
+@app.api_route("/api/video/{video_id}/{file_name}", methods=["GET", "HEAD"])
+async def serve_video_rendition(video_id: str, file_name: str):
+    """Serve local HLS rendition files (manifest, init segment, media segments)"""
+    file_path = storage_rendition_path(video_id, file_name)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if not file_path.is_file():
+        raise HTTPException(status_code=404, detail="Video file not found")
+    
+    scratch.touch_video(video_id)
+    media_type = STORAGE_CONTENT_TYPES.get(file_path.suffix, "application/octet-stream")
+    if VIDEO_ACCEL_REDIRECT_PREFIX:
+        relative = file_path.relative_to(VIDEO_STORAGE_DIR.resolve()).as_posix()
+        return accel_redirect_response(
+            f"{VIDEO_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative}",
+            media_type=media_type
+        )
+    
+    return RangeFileResponse(str(file_path), media_type=media_type)
+
+
+def storage_rendition_path(video_id: str, file_name: str) -> Optional[Path]:
+    """Resolved path of a rendition file, None unless it is a plain name inside VIDEO_STORAGE_DIR"""
+    if not STORAGE_ID_PATTERN.fullmatch(video_id) or not STORAGE_FILE_PATTERN.fullmatch(file_name):
+        return None
+    root = VIDEO_STORAGE_DIR.resolve()
+    file_path = (root / video_id / file_name).resolve()
+    if root not in file_path.parents:
+        return None
+    return file_path
 
 
 # ==================== Background Tasks ====================
@@ -461,38 +750,38 @@ async def process_video_combination(
     segments: List[VideoSegment],
     options: CombineOptions
 ):
-    work_dir = Path(tempfile.gettempdir()) / f"sparkfluence_{job_id}"
-    work_dir.mkdir(parents=True, exist_ok=True)
+    lane = render_lanes['preview' if options.preview else 'full']
+    if lane.locked():
+        update_job_status(job_id, 0, "Waiting for a render slot")
+    async with lane:
+        queue_metrics.record('combine', job_id, PROCESSING)
+        await run_video_combination(job_id, project_id, segments, options)
 
+
+async def run_video_combination(
+    job_id: str,
+    project_id: str,
+    segments: List[VideoSegment],
+    options: CombineOptions
+):
     try:
-        # Step 1: Download video segments
-        update_job_status(job_id, 10, "Downloading video segments")
-        segment_files = await download_segments(segments, work_dir)
-
-        # Step 2: Create concat file
-        update_job_status(job_id, 30, "Creating concat file")
-        concat_file = create_concat_file(segment_files, work_dir)
-
-        # Step 3: Concatenate videos
-        update_job_status(job_id, 50, "Concatenating video segments")
-        final_video = concatenate_videos(concat_file, work_dir)
-
-        # Step 4: Add BGM (optional)
-        if options.bgm_url:
-            update_job_status(job_id, 70, "Adding background music")
-            final_video = await add_background_music(
-                final_video,
-                options.bgm_url,
-                options.bgm_volume,
-                work_dir
-            )
+        work_dir = scratch.create_work_dir(job_id)
+
+        if options.preview:
+            final_video, video_id, final_url = await combine_preview(job_id, project_id, segments, options, work_dir)
+        elif options.streaming:
+            final_video, video_id, final_url = await combine_streaming(job_id, project_id, segments, options, work_dir)
+        else:
+            final_video, video_id, final_url = await combine_staged(job_id, project_id, segments, options, work_dir)
 
-        # Step 5: Upload to storage
-        update_job_status(job_id, 90, "Uploading final video")
-        final_url = await upload_to_storage(final_video, project_id)
+        manifest_url = None
+        if options.hls:
+            update_job_status(job_id, 95, "Packaging HLS rendition")
+            hls_dir = await asyncio.to_thread(package_hls, final_video, work_dir, options.hls_segment_seconds)
+            manifest_url = await upload_rendition(hls_dir, video_id)
 
-        # Step 6: Get metadata
-        metadata = get_video_metadata(final_video)
+        # Get metadata
+        metadata = await asyncio.to_thread(get_video_metadata, final_video)
 
         # Mark as completed
         jobs[job_id].update({
@@ -500,11 +789,11 @@ async def process_video_combination(
             "progress_percentage": 100,
             "current_step": "Upload complete",
             "final_video_url": final_url,
+            "manifest_url": manifest_url,
             "metadata": metadata
         })
-
-        # Cleanup
-        cleanup_directory(work_dir)
+        job_events.publish_combine_job(jobs[job_id])
+        queue_metrics.record('combine', job_id, COMPLETED)
 
     except Exception as e:
         logger.error(f"Job {job_id} failed: {str(e)}")
@@ -513,7 +802,181 @@ async def process_video_combination(
             "current_step": jobs[job_id]["current_step"],
             "error_message": str(e)
         })
-        cleanup_directory(work_dir)
+        job_events.publish_combine_job(jobs[job_id])
+        queue_metrics.record('combine', job_id, FAILED)
+
+    finally:
+        # Releases the admit() reservation and removes the work dir
+        scratch.release(job_id)
+
+
+async def combine_staged(
+    job_id: str,
+    project_id: str,
+    segments: List[VideoSegment],
+    options: CombineOptions,
+    work_dir: Path
+):
+    """
+    Download, concat, mix BGM, then upload; returns (final video, video id, url).
+    Segments unchanged since the project's last combine come from combine_cache.
+    """
+    format_key = cache_key(options.resolution, options.aspect_ratio, options.fps, options.preset)
+
+    async with combine_cache.lock(project_id):
+        # Step 1: Download the segments that changed since the last combine
+        update_job_status(job_id, 10, "Downloading video segments")
+        fingerprints = await segment_fingerprints([s.video_url for s in segments])
+        manifest = combine_cache.load(project_id, format_key)
+        cached = combine_cache.cached_segments(project_id, manifest)
+        changed = [i for i, fp in enumerate(fingerprints) if fp not in cached]
+        logger.info(f"Job {job_id}: {len(segments) - len(changed)}/{len(segments)} segments unchanged")
+
+        output_key = None
+        if all(fingerprints):
+            output_key = cache_key(fingerprints, options.bgm_url, options.bgm_volume)
+        cached_output = combine_cache.cached_output(project_id, manifest, output_key) if not changed else None
+
+        if cached_output:
+            # Nothing changed: reuse the last combined video
+            final_video = work_dir / "final_video.mp4"
+            link_or_copy(cached_output, final_video)
+            combine_cache.touch(project_id)
+        else:
+            downloaded = await download_segments([segments[i] for i in changed], work_dir, changed)
+
+            # Step 2: Probe segments, re-encode only the ones that can't be stream-copied
+            # (or that differ from the requested resolution / fps, or from the cached ones)
+            update_job_status(job_id, 20, "Normalizing video segments" if options.resolution or options.fps
+                              else "Checking segment compatibility")
+            new_files, reference = await prepare_for_concat(
+                downloaded,
+                work_dir,
+                resolution=options.resolution,
+                aspect_ratio=options.aspect_ratio,
+                fps=options.fps,
+                preset=options.preset,
+                indices=changed,
+                reference=combine_cache.reference(manifest) if len(changed) < len(segments) else None
+            )
+            new_files = dict(zip(changed, new_files))
+            segment_files = [new_files.get(i) or cached[fingerprints[i]] for i in range(len(segments))]
+
+            # Step 3: Create concat file
+            update_job_status(job_id, 30, "Creating concat file")
+            concat_file = create_concat_file(segment_files, work_dir)
+
+            # Step 4: Concatenate videos
+            update_job_status(job_id, 50, "Concatenating video segments")
+            final_video = await asyncio.to_thread(concatenate_videos, concat_file, work_dir)
+
+            # Step 5: Add BGM (optional)
+            if options.bgm_url:
+                update_job_status(job_id, 70, "Adding background music")
+                final_video = await add_background_music(
+                    final_video,
+                    options.bgm_url,
+                    options.bgm_volume,
+                    work_dir
+                )
+
+            try:
+                combine_cache.store(project_id, format_key, reference, list(zip(fingerprints, segment_files)),
+                                    output_key, final_video)
+            except OSError as e:
+                logger.warning(f"Job {job_id}: could not cache artifacts: {e}")
+
+    # Step 6: Upload to storage
+    update_job_status(job_id, 90, "Uploading final video")
+    video_id = new_video_id(project_id)
+    final_url = await upload_to_storage(final_video, project_id, video_id)
+    return final_video, video_id, final_url
+
+
+async def combine_preview(
+    job_id: str,
+    project_id: str,
+    segments: List[VideoSegment],
+    options: CombineOptions,
+    work_dir: Path
+):
+    """
+    Quick proxy for checking order and BGM: stream-copy concat of the segments,
+    only mismatched ones re-encoded ultrafast (all of them with PREVIEW_RESOLUTION)
+    """
+    update_job_status(job_id, 10, "Downloading video segments")
+    segment_files = await download_segments(segments, work_dir)
+
+    update_job_status(job_id, 30, "Rendering preview")
+    segment_files, _ = await prepare_for_concat(
+        segment_files,
+        work_dir,
+        resolution=PREVIEW_RESOLUTION,
+        aspect_ratio=options.aspect_ratio,
+        fps=PREVIEW_FPS if PREVIEW_RESOLUTION else None,
+        preset=PREVIEW_PRESET,
+        crf=PREVIEW_CRF
+    )
+    final_video = await asyncio.to_thread(concatenate_videos, create_concat_file(segment_files, work_dir), work_dir)
+
+    if options.bgm_url:
+        update_job_status(job_id, 70, "Adding background music")
+        final_video = await add_background_music(final_video, options.bgm_url, options.bgm_volume, work_dir)
+
+    update_job_status(job_id, 90, "Uploading preview")
+    video_id = new_video_id(f"{project_id}_preview")
+    final_url = await upload_to_storage(final_video, project_id, video_id)
+    return final_video, video_id, final_url
+
+
+async def combine_streaming(
+    job_id: str,
+    project_id: str,
+    segments: List[VideoSegment],
+    options: CombineOptions,
+    work_dir: Path
+):
+    """Download, concat and upload at the same time; returns (final video, video id, url)"""
+    update_job_status(job_id, 10, "Downloading and combining video segments")
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    done = set()
+
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        async def download(index: int, segment: VideoSegment) -> Path:
+            async with semaphore:
+                return await download_segment(client, index, segment, work_dir)
+
+        prepared = prepare_segments(
+            [download(i, s) for i, s in enumerate(segments)],
+            work_dir,
+            resolution=options.resolution,
+            aspect_ratio=options.aspect_ratio,
+            fps=options.fps,
+            preset=options.preset
+        )
+        try:
+            bgm_file = await download_bgm(options.bgm_url, work_dir) if options.bgm_url else None
+        except Exception:
+            for task in prepared:
+                task.cancel()
+            raise
+
+        def on_segment(index: int):
+            done.add(index)
+            update_job_status(job_id, 10 + 80 * len(done) // len(segments),
+                              f"Combined segment {len(done)}/{len(segments)}")
+
+        video_id = new_video_id(project_id)
+        final_url, final_video = await stream_combine(
+            prepared,
+            work_dir,
+            lambda chunks: upload_stream(chunks, video_id),
+            bgm_file=bgm_file,
+            bgm_volume=options.bgm_volume,
+            on_segment=on_segment
+        )
+
+    return final_video, video_id, final_url
 
 
 # ==================== Helper Functions ====================
@@ -523,30 +986,38 @@ def update_job_status(job_id: str, progress: int, step: str):
         jobs[job_id]["progress_percentage"] = progress
         jobs[job_id]["current_step"] = step
         logger.info(f"Job {job_id}: {progress}% - {step}")
+        job_events.publish_combine_job(jobs[job_id])
 
 
-async def download_segments(segments: List[VideoSegment], work_dir: Path) -> List[Path]:
-    segment_files = []
+async def download_segment(client: httpx.AsyncClient, index: int, segment: VideoSegment, work_dir: Path) -> Path:
+    segment_path = work_dir / f"segment_{index}.mp4"
 
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        for i, segment in enumerate(segments):
-            segment_path = work_dir / f"segment_{i}.mp4"
+    try:
+        logger.info(f"Downloading segment {index}: {segment.video_url[:100]}...")
+        response = await client.get(segment.video_url)
+        response.raise_for_status()
 
-            try:
-                logger.info(f"Downloading segment {i}: {segment.video_url[:100]}...")
-                response = await client.get(segment.video_url)
-                response.raise_for_status()
+        with open(segment_path, 'wb') as f:
+            f.write(response.content)
 
-                with open(segment_path, 'wb') as f:
-                    f.write(response.content)
+        logger.info(f"Downloaded segment {index}: {segment.type} ({len(response.content)} bytes)")
+        return segment_path
 
-                segment_files.append(segment_path)
-                logger.info(f"Downloaded segment {i}: {segment.type} ({len(response.content)} bytes)")
+    except Exception as e:
+        raise Exception(f"Failed to download segment {index} ({segment.type}): {str(e)}")
 
-            except Exception as e:
-                raise Exception(f"Failed to download segment {i} ({segment.type}): {str(e)}")
 
-    return segment_files
+async def download_segments(segments: List[VideoSegment], work_dir: Path,
+                            indices: Optional[List[int]] = None) -> List[Path]:
+    indices = indices if indices is not None else list(range(len(segments)))
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        async def download(index: int, segment: VideoSegment) -> Path:
+            async with semaphore:
+                return await download_segment(client, index, segment, work_dir)
+
+        return list(await asyncio.gather(*(download(i, s) for i, s in zip(indices, segments))))
 
 
 def create_concat_file(segment_files: List[Path], work_dir: Path) -> Path:
@@ -568,6 +1039,7 @@ def concatenate_videos(concat_file: Path, work_dir: Path) -> Path:
         '-safe', '0',
         '-i', str(concat_file),
         '-c', 'copy',
+        '-movflags', '+faststart',  # moov atom first: playback starts before the download ends
         str(output_file)
     ]
 
@@ -580,12 +1052,7 @@ def concatenate_videos(concat_file: Path, work_dir: Path) -> Path:
     return output_file
 
 
-async def add_background_music(
-    video_file: Path,
-    bgm_url: str,
-    volume: float,
-    work_dir: Path
-) -> Path:
+async def download_bgm(bgm_url: str, work_dir: Path) -> Path:
     bgm_file = work_dir / "bgm.mp3"
 
     async with httpx.AsyncClient(timeout=60.0) as client:
@@ -595,6 +1062,16 @@ async def add_background_music(
         with open(bgm_file, 'wb') as f:
             f.write(response.content)
 
+    return bgm_file
+
+
+async def add_background_music(
+    video_file: Path,
+    bgm_url: str,
+    volume: float,
+    work_dir: Path
+) -> Path:
+    bgm_file = await download_bgm(bgm_url, work_dir)
     output_file = work_dir / "final_with_bgm.mp4"
 
     cmd = [
@@ -604,10 +1081,12 @@ async def add_background_music(
         '-filter_complex', f'[1:a]volume={volume}[a1];[0:a][a1]amix=inputs=2:normalize=1',
         '-c:v', 'copy',
         '-shortest',
+        '-movflags', '+faststart',
         str(output_file)
     ]
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    # In a thread: other renders (and previews) keep running meanwhile
+    result = await asyncio.to_thread(subprocess.run, cmd, capture_output=True, text=True)
 
     if result.returncode != 0:
         raise Exception(f"FFmpeg BGM mixing failed: {result.stderr}")
@@ -616,55 +1095,157 @@ async def add_background_music(
     return output_file
 
 
-async def upload_to_storage(video_file: Path, project_id: str) -> str:
-    supabase_url = os.getenv('SUPABASE_URL')
-    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+def package_hls(video_file: Path, work_dir: Path, segment_seconds: int) -> Path:
+    """Remux the final video into a fragmented-MP4 HLS rendition (no re-encode)"""
+    hls_dir = work_dir / "hls"
+    hls_dir.mkdir(parents=True, exist_ok=True)
+
+    cmd = [
+        'ffmpeg', '-y',
+        '-i', str(video_file),
+        '-c', 'copy',
+        '-f', 'hls',
+        '-hls_time', str(segment_seconds),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4',
+        '-hls_fmp4_init_filename', 'init.mp4',
+        '-hls_segment_filename', str(hls_dir / 'segment_%03d.m4s'),
+        str(hls_dir / HLS_MANIFEST)
+    ]
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+
+    if result.returncode != 0:
+        raise Exception(f"FFmpeg HLS packaging failed: {result.stderr}")
+
+    logger.info("HLS rendition packaged successfully")
+    return hls_dir
+
+
+def supabase_storage_configured() -> bool:
+    return bool(os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
 
-    if not supabase_url or not supabase_key:
-        logger.warning("Supabase not configured, using local storage fallback")
-        video_id = f"{project_id}_{uuid.uuid4().hex[:8]}"
-        
-        persistent_dir = Path(tempfile.gettempdir()) / "sparkfluence_videos"
-        persistent_dir.mkdir(parents=True, exist_ok=True)
-        persistent_path = persistent_dir / f"{video_id}.mp4"
-        
-        shutil.copy(video_file, persistent_path)
-        completed_videos[video_id] = str(persistent_path)
-        logger.info(f"Video stored locally: {video_id} -> {persistent_path}")
-        
-        return f"http://localhost:8000/api/video/{video_id}"
 
+def new_video_id(project_id: str) -> str:
+    """Storage name of a combined video (and folder of its rendition)"""
+    if not supabase_storage_configured():
+        return f"{project_id}_{uuid.uuid4().hex[:8]}"
     timestamp = int(asyncio.get_event_loop().time() * 1000)
-    file_name = f"{project_id}_{timestamp}.mp4"
-    
-    logger.info(f"Uploading to Supabase Storage: final-videos/{file_name}")
+    return f"{project_id}_{timestamp}"
+
+
+async def upload_file(local_file: Path, object_name: str) -> str:
+    """Store one output file as final-videos/<object_name>; returns its public URL"""
+    content_type = STORAGE_CONTENT_TYPES.get(local_file.suffix, 'application/octet-stream')
+
+    if not supabase_storage_configured():
+        persistent_path = VIDEO_STORAGE_DIR / object_name
+        persistent_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(local_file, persistent_path)
+        logger.info(f"Stored locally: {object_name} -> {persistent_path}")
+        return f"http://localhost:8000/api/video/{object_name}"
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    logger.info(f"Uploading to Supabase Storage: {STORAGE_BUCKET}/{object_name}")
 
-    with open(video_file, 'rb') as f:
-        video_data = f.read()
+    with open(local_file, 'rb') as f:
+        data = f.read()
 
     async with httpx.AsyncClient(timeout=120.0) as client:
-        upload_url = f"{supabase_url}/storage/v1/object/final-videos/{file_name}"
+        upload_url = f"{supabase_url}/storage/v1/object/{STORAGE_BUCKET}/{object_name}"
         
         response = await client.post(
             upload_url,
             headers={
                 'Authorization': f'Bearer {supabase_key}',
-                'Content-Type': 'video/mp4',
+                'Content-Type': content_type,
                 'x-upsert': 'true'
             },
-            content=video_data
+            content=data
         )
 
         if response.status_code not in [200, 201]:
             logger.error(f"Upload failed: {response.status_code} - {response.text}")
             raise Exception(f"Upload failed: {response.text}")
 
-    public_url = f"{supabase_url}/storage/v1/object/public/final-videos/{file_name}"
+    public_url = f"{supabase_url}/storage/v1/object/public/{STORAGE_BUCKET}/{object_name}"
     logger.info(f"Upload successful: {public_url}")
     
     return public_url
 
 
+async def upload_to_storage(video_file: Path, project_id: str, video_id: Optional[str] = None) -> str:
+    video_id = video_id or new_video_id(project_id)
+
+    if not supabase_storage_configured():
+        logger.warning("Supabase not configured, using local storage fallback")
+        await upload_file(video_file, f"{video_id}.mp4")
+        completed_videos[video_id] = str(VIDEO_STORAGE_DIR / f"{video_id}.mp4")
+        await asyncio.to_thread(scratch.enforce_video_quota, video_id)
+        logger.info(f"Video stored locally: {video_id}")
+        return f"http://localhost:8000/api/video/{video_id}"
+
+    return await upload_file(video_file, f"{video_id}.mp4")
+
+
+async def upload_stream(chunks: AsyncIterator[bytes], video_id: str) -> str:
+    """Upload a video while it is still being produced (chunked request body); returns its URL"""
+    object_name = f"{video_id}.mp4"
+
+    if not supabase_storage_configured():
+        persistent_path = VIDEO_STORAGE_DIR / object_name
+        partial_path = persistent_path.with_suffix('.part')
+        persistent_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(partial_path, 'wb') as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+            partial_path.replace(persistent_path)
+        finally:
+            partial_path.unlink(missing_ok=True)
+        completed_videos[video_id] = str(persistent_path)
+        await asyncio.to_thread(scratch.enforce_video_quota, video_id)
+        logger.info(f"Video streamed to local storage: {video_id}")
+        return f"http://localhost:8000/api/video/{video_id}"
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    logger.info(f"Streaming upload to Supabase Storage: {STORAGE_BUCKET}/{object_name}")
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(120.0, write=None)) as client:
+        response = await client.post(
+            f"{supabase_url}/storage/v1/object/{STORAGE_BUCKET}/{object_name}",
+            headers={
+                'Authorization': f'Bearer {supabase_key}',
+                'Content-Type': STORAGE_CONTENT_TYPES['.mp4'],
+                'x-upsert': 'true'
+            },
+            content=chunks
+        )
+
+        if response.status_code not in [200, 201]:
+            logger.error(f"Upload failed: {response.status_code} - {response.text}")
+            raise Exception(f"Upload failed: {response.text}")
+
+    return f"{supabase_url}/storage/v1/object/public/{STORAGE_BUCKET}/{object_name}"
+
+
+async def upload_rendition(rendition_dir: Path, video_id: str) -> str:
+    """Upload an HLS rendition next to the final video; returns the manifest URL"""
+    semaphore = asyncio.Semaphore(RENDITION_UPLOAD_CONCURRENCY)
+
+    async def upload(path: Path) -> str:
+        async with semaphore:
+            return await upload_file(path, f"{video_id}/{path.name}")
+
+    files = sorted(p for p in rendition_dir.iterdir() if p.is_file())
+    # Segments first, manifest last: a visible manifest never points at missing segments
+    media = [p for p in files if p.name != HLS_MANIFEST]
+    await asyncio.gather(*(upload(p) for p in media))
+    return await upload(rendition_dir / HLS_MANIFEST)
+
+
 def get_video_metadata(video_file: Path) -> Dict[str, Any]:
     cmd = [
         'ffprobe',
@@ -710,14 +1291,6 @@ def get_video_metadata(video_file: Path) -> Dict[str, Any]:
     }
 
 
-def cleanup_directory(directory: Path):
-    try:
-        shutil.rmtree(directory)
-        logger.info(f"Cleaned up directory: {directory}")
-    except Exception as e:
-        logger.warning(f"Cleanup failed: {str(e)}")
-
-
 def check_ffmpeg_available() -> bool:
     try:
         subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
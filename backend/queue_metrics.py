@@ -0,0 +1,241 @@
+"""
+Sparkfluence Queue Metrics
+Autoscaling signals for the image, video and combine queues.
+
+For every queue an in-memory aggregate keeps the active jobs (pending /
+processing counts, age of the oldest pending job) and the jobs that finished
+within the largest window. GET /api/worker/queues reads the aggregate only;
+it is kept current incrementally:
+
+- image / video: a refresh every QUEUE_METRICS_REFRESH seconds counts the
+  active rows (count=exact over the partial queue indexes; reading the rows
+  would stop at PostgREST's max-rows, 1000 on Supabase, just when the
+  backlog is large), reads the oldest pending job, and pages through the
+  rows that finished since the last refresh ((updated_at, id) keyset, so
+  rows sharing one NOW() are never skipped), never the whole history; rows
+  the embedded worker finishes arrive in between through its update listener
+- combine: main records each in-memory combine job as it is queued, starts
+  rendering and finishes. Combine jobs live in the process that accepted
+  them, so combine figures cover this process only; sum them over the API
+  processes (or scale combine capacity per process)
+
+Only the elected worker leader refreshes periodically (every process when
+there is no election, i.e. WORKER_MODE standalone / disabled). Other processes
+refresh on demand when their snapshot is requested and older than
+QUEUE_METRICS_REFRESH, so the DB load does not grow with the process count.
+
+Per queue the snapshot reports pending / processing counts, the age of the
+oldest pending job, completions and throughput over sliding windows, and
+the estimated time to drain the backlog at the observed throughput.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('QueueMetrics')
+
+QUEUE_METRICS_REFRESH = int(os.getenv('QUEUE_METRICS_REFRESH', '15'))  # seconds between DB refreshes
+WINDOWS = (60, 300, 900)  # sliding windows, seconds
+DRAIN_WINDOW = 300  # throughput used for the drain estimate
+FINISHED_PAGE_SIZE = 1000  # finished rows per request (within PostgREST's max-rows)
+
+PENDING, PROCESSING, COMPLETED, FAILED = 0, 1, 2, 3
+
+# Job tables and their queue names
+QUEUE_TABLES = {
+    'image_generation_jobs': 'image',
+    'video_generation_jobs': 'video'
+}
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds of a PostgREST timestamp (ISO 8601), None if missing or invalid"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+class QueueStats:
+    """Active jobs and recent completions of one queue"""
+
+    def __init__(self):
+        self.active: Dict[str, Tuple[int, float]] = {}  # job id -> (status, created at), jobs tracked in memory
+        self.counts: Optional[Tuple[int, int, Optional[float]]] = None  # counted in the DB: (pending, processing, oldest pending created at)
+        self.finished: Deque[Tuple[float, str, bool]] = deque()  # (finished at, job id, succeeded), oldest first
+        self.finished_ids: Dict[str, float] = {}
+
+    def update(self, job_id: str, status: int, created_at: Optional[float] = None,
+               finished_at: Optional[float] = None):
+        """Apply one job's current state"""
+        now = time.time()
+        if status in (PENDING, PROCESSING):
+            self.finished_ids.pop(job_id, None)  # retried after finishing
+            previous = self.active.get(job_id)
+            self.active[job_id] = (status, created_at or (previous[1] if previous else now))
+            return
+
+        self.active.pop(job_id, None)
+        if status not in (COMPLETED, FAILED) or job_id in self.finished_ids:
+            return
+        finished_at = min(finished_at or now, now)
+        if finished_at < now - WINDOWS[-1]:
+            return
+        self.finished_ids[job_id] = finished_at
+        if self.finished and finished_at < self.finished[-1][0]:
+            # Out of order (a refresh page older than a listener update): keep the deque sorted
+            self.finished = deque(sorted((*self.finished, (finished_at, job_id, status == COMPLETED))))
+        else:
+            self.finished.append((finished_at, job_id, status == COMPLETED))
+
+    def set_counts(self, pending: int, processing: int, oldest_pending_at: Optional[float]):
+        """Active jobs as counted in the DB (replaces the in-memory active set)"""
+        self.counts = (pending, processing, oldest_pending_at)
+
+    def _expire(self, now: float):
+        while self.finished and self.finished[0][0] < now - WINDOWS[-1]:
+            _, job_id, _ = self.finished.popleft()
+            self.finished_ids.pop(job_id, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        self._expire(now)
+
+        if self.counts is not None:
+            pending, processing, oldest_pending_at = self.counts
+        else:
+            created = [created for status, created in self.active.values() if status == PENDING]
+            pending, processing = len(created), len(self.active) - len(created)
+            oldest_pending_at = min(created) if created else None
+
+        windows = {}
+        for window in WINDOWS:
+            recent = [succeeded for finished_at, _, succeeded in self.finished if finished_at >= now - window]
+            completed = sum(recent)
+            windows[f"{window}s"] = {
+                "completed": completed,
+                "failed": len(recent) - completed,
+                "per_minute": round(len(recent) * 60 / window, 2)
+            }
+
+        # Backlog at the recent throughput; None when nothing finished lately (not draining)
+        backlog = pending + processing
+        throughput = windows[f"{DRAIN_WINDOW}s"]["per_minute"] / 60
+        if backlog == 0:
+            drain_seconds = 0
+        elif throughput > 0:
+            drain_seconds = round(backlog / throughput)
+        else:
+            drain_seconds = None
+
+        return {
+            "pending": pending,
+            "processing": processing,
+            "oldest_pending_age_seconds": max(round(now - oldest_pending_at), 0) if pending and oldest_pending_at else 0,
+            "windows": windows,
+            "estimated_drain_seconds": drain_seconds
+        }
+
+
+class QueueMetrics:
+    """Aggregates of every queue, refreshed incrementally"""
+
+    def __init__(self, fetch: Optional[Callable[[str, Dict[str, str]], Awaitable[List[Dict]]]] = None,
+                 count: Optional[Callable[[str, Dict[str, str]], Awaitable[int]]] = None,
+                 queues: Tuple[str, ...] = ('image', 'video', 'combine')):
+        """
+        fetch(table, postgrest params) reads job rows, count(table, postgrest
+        params) counts them; without them only recorded jobs are counted
+        """
+        self.fetch = fetch
+        self.count = count
+        self.queues = {name: QueueStats() for name in queues}
+        since = datetime.now(timezone.utc) - timedelta(seconds=WINDOWS[-1])
+        # (updated_at, id) of the last finished row seen
+        self.watermarks: Dict[str, Tuple[str, Optional[str]]] = {table: (since.isoformat(), None) for table in QUEUE_TABLES}
+        self.refreshed_at: Optional[float] = None
+        self._refresh_lock = asyncio.Lock()
+
+    def record(self, queue: str, job_id: str, status: int):
+        """Record a state change of a job tracked in memory (combine jobs)"""
+        self.queues[queue].update(job_id, status)
+
+    def record_row(self, table: str, row: Dict):
+        """Apply a job row written by this process (SupabaseClient update listener, inserts)"""
+        queue = QUEUE_TABLES.get(table)
+        if not queue or not row or not row.get('id') or row.get('status') is None:
+            return
+        if self.fetch and row['status'] in (PENDING, PROCESSING):
+            return  # active jobs of DB queues are counted by refresh()
+        finished_at = parse_timestamp(row.get('completed_at') or row.get('updated_at'))
+        self.queues[queue].update(row['id'], row['status'], parse_timestamp(row.get('created_at')), finished_at)
+
+    async def refresh(self):
+        """Re-count the active rows and read the rows finished since the last refresh"""
+        if not self.fetch or not self.count:
+            return
+        for table, queue in QUEUE_TABLES.items():
+            stats = self.queues[queue]
+            pending = await self.count(table, {'status': f'eq.{PENDING}'})
+            processing = await self.count(table, {'status': f'eq.{PROCESSING}'})
+            oldest = await self.fetch(table, {
+                'status': f'eq.{PENDING}',
+                'select': 'created_at',
+                'order': 'created_at.asc',
+                'limit': '1'
+            }) if pending else []
+            stats.set_counts(pending, processing, parse_timestamp(oldest[0].get('created_at')) if oldest else None)
+
+            while True:
+                params = {
+                    'status': f'in.({COMPLETED},{FAILED})',
+                    'select': 'id,status,updated_at,completed_at',
+                    'order': 'updated_at.asc,id.asc',
+                    'limit': str(FINISHED_PAGE_SIZE)
+                }
+                updated_at, last_id = self.watermarks[table]
+                if last_id is None:
+                    params['updated_at'] = f'gt.{updated_at}'
+                else:
+                    # Rows finished in one statement share updated_at (NOW()): page on (updated_at, id)
+                    params['or'] = f'(updated_at.gt."{updated_at}",and(updated_at.eq."{updated_at}",id.gt."{last_id}"))'
+                finished = await self.fetch(table, params)
+                for row in finished:
+                    finished_at = parse_timestamp(row.get('completed_at') or row.get('updated_at'))
+                    stats.update(row['id'], row['status'], finished_at=finished_at)
+                if finished:
+                    self.watermarks[table] = (finished[-1]['updated_at'], finished[-1]['id'])
+                if len(finished) < FINISHED_PAGE_SIZE:
+                    break
+        self.refreshed_at = time.time()
+
+    async def refresh_if_stale(self):
+        """Refresh when the last refresh is older than QUEUE_METRICS_REFRESH (concurrent callers share one)"""
+        async with self._refresh_lock:
+            if self.refreshed_at is None or time.time() - self.refreshed_at >= QUEUE_METRICS_REFRESH:
+                await self.refresh()
+
+    async def run(self, should_refresh: Callable[[], bool] = lambda: True):
+        """Refresh periodically while should_refresh() (e.g. while this process is the worker leader)"""
+        while True:
+            if should_refresh():
+                try:
+                    await self.refresh_if_stale()
+                except Exception as e:
+                    logger.warning(f"[METRICS] Queue refresh failed: {e}")
+            await asyncio.sleep(QUEUE_METRICS_REFRESH)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "queues": {name: stats.snapshot() for name, stats in self.queues.items()},
+            "refreshed_at": datetime.fromtimestamp(self.refreshed_at, timezone.utc).isoformat() if self.refreshed_at else None,
+            "refresh_interval_seconds": QUEUE_METRICS_REFRESH,
+            "windows_seconds": list(WINDOWS)
+        }
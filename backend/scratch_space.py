@@ -0,0 +1,213 @@
+"""
+Sparkfluence Scratch Space
+Work directories, disk admission and cleanup for combine jobs.
+
+- Work dirs (sparkfluence_<job_id>) live under SCRATCH_DIR; small jobs can
+  use a RAM disk instead (SCRATCH_TMPFS_DIR, e.g. /dev/shm/sparkfluence,
+  for jobs up to SCRATCH_TMPFS_MAX_JOB_MB)
+- admit() reserves an estimate of a job's disk use before it is accepted and
+  refuses it (503) when free space minus other reservations would drop below
+  SCRATCH_MIN_FREE_MB
+- fallback videos in VIDEO_STORAGE_DIR are evicted least recently used first
+  once they exceed VIDEO_STORAGE_MAX_MB
+- a sweeper (startup + every SCRATCH_SWEEP_INTERVAL) removes work dirs no
+  running job owns, e.g. after a crash, plus abandoned partial uploads
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+SCRATCH_DIR = Path(os.getenv('SCRATCH_DIR', tempfile.gettempdir()))
+SCRATCH_TMPFS_DIR = os.getenv('SCRATCH_TMPFS_DIR')  # unset: no RAM disk
+SCRATCH_TMPFS_MAX_JOB_MB = int(os.getenv('SCRATCH_TMPFS_MAX_JOB_MB', '512'))
+SCRATCH_MIN_FREE_MB = int(os.getenv('SCRATCH_MIN_FREE_MB', '1024'))
+SCRATCH_SWEEP_INTERVAL = int(os.getenv('SCRATCH_SWEEP_INTERVAL', '600'))  # seconds
+SCRATCH_ORPHAN_AGE = int(os.getenv('SCRATCH_ORPHAN_AGE', '7200'))  # work dirs untouched this long are orphans
+VIDEO_STORAGE_MAX_MB = int(os.getenv('VIDEO_STORAGE_MAX_MB', '10240'))
+
+WORK_DIR_PREFIX = 'sparkfluence_job_'
+# Source bitrate guess (~10 Mbit/s 1080p) and copies of it a job keeps on disk
+# (download, re-encode, concat, BGM mix / HLS)
+ESTIMATED_BYTES_PER_SECOND = int(1.25 * MB)
+ESTIMATED_COPIES = 4
+
+
+class ScratchSpace:
+    """Work dirs and disk budget of combine jobs, LRU quota of fallback videos"""
+
+    def __init__(self, video_dir: Path, on_evict: Optional[Callable[[str], None]] = None,
+                 root: Path = SCRATCH_DIR, tmpfs_root: Optional[str] = SCRATCH_TMPFS_DIR):
+        """on_evict(video_id) is called for every fallback video removed by the quota"""
+        self.video_dir = video_dir
+        self.on_evict = on_evict
+        self.root = root
+        self.tmpfs_root = Path(tmpfs_root) if tmpfs_root else None
+        self.reservations: Dict[str, Tuple[Path, int]] = {}  # job_id -> (root, bytes)
+        self.work_dirs: Dict[str, Path] = {}
+        self.video_access: Dict[str, float] = {}  # video_id -> last served
+
+    # ---------- admission ----------
+
+    @staticmethod
+    def estimate_job_bytes(duration_seconds: float) -> int:
+        return int(max(duration_seconds, 1) * ESTIMATED_BYTES_PER_SECOND * ESTIMATED_COPIES)
+
+    def _available(self, root: Path) -> int:
+        """Free bytes on root's filesystem minus what admitted jobs may still write there"""
+        try:
+            free = shutil.disk_usage(root).free
+        except OSError:
+            return 0
+        reserved = sum(size for r, size in self.reservations.values() if r == root)
+        return free - reserved
+
+    def admit(self, job_id: str, estimated_bytes: int) -> bool:
+        """Reserve disk space for a job; False when there isn't enough"""
+        roots = [self.root]
+        if self.tmpfs_root and estimated_bytes <= SCRATCH_TMPFS_MAX_JOB_MB * MB:
+            roots.insert(0, self.tmpfs_root)
+
+        for root in roots:
+            try:
+                root.mkdir(parents=True, exist_ok=True)
+            except OSError:
+                continue
+            # The RAM disk has no safety margin to give: the job must simply fit
+            margin = 0 if root == self.tmpfs_root else SCRATCH_MIN_FREE_MB * MB
+            if self._available(root) - estimated_bytes >= margin:
+                self.reservations[job_id] = (root, estimated_bytes)
+                return True
+
+        logger.warning(f"[SCRATCH] Refusing {job_id}: needs ~{estimated_bytes // MB} MB")
+        return False
+
+    def create_work_dir(self, job_id: str) -> Path:
+        """The job's work dir, on the filesystem it was admitted to"""
+        root = self.reservations.get(job_id, (self.root, 0))[0]
+        work_dir = root / f"sparkfluence_{job_id}"
+        work_dir.mkdir(parents=True, exist_ok=True)
+        self.work_dirs[job_id] = work_dir
+        return work_dir
+
+    def release(self, job_id: str):
+        """Remove the job's work dir and return its reservation"""
+        self.reservations.pop(job_id, None)
+        work_dir = self.work_dirs.pop(job_id, None)
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            logger.info(f"Cleaned up directory: {work_dir}")
+
+    # ---------- fallback video quota ----------
+
+    def touch_video(self, video_id: str):
+        """Record that a fallback video was served (eviction is least recently used first)"""
+        self.video_access[video_id] = time.time()
+
+    def _stored_videos(self) -> List[Tuple[float, str, int, List[Path]]]:
+        """(last use, video id, bytes, paths) of every stored video and its rendition dir"""
+        videos: Dict[str, Tuple[float, int, List[Path]]] = {}
+        try:
+            entries = list(self.video_dir.iterdir())
+        except OSError:
+            return []
+        for path in entries:
+            if path.suffix == '.part':
+                continue  # upload in progress
+            video_id = path.stem if path.is_file() else path.name
+            try:
+                if path.is_dir():
+                    size = sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+                else:
+                    size = path.stat().st_size
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            used, total, paths = videos.get(video_id, (0.0, 0, []))
+            videos[video_id] = (max(used, mtime, self.video_access.get(video_id, 0.0)), total + size, paths + [path])
+        return sorted((used, video_id, size, paths) for video_id, (used, size, paths) in videos.items())
+
+    def enforce_video_quota(self, keep: Optional[str] = None):
+        """Evict least recently used fallback videos above VIDEO_STORAGE_MAX_MB (never `keep`)"""
+        videos = self._stored_videos()
+        total = sum(size for _, _, size, _ in videos)
+        limit = VIDEO_STORAGE_MAX_MB * MB
+        for _, video_id, size, paths in videos:
+            if total <= limit:
+                break
+            if video_id == keep:
+                continue
+            for path in paths:
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+            total -= size
+            self.video_access.pop(video_id, None)
+            if self.on_evict:
+                self.on_evict(video_id)
+            logger.info(f"[SCRATCH] Evicted video {video_id} ({size // MB} MB)")
+
+    # ---------- sweeper ----------
+
+    def sweep(self, min_age: int = SCRATCH_ORPHAN_AGE) -> int:
+        """Remove work dirs and partial uploads nobody owns; returns how many were removed"""
+        active = {d.resolve() for d in self.work_dirs.values()}
+        cutoff = time.time() - min_age
+        removed = 0
+
+        roots = [self.root] + ([self.tmpfs_root] if self.tmpfs_root else [])
+        candidates = []
+        for root in roots:
+            try:
+                candidates += [p for p in root.iterdir() if p.name.startswith(WORK_DIR_PREFIX) and p.is_dir()]
+            except OSError:
+                continue
+        try:
+            candidates += list(self.video_dir.glob('*.part'))
+        except OSError:
+            pass
+
+        for path in candidates:
+            try:
+                # Other processes (uvicorn workers) may own young dirs: only take stale ones
+                if path.resolve() in active or path.stat().st_mtime > cutoff:
+                    continue
+            except OSError:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            removed += 1
+            logger.info(f"[SCRATCH] Removed orphan {path}")
+        return removed
+
+    async def run_sweeper(self):
+        """Sweep at startup and then periodically, enforcing the video quota too"""
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+                await asyncio.to_thread(self.enforce_video_quota)
+            except Exception as e:
+                logger.warning(f"[SCRATCH] Sweep failed: {e}")
+            await asyncio.sleep(SCRATCH_SWEEP_INTERVAL)
+
+    def stats(self) -> Dict[str, float]:
+        stored = self._stored_videos()
+        return {
+            "active_jobs": len(self.reservations),
+            "reserved_mb": round(sum(size for _, size in self.reservations.values()) / MB, 1),
+            "scratch_free_mb": round(max(self._available(self.root), 0) / MB, 1),
+            "stored_videos": len(stored),
+            "stored_videos_mb": round(sum(size for _, _, size, _ in stored) / MB, 1)
+        }
@@ -0,0 +1,241 @@
+"""
+Sparkfluence Video Delivery
+HTTP range and conditional request support for locally stored videos.
+
+Starlette's FileResponse (0.35) ignores Range headers, so every seek in a
+video player re-downloads the whole MP4. RangeFileResponse implements:
+
+- single ranges (206 + Content-Range) and multiple ranges
+  (206 multipart/byteranges); unsatisfiable ranges get 416
+- ETag / Last-Modified with If-None-Match / If-Modified-Since (304)
+  and If-Range
+- zero-copy bodies when the ASGI server offers the
+  http.response.zerocopy or http.response.pathsend extensions,
+  chunked reads in a thread otherwise (uvicorn)
+
+accel_redirect_response() hands delivery to nginx instead (X-Accel-Redirect
+to an `internal` location, see nginx.conf), so Python never touches the bytes.
+"""
+
+import os
+import stat
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+MAX_RANGES = 16  # more ranges than this (after merging) are answered with the full file
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def parse_range_header(value: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse "bytes=a-b, c-, -n" into sorted, merged, inclusive (start, end) pairs.
+    Returns None for a malformed/unsupported header (serve the full file) and
+    [] when no range is satisfiable (416).
+    """
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        start, sep, end = part.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if not start:
+                # Suffix range: last n bytes
+                length = int(end)
+                if length <= 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            first = int(start)
+            last = int(end) if end else None
+        except ValueError:
+            return None
+        if last is not None and first > last:
+            return None  # syntactically invalid: ignore the header
+        if first >= size:
+            continue  # unsatisfiable
+        last = size - 1 if last is None else last
+        ranges.append((first, min(last, size - 1)))
+
+    ranges.sort()
+    merged: List[Tuple[int, int]] = []
+    for first, last in ranges:
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+class RangeFileResponse(Response):
+    """File response with Range, conditional request and zero-copy support"""
+
+    def __init__(self, path: str, media_type: str = "video/mp4", headers: Optional[dict] = None,
+                 chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.media_type = media_type
+        self.chunk_size = chunk_size
+        self.background = None
+        self.status_code = 200
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+
+    def _not_modified(self, request: Headers, etag: str, mtime: float) -> bool:
+        if_none_match = request.get('if-none-match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or f"W/{etag}" in tags
+        if_modified_since = request.get('if-modified-since')
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _range_applies(self, request: Headers, etag: str, last_modified: str) -> bool:
+        """If-Range: only honour Range when the client's copy is current"""
+        if_range = request.get('if-range')
+        if if_range is None:
+            return True
+        return if_range.strip() in (etag, last_modified)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        except FileNotFoundError:
+            raise RuntimeError(f"File at path {self.path} does not exist.")
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise RuntimeError(f"File at path {self.path} is not a file.")
+
+        request = Headers(scope=scope)
+        size = stat_result.st_size
+        etag = make_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = last_modified
+        head_only = scope["method"].upper() == "HEAD"
+
+        if self._not_modified(request, etag, stat_result.st_mtime):
+            del self.headers["content-type"]
+            await self._send_start(send, 304)
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        ranges = None
+        range_header = request.get('range')
+        if range_header and self._range_applies(request, etag, last_modified):
+            ranges = parse_range_header(range_header, size)
+            if ranges is not None and len(ranges) > MAX_RANGES:
+                ranges = None
+
+        if ranges == []:
+            self.headers["content-range"] = f"bytes */{size}"
+            self.headers["content-length"] = "0"
+            await self._send_start(send, 416)
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if not ranges:
+            self.headers["content-length"] = str(size)
+            await self._send_start(send, 200)
+            if head_only:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            elif "http.response.pathsend" in scope.get("extensions", {}):
+                await send({"type": "http.response.pathsend", "path": str(self.path)})
+            else:
+                await self._send_file(scope, send, [(0, size - 1)] if size else [], [b""], last=True)
+            return
+
+        if len(ranges) == 1:
+            first, last = ranges[0]
+            self.headers["content-range"] = f"bytes {first}-{last}/{size}"
+            self.headers["content-length"] = str(last - first + 1)
+            await self._send_start(send, 206)
+            if head_only:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            else:
+                await self._send_file(scope, send, ranges, [b""], last=True)
+            return
+
+        # Multiple ranges: multipart/byteranges
+        boundary = uuid.uuid4().hex
+        part_headers = [
+            (f"--{boundary}\r\nContent-Type: {self.media_type}\r\n"
+             f"Content-Range: bytes {first}-{last}/{size}\r\n\r\n").encode()
+            for first, last in ranges
+        ]
+        separators = [part_headers[0]] + [b"\r\n" + header for header in part_headers[1:]]
+        closing = f"\r\n--{boundary}--\r\n".encode()
+        length = sum(len(s) for s in separators) + sum(last - first + 1 for first, last in ranges) + len(closing)
+
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(length)
+        await self._send_start(send, 206)
+        if head_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        await self._send_file(scope, send, ranges, separators, last=False)
+        await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+    async def _send_start(self, send: Send, status_code: int):
+        self.status_code = status_code
+        await send({"type": "http.response.start", "status": status_code, "headers": self.raw_headers})
+
+    async def _send_file(self, scope: Scope, send: Send, ranges: List[Tuple[int, int]],
+                         prefixes: List[bytes], last: bool):
+        """Send each (inclusive) byte range, preceded by its prefix; zero-copy when the server supports it"""
+        zerocopy = "http.response.zerocopy" in scope.get("extensions", {})
+        if not ranges:
+            await send({"type": "http.response.body", "body": b"", "more_body": not last})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for i, ((first, end), prefix) in enumerate(zip(ranges, prefixes)):
+                final_range = last and i == len(ranges) - 1
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopy",
+                        "file": file.wrapped,
+                        "offset": first,
+                        "count": end - first + 1,
+                        "more_body": not final_range
+                    })
+                    continue
+
+                await file.seek(first)
+                remaining = end - first + 1
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0 or not final_range
+                    })
+
+
+def accel_redirect_response(internal_uri: str, media_type: str = "video/mp4",
+                            headers: Optional[dict] = None) -> Response:
+    """Empty response that tells nginx to serve internal_uri itself (ranges, sendfile, caching)"""
+    response = Response(status_code=200, media_type=media_type, headers=headers)
+    response.headers["x-accel-redirect"] = internal_uri
+    return response
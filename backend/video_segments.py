@@ -0,0 +1,286 @@
+"""
+Sparkfluence Video Segment Preflight & Normalization
+Makes downloaded segments safe to join with the concat demuxer's stream copy.
+
+`-c copy` only works when every segment has the same codec parameters
+(codec, resolution, pixel format, frame rate, timebase, audio layout).
+Instead of finding out from a failed (or silently broken) concat after
+everything was downloaded, segments are probed in parallel with ffprobe,
+grouped by codec signature, and only the segments outside the reference
+group (the one covering the most duration) are re-encoded to match it.
+
+Normalization (a target resolution / aspect ratio / frame rate) uses the
+same path with the target as the reference: every segment that differs is
+re-encoded. Encodes run as concurrent ffmpeg subprocesses, at most
+ENCODE_WORKERS at a time, and the CPU cores are split between them
+(x264 `-threads`), so N small encodes use the machine the way one big
+transcode would without oversubscribing it. See bench_normalize.py.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CPU_COUNT = os.cpu_count() or 1
+PROBE_CONCURRENCY = CPU_COUNT * 2  # ffprobe is I/O bound
+ENCODE_WORKERS = int(os.getenv('ENCODE_WORKERS', str(CPU_COUNT)))  # ffmpeg encodes at once
+ENCODE_PRESET = os.getenv('ENCODE_PRESET', 'veryfast')
+ENCODE_CRF = 18  # visually lossless; these segments are re-encoded once more at most
+
+X264_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast',
+                'medium', 'slow', 'slower', 'veryslow')
+
+# Short side in pixels
+RESOLUTIONS = {'360p': 360, '480p': 480, '720p': 720, '1080p': 1080, '1440p': 1440, '2160p': 2160}
+
+# Encoders used to match a reference codec
+VIDEO_ENCODERS = {'h264': 'libx264', 'hevc': 'libx265'}
+AUDIO_ENCODERS = {'aac': 'aac', 'mp3': 'libmp3lame', 'opus': 'libopus'}
+
+
+@dataclass
+class SegmentInfo:
+    """Probe result of one segment"""
+    index: int
+    path: Path
+    duration: float
+    video: Dict[str, Any]
+    audio: Optional[Dict[str, Any]]
+
+    @property
+    def signature(self) -> Tuple:
+        """Parameters that must be identical for a stream-copy concat"""
+        video = tuple(self.video.get(k) for k in ('codec_name', 'width', 'height', 'pix_fmt',
+                                                   'r_frame_rate', 'time_base'))
+        audio = None
+        if self.audio:
+            audio = tuple(self.audio.get(k) for k in ('codec_name', 'sample_rate', 'channels'))
+        return video, audio
+
+
+async def run_command(cmd: List[str]) -> Tuple[int, str, str]:
+    """Run a subprocess without blocking the event loop"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except BaseException:
+        # Cancelled (e.g. another segment failed): don't leave ffmpeg running
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    return process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+
+
+async def probe_segment(index: int, path: Path) -> SegmentInfo:
+    """ffprobe one segment; raises when it is unreadable or has no video"""
+    returncode, stdout, stderr = await run_command([
+        'ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', str(path)
+    ])
+    if returncode != 0:
+        raise Exception(f"Segment {index} is not a readable video: {stderr.strip()[:300]}")
+
+    data = json.loads(stdout)
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    if video is None:
+        raise Exception(f"Segment {index} has no video stream")
+
+    duration = float(data.get('format', {}).get('duration') or 0)
+    return SegmentInfo(index, path, duration, video, audio)
+
+
+async def probe_segments(segment_files: List[Path], indices: Optional[List[int]] = None) -> List[SegmentInfo]:
+    """Probe all segments in parallel (indices: their positions in the video, default 0..n-1)"""
+    semaphore = asyncio.Semaphore(PROBE_CONCURRENCY)
+    indices = indices if indices is not None else list(range(len(segment_files)))
+
+    async def probe(index: int, path: Path) -> SegmentInfo:
+        async with semaphore:
+            return await probe_segment(index, path)
+
+    return list(await asyncio.gather(*(probe(i, p) for i, p in zip(indices, segment_files))))
+
+
+def choose_reference(infos: List[SegmentInfo]) -> SegmentInfo:
+    """First segment of the signature group covering the most duration (ties: earliest group)"""
+    groups: Dict[Tuple, List[SegmentInfo]] = {}
+    for info in infos:
+        groups.setdefault(info.signature, []).append(info)
+    best = max(groups.values(), key=lambda group: (sum(i.duration for i in group), -group[0].index))
+    return best[0]
+
+
+def timescale(time_base: Optional[str]) -> Optional[str]:
+    """'1/12288' -> '12288' (MP4 track timescale)"""
+    if time_base and '/' in time_base:
+        return time_base.split('/', 1)[1]
+    return None
+
+
+def conform_command(info: SegmentInfo, reference: SegmentInfo, output: Path, threads: int,
+                    preset: str = ENCODE_PRESET, crf: int = ENCODE_CRF) -> List[str]:
+    """ffmpeg command that re-encodes `info` to the reference's codec parameters"""
+    ref_video, ref_audio = reference.video, reference.audio
+    width, height = ref_video['width'], ref_video['height']
+    filters = [
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease",
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2",
+        "setsar=1",
+        f"fps={ref_video.get('r_frame_rate', '30/1')}",
+        f"format={ref_video.get('pix_fmt', 'yuv420p')}"
+    ]
+
+    cmd = ['ffmpeg', '-y', '-i', str(info.path)]
+    if ref_audio and not info.audio:
+        # Silent track so the audio layout matches
+        layout = ref_audio.get('channel_layout') or ('mono' if ref_audio.get('channels') == 1 else 'stereo')
+        cmd += ['-f', 'lavfi', '-i', f"anullsrc=channel_layout={layout}:sample_rate={ref_audio.get('sample_rate', 48000)}"]
+
+    cmd += [
+        '-map', '0:v:0',
+        '-vf', ','.join(filters),
+        '-c:v', VIDEO_ENCODERS.get(ref_video.get('codec_name'), 'libx264'),
+        '-preset', preset,
+        '-crf', str(crf),
+        '-threads', str(threads),
+        '-filter_threads', str(threads)
+    ]
+    if ref_video.get('codec_name') == 'h264' and ref_video.get('profile') in ('Baseline', 'Main', 'High'):
+        cmd += ['-profile:v', ref_video['profile'].lower()]
+    track_timescale = timescale(ref_video.get('time_base'))
+    if track_timescale:
+        cmd += ['-video_track_timescale', track_timescale]
+
+    if ref_audio:
+        cmd += [
+            '-map', '0:a:0' if info.audio else '1:a:0',
+            '-c:a', AUDIO_ENCODERS.get(ref_audio.get('codec_name'), 'aac'),
+            '-ar', str(ref_audio.get('sample_rate', 48000)),
+            '-ac', str(ref_audio.get('channels', 2))
+        ]
+        if not info.audio:
+            cmd += ['-shortest']
+    else:
+        cmd += ['-an']
+
+    cmd += ['-movflags', '+faststart', str(output)]
+    return cmd
+
+
+def thread_budget(jobs: int, workers: Optional[int] = None) -> Tuple[int, int]:
+    """(concurrent encodes, threads per encode) for `jobs` encodes on this machine"""
+    concurrency = max(1, min(workers or ENCODE_WORKERS, jobs))
+    return concurrency, max(1, CPU_COUNT // concurrency)
+
+
+def parse_aspect_ratio(aspect_ratio: str) -> Tuple[int, int]:
+    """'9:16' -> (9, 16)"""
+    try:
+        width, height = (int(x) for x in aspect_ratio.split(':'))
+    except ValueError:
+        raise ValueError(f"Invalid aspect ratio: {aspect_ratio}")
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Invalid aspect ratio: {aspect_ratio}")
+    return width, height
+
+
+def target_size(resolution: str, aspect_ratio: str) -> Tuple[int, int]:
+    """Frame size for e.g. ('1080p', '9:16') -> (1080, 1920); both sides even"""
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unsupported resolution: {resolution}")
+    short = RESOLUTIONS[resolution]
+    ratio_w, ratio_h = parse_aspect_ratio(aspect_ratio)
+    long = short * max(ratio_w, ratio_h) / min(ratio_w, ratio_h)
+    long = int(round(long / 2)) * 2
+    return (short, long) if ratio_w <= ratio_h else (long, short)
+
+
+def normalize_target(reference: SegmentInfo, width: Optional[int] = None, height: Optional[int] = None,
+                     fps: Optional[int] = None) -> SegmentInfo:
+    """The reference's parameters with the requested overrides, as a synthetic reference"""
+    video = dict(reference.video)
+    if width and height:
+        video.update(width=width, height=height)
+    if fps:
+        # 1/(fps*512) is what ffmpeg's mp4 muxer picks for a constant frame rate
+        video.update(r_frame_rate=f"{fps}/1", time_base=f"1/{fps * 512}")
+    video.update(codec_name='h264', pix_fmt='yuv420p')
+    audio = dict(reference.audio) if reference.audio else None
+    return SegmentInfo(reference.index, reference.path, reference.duration, video, audio)
+
+
+async def conform_segment(info: SegmentInfo, reference: SegmentInfo, work_dir: Path, threads: int,
+                          preset: str = ENCODE_PRESET, crf: int = ENCODE_CRF) -> Path:
+    """Re-encode one segment to the reference's parameters; returns the new file"""
+    output = work_dir / f"segment_{info.index}_conformed.mp4"
+    logger.info(f"Re-encoding segment {info.index} ({preset}, {threads} threads)")
+    returncode, _, stderr = await run_command(conform_command(info, reference, output, threads, preset, crf))
+    if returncode != 0:
+        raise Exception(f"FFmpeg re-encode of segment {info.index} failed: {stderr[-500:]}")
+    return output
+
+
+def resolve_target(reference: SegmentInfo, resolution: Optional[str] = None, aspect_ratio: str = '9:16',
+                   fps: Optional[int] = None) -> SegmentInfo:
+    """The reference itself, or the normalization target derived from it"""
+    if not (resolution or fps):
+        return reference
+    width, height = target_size(resolution, aspect_ratio) if resolution else (None, None)
+    return normalize_target(reference, width, height, fps)
+
+
+async def conform_segments(infos: List[SegmentInfo], reference: SegmentInfo, work_dir: Path,
+                           preset: str = ENCODE_PRESET, workers: Optional[int] = None,
+                           threads: Optional[int] = None, crf: int = ENCODE_CRF) -> Dict[int, Path]:
+    """
+    Re-encode every segment whose signature differs from the reference; returns index -> new file.
+    workers / threads override the pool size and the threads per encode (thread_budget).
+    """
+    mismatched = [info for info in infos if info.signature != reference.signature]
+    if not mismatched:
+        return {}
+
+    # Split the cores between the encodes that run at the same time
+    concurrency, budget = thread_budget(len(mismatched), workers)
+    threads = threads or budget
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def conform(info: SegmentInfo) -> Tuple[int, Path]:
+        async with semaphore:
+            return info.index, await conform_segment(info, reference, work_dir, threads, preset, crf)
+
+    return dict(await asyncio.gather(*(conform(info) for info in mismatched)))
+
+
+async def prepare_for_concat(segment_files: List[Path], work_dir: Path, resolution: Optional[str] = None,
+                             aspect_ratio: str = '9:16', fps: Optional[int] = None,
+                             preset: str = ENCODE_PRESET, indices: Optional[List[int]] = None,
+                             reference: Optional[SegmentInfo] = None,
+                             crf: int = ENCODE_CRF) -> Tuple[List[Path], SegmentInfo]:
+    """
+    Preflight: probe all segments and re-encode only the ones that would break
+    a stream-copy concat, or that differ from the requested resolution / fps.
+    A given reference (e.g. the format of cached segments) replaces the
+    majority vote. Returns the segment files to concatenate, in order, and
+    the reference they now match.
+    """
+    infos = await probe_segments(segment_files, indices)
+    if reference is None:
+        reference = resolve_target(choose_reference(infos), resolution, aspect_ratio, fps)
+    replaced = await conform_segments(infos, reference, work_dir, preset, crf=crf)
+
+    logger.info(
+        f"Preflight: {len(infos) - len(replaced)}/{len(infos)} segments stream-copied, "
+        f"{len(replaced)} re-encoded"
+    )
+    return [replaced.get(info.index, info.path) for info in infos], reference
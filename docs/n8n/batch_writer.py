@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Streaming Batch Writer for Sparkfluence RAG
+
+Buffers upsert records across files and writes them to Supabase in batches
+bounded by row count and JSON payload size. Writes run on a background thread
+fed by a bounded queue, so chunk_and_embed.py keeps embedding (producer)
+while earlier batches are uploaded (consumer).
+
+Each batch is retried with exponential backoff; a batch that still fails is
+recorded as failed (errors_by_key). Only a batch rejected as too large (HTTP
+413, "... too large") is split in half and the halves written on their own,
+so an outage doesn't turn one batch into hundreds of back-to-back requests.
+
+Usage:
+  writer = StreamingUpserter(client, 'knowledge_embeddings', on_conflict='project_type,file_name,section_title')
+  writer.start()
+  for record in records:
+      writer.add(record)
+  writer.close()
+  print(writer.written_by_key, writer.errors_by_key)
+"""
+
+import json
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Defaults
+DEFAULT_MAX_ROWS = 200  # rows per request
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024  # JSON payload bytes per request
+DEFAULT_QUEUE_SIZE = 4  # batches waiting for upload before add() blocks
+MAX_RETRIES = 3
+RETRY_DELAY = 2  # seconds
+
+_STOP = object()
+
+
+def is_payload_too_large(error: Exception) -> bool:
+    """Whether the request was rejected for its size (worth splitting, not retrying)"""
+    response = getattr(error, 'response', None)
+    for status in (getattr(error, 'status_code', None), getattr(error, 'code', None),
+                   getattr(response, 'status_code', None)):
+        if str(status) == '413':
+            return True
+    return 'too large' in str(error).lower()
+
+
+class StreamingUpserter:
+    """Background writer that upserts records in size-bounded batches"""
+
+    def __init__(self, client, table: str, on_conflict: Optional[str] = None,
+                 max_rows: int = DEFAULT_MAX_ROWS, max_bytes: int = DEFAULT_MAX_BYTES,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, key_field: str = 'file_name'):
+        self.client = client
+        self.table = table
+        self.on_conflict = on_conflict
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.key_field = key_field
+
+        self.written_by_key: Dict[str, int] = {}
+        self.errors_by_key: Dict[str, str] = {}
+        self.batches = 0
+
+        self._buffer: List[Dict] = []
+        self._buffer_bytes = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the upload thread"""
+        self._thread = threading.Thread(target=self._run, name='supabase-writer', daemon=True)
+        self._thread.start()
+
+    def add(self, record: Dict):
+        """Buffer one record; a full buffer is handed to the upload thread"""
+        size = len(json.dumps(record, separators=(',', ':')))
+
+        if self._buffer and (len(self._buffer) >= self.max_rows or
+                             self._buffer_bytes + size > self.max_bytes):
+            self.flush()
+
+        self._buffer.append(record)
+        self._buffer_bytes += size
+
+    def flush(self):
+        """Queue whatever is buffered (blocks while the queue is full)"""
+        if not self._buffer:
+            return
+        self._queue.put(self._buffer)
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def close(self):
+        """Flush the buffer and wait until every batch has been written"""
+        self.flush()
+        self._queue.put(_STOP)
+        if self._thread:
+            self._thread.join()
+
+    @property
+    def total_written(self) -> int:
+        return sum(self.written_by_key.values())
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is _STOP:
+                break
+            self._write(batch)
+
+    def _write(self, batch: List[Dict], retries: int = MAX_RETRIES):
+        error = None
+        for attempt in range(retries):
+            try:
+                request = self.client.table(self.table)
+                if self.on_conflict:
+                    request = request.upsert(batch, on_conflict=self.on_conflict)
+                else:
+                    request = request.insert(batch)
+                request.execute()
+                self._record_success(batch)
+                return
+            except Exception as e:
+                error = e
+                if is_payload_too_large(e):
+                    break
+                if attempt < retries - 1:
+                    wait_time = RETRY_DELAY * (2 ** attempt)
+                    print(f"  ⚠️  Batch of {len(batch)} rows failed, retry {attempt + 1}/{retries} after {wait_time}s: {e}")
+                    time.sleep(wait_time)
+
+        if len(batch) > 1 and is_payload_too_large(error):
+            middle = len(batch) // 2
+            print(f"  ⚠️  Batch of {len(batch)} rows too large, splitting: {error}")
+            self._write(batch[:middle])
+            self._write(batch[middle:])
+            return
+
+        self._record_failure(batch, error)
+
+    def _record_success(self, batch: List[Dict]):
+        with self._lock:
+            self.batches += 1
+            for record in batch:
+                key = record.get(self.key_field)
+                self.written_by_key[key] = self.written_by_key.get(key, 0) + 1
+
+    def _record_failure(self, batch: List[Dict], error: Exception):
+        with self._lock:
+            for record in batch:
+                key = record.get(self.key_field)
+                self.errors_by_key.setdefault(key, f"Failed to upsert to Supabase: {error}")
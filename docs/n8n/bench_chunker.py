@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Chunker Micro-benchmark
+
+Generates synthetic markdown sections of increasing size (many short
+sentences in a single section, the worst case for overlap handling) and times
+the offset-based chunker against the previous list/join implementation.
+Time per MB should stay flat as input grows if chunking is linear.
+
+Usage:
+  python bench_chunker.py
+  python bench_chunker.py --sizes-mb 1 2 4 8 16 --unit tokens
+"""
+
+import argparse
+import random
+import re
+import time
+from typing import Dict, List
+
+from chunker import SIZE_UNITS, chunk_text
+
+WORDS = ['hook', 'viral', 'retention', 'story', 'emotion', 'creator', 'scroll',
+         'audience', 'twist', 'payoff', 'trend', 'caption', 'cut', 'loop']
+
+
+def make_section(size_bytes: int, seed: int = 42) -> str:
+    """Build a single section of short sentences, roughly size_bytes long"""
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    while total < size_bytes:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 6))).capitalize()
+        sentence += rng.choice('.!?') + rng.choice([' ', ' ', '\n'])
+        parts.append(sentence)
+        total += len(sentence)
+    return ''.join(parts)
+
+
+def legacy_chunk_section(text: str, title: str, max_size: int, overlap: int) -> List[Dict]:
+    """The previous chunk_section algorithm, kept here as the baseline"""
+    if len(text) <= max_size:
+        return [{'title': title, 'text': text, 'char_count': len(text)}]
+
+    chunks = []
+    sentences = re.split(r'(?<=[.!?])\s+', text)
+    current_chunk = []
+    current_chars = 0
+
+    for sentence in sentences:
+        sentence_chars = len(sentence)
+        if current_chars + sentence_chars > max_size and current_chunk:
+            chunk_text_ = ' '.join(current_chunk)
+            chunks.append({'title': f"{title} (Part {len(chunks) + 1})", 'text': chunk_text_,
+                           'char_count': len(chunk_text_)})
+            overlap_sentences = []
+            overlap_chars = 0
+            for sent in reversed(current_chunk):
+                if overlap_chars + len(sent) <= overlap:
+                    overlap_sentences.insert(0, sent)
+                    overlap_chars += len(sent)
+                else:
+                    break
+            current_chunk = overlap_sentences
+            current_chars = overlap_chars
+        current_chunk.append(sentence)
+        current_chars += sentence_chars
+
+    if current_chunk:
+        chunk_text_ = ' '.join(current_chunk)
+        chunks.append({'title': f"{title} (Part {len(chunks) + 1})" if chunks else title,
+                       'text': chunk_text_, 'char_count': len(chunk_text_)})
+    return chunks
+
+
+def best_of(runs: int, fn) -> float:
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the knowledge chunker')
+    parser.add_argument('--sizes-mb', type=float, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--max-size', type=int, default=1000)
+    parser.add_argument('--overlap', type=int, default=100)
+    parser.add_argument('--unit', choices=SIZE_UNITS, default='chars')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'chunks':>8} {'offset (s)':>11} {'s/MB':>7} {'legacy (s)':>11} {'s/MB':>7} {'same':>5}")
+
+    for size_mb in args.sizes_mb:
+        text = make_section(int(size_mb * 1024 * 1024))
+
+        new_time = best_of(args.runs, lambda: chunk_text(text, 'Bench', args.max_size, args.overlap, args.unit))
+        chunks = chunk_text(text, 'Bench', args.max_size, args.overlap, args.unit)
+
+        legacy_cell = '-'
+        legacy_rate = '-'
+        same = '-'
+        if args.unit == 'chars':
+            legacy_time = best_of(args.runs, lambda: legacy_chunk_section(text, 'Bench', args.max_size, args.overlap))
+            legacy = legacy_chunk_section(text, 'Bench', args.max_size, args.overlap)
+            legacy_cell = f"{legacy_time:.3f}"
+            legacy_rate = f"{legacy_time / size_mb:.3f}"
+            # Same boundaries; only the whitespace between sentences differs
+            same = 'yes' if [' '.join(c['text'].split()) for c in chunks] == \
+                            [' '.join(c['text'].split()) for c in legacy] else 'NO'
+
+        print(f"{size_mb:>6.1f}MB {len(chunks):>8} {new_time:>11.3f} {new_time / size_mb:>7.3f} "
+              f"{legacy_cell:>11} {legacy_rate:>7} {same:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Hybrid Retrieval Benchmark (BM25 + vector, reciprocal rank fusion)
+
+Exact-term queries are simulated by taking a target row and querying with its
+rarest terms (hashtags / names in real data) plus an embedding that is mostly
+the centroid of the target's neighbourhood: a short query is semantically
+close to the topic, not to the one row that contains the term. Reports
+per-query latency and hit@k (target row in the top k) for vector-only,
+lexical-only and hybrid search.
+
+By default a synthetic corpus (clustered embeddings, Zipf-distributed words,
+one rare tag per row) is generated; pass --snapshot to use a real export.
+
+Usage:
+  python bench_hybrid.py
+  python bench_hybrid.py --rows 50000 --queries 500 --specificity 0.5
+  python bench_hybrid.py --snapshot snapshots/knowledge --project-type viral_script
+"""
+
+import argparse
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from bench_retrieval import percentile_ms
+from bm25 import tokenize
+from vector_store import EMBEDDING_DIMENSION, LocalVectorIndex, normalize_rows
+
+
+def synthetic_corpus(rows: int, dim: int, clusters: int, vocabulary: int, seed: int) -> LocalVectorIndex:
+    """Clustered embeddings with topic words, common words and one rare tag per row"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    matrix = normalize_rows(centers[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32))
+
+    zipf = 1.0 / np.arange(1, vocabulary + 1)
+    zipf /= zipf.sum()
+    half = rows // 2
+    meta = []
+    for i in range(rows):
+        common = rng.choice(vocabulary, 30, p=zipf)
+        topic = rng.integers(0, 20, 10) + labels[i] * 20
+        words = [f"w{w}" for w in common] + [f"topic{t}" for t in topic] + [f"#tag{i}"]
+        rng.shuffle(words)
+        meta.append({
+            'id': str(i),
+            'project_type': 'viral_script' if i < half else 'image_video',
+            'section_title': f"topic{labels[i] * 20}",
+            'chunk_text': ' '.join(words)
+        })
+    return LocalVectorIndex(matrix, meta, {'viral_script': (0, half), 'image_video': (half, rows)})
+
+
+def make_queries(index: LocalVectorIndex, count: int, specificity: float, project_type: str,
+                 seed: int, neighbours: int = 50) -> List[Tuple[int, str, np.ndarray]]:
+    """
+    (target row, query text, query embedding) with the target's two rarest terms.
+    The embedding mixes the target (weight `specificity`) with the centroid of its
+    nearest neighbours (target excluded).
+    """
+    rng = np.random.default_rng(seed + 1)
+    lo, hi = index._range(project_type)
+    lexical = index.lexical
+    queries = []
+    for row in rng.integers(lo, hi, count):
+        row = int(row)
+        terms = set(tokenize(f"{index.rows[row].get('section_title') or ''} {index.rows[row].get('chunk_text') or ''}"))
+        rarest = sorted(terms, key=lambda term: len(lexical.postings[term][0]))[:2]
+        target = np.asarray(index.embeddings[row], dtype=np.float32)
+        topic = [m['id'] for m in index.search(target, k=neighbours + 1, threshold=-1.0, project_type=project_type)
+                 if m['id'] != index.rows[row]['id']]
+        centroid = np.asarray(index.embeddings[[int(i) for i in topic]], dtype=np.float32).mean(axis=0)
+        embedding = specificity * target + (1 - specificity) * normalize_rows(centroid)
+        queries.append((row, ' '.join(rarest), normalize_rows(embedding)))
+    return queries
+
+
+def run(queries: List[Tuple[int, str, np.ndarray]], search: Callable, k: int) -> Tuple[List[float], float]:
+    """Latencies and hit@k of one search method"""
+    latencies = []
+    hits = 0
+    for row, text, embedding in queries:
+        start = time.perf_counter()
+        matches = search(text, embedding)
+        latencies.append(time.perf_counter() - start)
+        hits += any(m['id'] == str(row) for m in matches[:k])
+    return latencies, hits / len(queries) if queries else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hybrid BM25 + vector retrieval')
+    parser.add_argument('--snapshot', help='Snapshot prefix written by vector_store.py export')
+    parser.add_argument('--project-type', default='viral_script')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=EMBEDDING_DIMENSION)
+    parser.add_argument('--clusters', type=int, default=200)
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--specificity', type=float, default=0.0,
+                        help='Weight of the target row in the query embedding (0 = topic only)')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        index = LocalVectorIndex.load(args.snapshot)
+    else:
+        index = synthetic_corpus(args.rows, args.dim, args.clusters, args.vocabulary, args.seed)
+
+    start = time.perf_counter()
+    index.lexical
+    build_s = time.perf_counter() - start
+    queries = make_queries(index, args.queries, args.specificity, args.project_type, args.seed)
+    print(f"📦 {len(index)} rows, {len(index.lexical.postings)} terms (BM25 built in {build_s:.2f}s), "
+          f"{len(queries)} queries, k={args.k}\n")
+
+    methods = {
+        'vector': lambda text, embedding: index.search(embedding, k=args.k, threshold=-1.0,
+                                                       project_type=args.project_type),
+        'lexical (bm25)': lambda text, embedding: [
+            index.rows[row] for row, _ in index.lexical.search(text, args.k, *index._range(args.project_type))
+        ],
+        'hybrid (rrf)': lambda text, embedding: index.search_hybrid(text, embedding, k=args.k,
+                                                                    project_type=args.project_type),
+    }
+
+    print(f"{'method':<16} {'ms/query':>9} {'p50 ms':>8} {'p95 ms':>8} {'hit@k':>7}")
+    for name, search in methods.items():
+        latencies, hit_rate = run(queries, search, args.k)
+        print(f"{name:<16} {np.mean(latencies) * 1000:>9.3f} {percentile_ms(latencies, 50):>8.3f} "
+              f"{percentile_ms(latencies, 95):>8.3f} {hit_rate:>7.3f}")
+
+
+if __name__ == '__main__':
+    main()
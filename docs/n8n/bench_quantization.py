@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Recall vs Memory Benchmark for Compact Embedding Storage
+
+Builds the same index as float32, float16 and int8 (see quantize.py) and
+reports memory, per-query latency (one search per query, and all queries in
+one search_batch call) and recall@k against exact float32 results, so the
+snapshot / pipeline dtype can be picked knowingly. Compact matrices are cast
+to float32 once per search call, so their single-query latency is dominated
+by the cast; batching amortizes it.
+
+Usage:
+  python bench_quantization.py
+  python bench_quantization.py --rows 200000 --k 10
+  python bench_quantization.py --snapshot snapshots/knowledge --project-type viral_script
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from bench_retrieval import brute_force, make_queries, recall_at_k, synthetic_index
+from quantize import QUANTIZATION_DTYPES, bytes_per_row, dequantize
+from vector_store import EMBEDDING_DIMENSION, LocalVectorIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark recall vs memory of quantized embeddings')
+    parser.add_argument('--snapshot', help='Snapshot prefix written by vector_store.py export')
+    parser.add_argument('--project-type', default='viral_script')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=EMBEDDING_DIMENSION)
+    parser.add_argument('--clusters', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        source = LocalVectorIndex.load(args.snapshot, mmap=False)
+        matrix = dequantize(source.embeddings, source.scales)
+    else:
+        source = synthetic_index(args.rows, args.dim, args.clusters, args.seed)
+        matrix = np.asarray(source.embeddings, dtype=np.float32)
+
+    queries = make_queries(source, args.queries, args.seed)
+    exact = LocalVectorIndex.from_matrix(matrix, source.rows, source.project_types, 'float32')
+    truth = brute_force(exact, queries, args.k, args.project_type)
+    lo, hi = exact._range(args.project_type)
+    print(f"📦 {len(exact)} rows x {matrix.shape[1]} dims, {hi - lo} in '{args.project_type}', "
+          f"{len(queries)} queries, k={args.k}\n")
+
+    print(f"{'dtype':<8} {'B/row':>6} {'MB':>8} {'vs f32':>7} {'ms/query':>9} {'batched':>8} {'recall@k':>9} "
+          f"{'max |Δsim|':>11}")
+    for dtype in QUANTIZATION_DTYPES:
+        index = LocalVectorIndex.from_matrix(matrix, source.rows, source.project_types, dtype)
+
+        start = time.perf_counter()
+        found = []
+        for query in queries:
+            matches = index.search(query, k=args.k, threshold=-1.0, project_type=args.project_type)
+            found.append([m['id'] for m in matches])
+        query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        start = time.perf_counter()
+        index.search_batch(queries, k=args.k, threshold=-1.0, project_type=args.project_type)
+        batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        # Similarity error against exact scores on the same rows
+        approx_scores, _ = index.scores(queries[:20], args.project_type)
+        exact_scores, _ = exact.scores(queries[:20], args.project_type)
+        max_error = float(np.abs(approx_scores - exact_scores).max()) if approx_scores.size else 0.0
+
+        print(f"{dtype:<8} {bytes_per_row(matrix.shape[1], dtype):>6} {index.nbytes / (1024 * 1024):>8.1f} "
+              f"{index.nbytes / exact.nbytes:>7.2f} {query_ms:>9.3f} {batch_ms:>8.3f} {recall_at_k(truth, found):>9.3f} "
+              f"{max_error:>11.5f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Retrieval Benchmark for the Local Vector Engine
+
+Compares LocalVectorIndex (argpartition over one matmul, single and batched
+queries) with a brute-force reference that fully sorts every similarity.
+Reports per-query latency and recall@k against the reference.
+
+By default a synthetic clustered corpus is generated; pass --snapshot to run
+on a real export (queries are then perturbed copies of stored embeddings).
+
+Usage:
+  python bench_retrieval.py
+  python bench_retrieval.py --rows 100000 --queries 500 --k 10
+  python bench_retrieval.py --snapshot snapshots/knowledge --project-type viral_script
+"""
+
+import argparse
+import time
+from typing import List
+
+import numpy as np
+
+from vector_store import EMBEDDING_DIMENSION, LocalVectorIndex, normalize_rows
+
+
+def synthetic_index(rows: int, dim: int, clusters: int, seed: int) -> LocalVectorIndex:
+    """Clustered unit vectors split evenly across the two project types"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    matrix = normalize_rows(centers[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32))
+    half = rows // 2
+    meta = [{'id': str(i), 'project_type': 'viral_script' if i < half else 'image_video'} for i in range(rows)]
+    return LocalVectorIndex(matrix, meta, {'viral_script': (0, half), 'image_video': (half, rows)})
+
+
+def make_queries(index: LocalVectorIndex, count: int, seed: int) -> np.ndarray:
+    """Held-out style queries: stored vectors with noise added"""
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, len(index), count)
+    base = np.asarray(index.embeddings[picks], dtype=np.float32)
+    noise = rng.standard_normal(base.shape).astype(np.float32) * np.float32(0.3 / np.sqrt(base.shape[1]))
+    return normalize_rows(base + noise)
+
+
+def brute_force(index: LocalVectorIndex, queries: np.ndarray, k: int, project_type: str) -> List[List[str]]:
+    """Reference: score every row and fully sort"""
+    lo, hi = index._range(project_type)
+    matrix = np.asarray(index.embeddings[lo:hi], dtype=np.float32)
+    results = []
+    for query in queries:
+        order = np.argsort(-(matrix @ query), kind='stable')[:k]
+        results.append([index.rows[lo + int(i)]['id'] for i in order])
+    return results
+
+
+def recall_at_k(truth: List[List[str]], found: List[List[str]]) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    total = sum(len(t) for t in truth)
+    return hits / total if total else 1.0
+
+
+def percentile_ms(samples: List[float], pct: float) -> float:
+    return float(np.percentile(samples, pct) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark local vector retrieval')
+    parser.add_argument('--snapshot', help='Snapshot prefix written by vector_store.py export')
+    parser.add_argument('--project-type', default='viral_script')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=EMBEDDING_DIMENSION)
+    parser.add_argument('--clusters', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        index = LocalVectorIndex.load(args.snapshot)
+    else:
+        index = synthetic_index(args.rows, args.dim, args.clusters, args.seed)
+    queries = make_queries(index, args.queries, args.seed)
+    lo, hi = index._range(args.project_type)
+    print(f"📦 {len(index)} rows, {hi - lo} in '{args.project_type}', {len(queries)} queries, k={args.k}\n")
+
+    # Brute force reference
+    start = time.perf_counter()
+    truth = brute_force(index, queries, args.k, args.project_type)
+    brute_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    # Single-query engine
+    latencies = []
+    single = []
+    for query in queries:
+        start = time.perf_counter()
+        matches = index.search(query, k=args.k, threshold=-1.0, project_type=args.project_type)
+        latencies.append(time.perf_counter() - start)
+        single.append([m['id'] for m in matches])
+
+    # Batched engine
+    start = time.perf_counter()
+    batched = []
+    for i in range(0, len(queries), args.batch_size):
+        for matches in index.search_batch(queries[i:i + args.batch_size], k=args.k, threshold=-1.0,
+                                          project_type=args.project_type):
+            batched.append([m['id'] for m in matches])
+    batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    print(f"{'method':<24} {'ms/query':>9} {'p50 ms':>8} {'p95 ms':>8} {'recall@k':>9}")
+    print(f"{'brute force (argsort)':<24} {brute_ms:>9.3f} {'-':>8} {'-':>8} {1.0:>9.3f}")
+    print(f"{'engine single':<24} {np.mean(latencies) * 1000:>9.3f} {percentile_ms(latencies, 50):>8.3f} "
+          f"{percentile_ms(latencies, 95):>8.3f} {recall_at_k(truth, single):>9.3f}")
+    print(f"{f'engine batch ({args.batch_size})':<24} {batch_ms:>9.3f} {'-':>8} {'-':>8} "
+          f"{recall_at_k(truth, batched):>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+In-process BM25 Index for Sparkfluence RAG
+
+Lexical counterpart of the knowledge_embeddings full-text index, used by
+LocalVectorIndex.search_hybrid(). Postings are precomputed per term as
+(row ids, BM25 term weight) arrays, so scoring a query is one vectorized
+add per query term over the rows of the requested range.
+
+Tokens are lowercased words split like Postgres' 'simple' text search
+parser, which treats '#' and '_' as separators: "#fyp" and "fyp" are the
+same term on both sides. A query matches rows containing any of its terms
+(OR), as in match_knowledge_hybrid.
+
+reciprocal_rank_fusion() merges rankings the same way match_knowledge_hybrid
+does in SQL: score = sum over rankings of 1 / (rrf_k + rank).
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r'[^\W_]+')  # '#' and '_' separate words, as in to_tsvector('simple')
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words; a hashtag yields its tag without '#'"""
+    return WORD_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents (row order = LocalVectorIndex row order)"""
+
+    def __init__(self, documents: Sequence[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.size = len(documents)
+        lengths = np.zeros(self.size, dtype=np.float32)
+        postings: Dict[str, Tuple[List[int], List[int]]] = defaultdict(lambda: ([], []))
+
+        for row, document in enumerate(documents):
+            counts = Counter(tokenize(document))
+            lengths[row] = sum(counts.values())
+            for term, tf in counts.items():
+                ids, tfs = postings[term]
+                ids.append(row)
+                tfs.append(tf)
+
+        avg_length = float(lengths.mean()) if self.size else 0.0
+        norm = k1 * (1 - b + b * lengths / avg_length) if avg_length else np.full(self.size, k1, dtype=np.float32)
+
+        # Row ids are appended in order, so every posting list is sorted
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, (ids, tfs) in postings.items():
+            ids_array = np.asarray(ids, dtype=np.int32)
+            tf_array = np.asarray(tfs, dtype=np.float32)
+            idf = math.log(1 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5))
+            weights = idf * tf_array * (k1 + 1) / (tf_array + norm[ids_array])
+            self.postings[term] = (ids_array, weights.astype(np.float32))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> 'BM25Index':
+        """Index section_title + chunk_text of match_knowledge-shaped rows"""
+        return cls([f"{row.get('section_title') or ''}\n{row.get('chunk_text') or ''}" for row in rows])
+
+    def scores(self, query: str, lo: int = 0, hi: Optional[int] = None) -> np.ndarray:
+        """BM25 score of every row in [lo, hi)"""
+        hi = self.size if hi is None else hi
+        scores = np.zeros(hi - lo, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids, weights = posting
+            start, end = np.searchsorted(ids, lo), np.searchsorted(ids, hi)
+            scores[ids[start:end] - lo] += weights[start:end]  # row ids are unique within a posting
+        return scores
+
+    def search(self, query: str, k: int = 10, lo: int = 0, hi: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top-k (row, score) pairs with a positive score, best first"""
+        scores = self.scores(query, lo, hi)
+        matched = np.flatnonzero(scores > 0)
+        if matched.size > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = matched[np.argsort(-scores[matched], kind='stable')]
+        return [(lo + int(i), float(scores[i])) for i in order]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], rrf_k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuse ranked row lists; returns (row, score) pairs, best first"""
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            fused[row] += 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))
@@ -9,14 +9,34 @@ Usage:
   python chunk_and_embed.py --folder "path/to/folder" --project-type viral_script
   python chunk_and_embed.py --folder "path/to/folder" --project-type image_video
   python chunk_and_embed.py --folder "path/to/folder" --project-type viral_script --dry-run
+  python chunk_and_embed.py --folder "path/to/folder" --project-type viral_script --prune
+  python chunk_and_embed.py --folder "path/to/folder" --project-type viral_script --no-cache
+  python chunk_and_embed.py --folder "path/to/folder" --project-type viral_script --workers 8
+
+Subfolders are included (use --no-recursive to disable); nested files are stored
+under their path relative to --folder, e.g. "hooks/openers.md". Files are read
+and chunked in a process pool while the main process embeds and uploads.
+
+Re-runs are incremental: every chunk stores a content hash in its metadata, so
+only new or changed chunks are embedded, sections that disappeared from a file
+are deleted, and writes are upserts on (project_type, file_name, section_title).
+Embeddings are also kept in a local on-disk cache (see embedding_cache.py), so
+an interrupted ingest resumes without re-embedding what already succeeded.
+Uploads are streamed in size-bounded batches on a background thread (see
+batch_writer.py) while the next chunks are being embedded.
+
+Embeddings are held as compact NumPy arrays (float32, or float16 with
+--embedding-dtype float16) instead of lists of Python floats, and are sent to
+Supabase as pgvector text literals.
 
 Environment Variables:
   - GEMINI_API_KEY: Your Google AI API key
   - SUPABASE_URL: Your Supabase project URL
   - SUPABASE_SERVICE_KEY: Your Supabase service role key
+  - EMBEDDING_CACHE_PATH: Optional embedding cache location (default: .embedding_cache.sqlite)
 
 Dependencies:
-  pip install google-generativeai supabase python-dotenv
+  pip install google-generativeai supabase python-dotenv numpy
 """
 
 import os
@@ -24,10 +44,18 @@ import sys
 import argparse
 import time
 import re
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
+import numpy as np
 from dotenv import load_dotenv
 
+from batch_writer import StreamingUpserter
+from chunker import SIZE_UNITS, chunk_id, chunk_text
+from embedding_cache import EmbeddingCache
+from quantize import format_vector
+
 try:
     import google.generativeai as genai
     from supabase import create_client, Client
@@ -43,137 +71,261 @@ load_dotenv()
 # Constants
 EMBEDDING_MODEL = "models/text-embedding-004"
 EMBEDDING_DIMENSION = 768
+EMBEDDING_DTYPE = 'float32'  # float16 halves pipeline memory; int8 is for snapshots only (lossy in the DB)
 TARGET_CHUNK_SIZE_MAX = 1000  # characters (simpler than tokens for Gemini)
 CHUNK_OVERLAP = 100  # characters
+CHUNK_SIZE_UNIT = 'chars'  # or 'tokens' (approximate word/punctuation count)
 BATCH_SIZE = 50  # embeddings per batch
+UPLOAD_MAX_ROWS = 200  # rows per upsert request
+UPLOAD_MAX_BYTES = 2 * 1024 * 1024  # JSON bytes per upsert request
 MAX_RETRIES = 3
 RETRY_DELAY = 2  # seconds
+DEFAULT_CACHE_PATH = '.embedding_cache.sqlite'
+DEFAULT_CACHE_MAX_MB = 512
+MANIFEST_PAGE_SIZE = 1000  # rows per page when reading existing hashes
+UPSERT_CONFLICT_COLUMNS = 'project_type,file_name,section_title'
+
+
+def compute_content_hash(text: str) -> str:
+    """Hash of the embedding input; the model is included so a model change re-embeds"""
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\n{text}".encode('utf-8')).hexdigest()
+
+
+def read_markdown_file(file_path: Path) -> str:
+    """Read markdown file content"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except Exception as e:
+        raise Exception(f"Failed to read {file_path}: {e}")
+
+
+def extract_sections(content: str, file_name: str) -> List[Dict[str, str]]:
+    """
+    Extract sections from markdown content based on ## headers.
+    If no ## headers found, split by paragraphs.
+    """
+    sections = []
+
+    # Try to split by ## headers
+    header_pattern = r'^##\s+(.+)$'
+    matches = list(re.finditer(header_pattern, content, re.MULTILINE))
+
+    if matches:
+        # Split by ## headers
+        for i, match in enumerate(matches):
+            section_title = match.group(1).strip()
+            start_pos = match.end()
+            end_pos = matches[i + 1].start() if i + 1 < len(matches) else len(content)
+            section_text = content[start_pos:end_pos].strip()
+
+            if section_text:  # Only add non-empty sections
+                sections.append({
+                    'title': section_title,
+                    'text': section_text
+                })
+    else:
+        # Fallback: split by double newlines (paragraphs)
+        paragraphs = [p.strip() for p in content.split('\n\n') if p.strip()]
+        for i, para in enumerate(paragraphs):
+            sections.append({
+                'title': f"{file_name} - Part {i + 1}",
+                'text': para
+            })
+
+    return sections
+
+
+def chunk_section(section: Dict[str, str], max_size: int = TARGET_CHUNK_SIZE_MAX,
+                  overlap: int = CHUNK_OVERLAP, unit: str = CHUNK_SIZE_UNIT) -> List[Dict]:
+    """
+    Chunk a section into smaller pieces if it exceeds max size.
+    Uses overlap to maintain context between chunks (see chunker.py).
+    """
+    return chunk_text(section['text'], section['title'], max_size, overlap, unit)
+
+
+def dedupe_titles(chunks: List[Dict]) -> List[Dict]:
+    """
+    Make section titles unique within a file.
+    Titles are the upsert key, so repeated headers (e.g. two "## Examples")
+    get a numeric suffix instead of overwriting each other. A suffix is only
+    used if no other chunk already has that title (e.g. a literal "Examples (2)").
+    """
+    used = set()
+    for chunk in chunks:
+        title = chunk['title']
+        n = 1
+        while chunk['title'] in used:
+            n += 1
+            chunk['title'] = f"{title} ({n})"
+        used.add(chunk['title'])
+    return chunks
+
+
+def chunk_file(file_path: str, file_name: str, max_size: int = TARGET_CHUNK_SIZE_MAX,
+               overlap: int = CHUNK_OVERLAP, unit: str = CHUNK_SIZE_UNIT) -> Dict:
+    """
+    Read, section and chunk one markdown file, and hash every chunk.
+    Module-level (and free of API clients) so it can run in a worker process.
+    """
+    content = read_markdown_file(Path(file_path))
+    sections = extract_sections(content, file_name)
+
+    chunks = []
+    for section in sections:
+        chunks.extend(chunk_section(section, max_size, overlap, unit))
+    dedupe_titles(chunks)
+
+    for i, chunk in enumerate(chunks):
+        chunk['index'] = i
+        chunk['content_hash'] = compute_content_hash(chunk['text'])
+        chunk['chunk_id'] = chunk_id(chunk['title'], chunk['text'])
+
+    return {
+        'file_name': file_name,
+        'section_count': len(sections),
+        'chunks': chunks
+    }
+
+
+def discover_markdown_files(folder_path: Path, recursive: bool = True) -> List[Path]:
+    """Find .md files, descending into subfolders unless recursive=False"""
+    pattern = '**/*.md' if recursive else '*.md'
+    return sorted(p for p in folder_path.glob(pattern) if p.is_file())
+
+
+def relative_file_name(file_path: Path, folder_path: Path) -> str:
+    """Stored file_name: path relative to the ingested folder, with forward slashes"""
+    return file_path.relative_to(folder_path).as_posix()
 
 
 class KnowledgeEmbedder:
     """Handles chunking, embedding, and uploading knowledge files"""
 
-    def __init__(self, gemini_key: str, supabase_url: str, supabase_key: str):
-        """Initialize API clients"""
+    def __init__(self, gemini_key: str, supabase_url: str, supabase_key: str,
+                 cache: Optional[EmbeddingCache] = None,
+                 chunk_size: int = TARGET_CHUNK_SIZE_MAX, chunk_overlap: int = CHUNK_OVERLAP,
+                 chunk_unit: str = CHUNK_SIZE_UNIT, embedding_dtype: str = EMBEDDING_DTYPE):
+        """Initialize API clients, the optional local embedding cache and chunking settings"""
         genai.configure(api_key=gemini_key)
         self.supabase_client: Client = create_client(supabase_url, supabase_key)
+        self.cache = cache
+        self.api_calls = 0
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunk_unit = chunk_unit
+        self.embedding_dtype = np.dtype(embedding_dtype)
 
     def read_markdown_file(self, file_path: Path) -> str:
         """Read markdown file content"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except Exception as e:
-            raise Exception(f"Failed to read {file_path}: {e}")
+        return read_markdown_file(file_path)
 
     def extract_sections(self, content: str, file_name: str) -> List[Dict[str, str]]:
-        """
-        Extract sections from markdown content based on ## headers.
-        If no ## headers found, split by paragraphs.
-        """
-        sections = []
-
-        # Try to split by ## headers
-        header_pattern = r'^##\s+(.+)$'
-        matches = list(re.finditer(header_pattern, content, re.MULTILINE))
-
-        if matches:
-            # Split by ## headers
-            for i, match in enumerate(matches):
-                section_title = match.group(1).strip()
-                start_pos = match.end()
-                end_pos = matches[i + 1].start() if i + 1 < len(matches) else len(content)
-                section_text = content[start_pos:end_pos].strip()
-
-                if section_text:  # Only add non-empty sections
-                    sections.append({
-                        'title': section_title,
-                        'text': section_text
-                    })
-        else:
-            # Fallback: split by double newlines (paragraphs)
-            paragraphs = [p.strip() for p in content.split('\n\n') if p.strip()]
-            for i, para in enumerate(paragraphs):
-                sections.append({
-                    'title': f"{file_name} - Part {i + 1}",
-                    'text': para
-                })
+        """Extract sections from markdown content based on ## headers"""
+        return extract_sections(content, file_name)
+
+    def chunk_section(self, section: Dict[str, str]) -> List[Dict]:
+        """Chunk a section into smaller pieces if it exceeds max size"""
+        return chunk_section(section, self.chunk_size, self.chunk_overlap, self.chunk_unit)
 
-        return sections
+    def dedupe_titles(self, chunks: List[Dict]) -> List[Dict]:
+        """Make section titles unique within a file"""
+        return dedupe_titles(chunks)
 
-    def chunk_section(self, section: Dict[str, str]) -> List[Dict[str, str]]:
+    def fetch_manifest(self, project_type: str) -> Dict[str, Dict[str, Dict]]:
         """
-        Chunk a section into smaller pieces if it exceeds max size.
-        Uses overlap to maintain context between chunks.
+        Load the stored chunk metadata (content_hash, chunk_index, ...) for a project type.
+        Returns {file_name: {section_title: metadata}}.
         """
-        text = section['text']
-        title = section['title']
-        char_count = len(text)
-
-        if char_count <= TARGET_CHUNK_SIZE_MAX:
-            # Section is small enough, return as-is
-            return [{
-                'title': title,
-                'text': text,
-                'char_count': char_count
-            }]
-
-        # Section is too large, split it
-        chunks = []
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        current_chunk = []
-        current_chars = 0
-
-        for sentence in sentences:
-            sentence_chars = len(sentence)
-
-            if current_chars + sentence_chars > TARGET_CHUNK_SIZE_MAX and current_chunk:
-                # Save current chunk
-                chunk_text = ' '.join(current_chunk)
-                chunks.append({
-                    'title': f"{title} (Part {len(chunks) + 1})",
-                    'text': chunk_text,
-                    'char_count': len(chunk_text)
-                })
+        manifest: Dict[str, Dict[str, Dict]] = {}
+        start = 0
 
-                # Start new chunk with overlap
-                overlap_sentences = []
-                overlap_chars = 0
-                for sent in reversed(current_chunk):
-                    sent_chars = len(sent)
-                    if overlap_chars + sent_chars <= CHUNK_OVERLAP:
-                        overlap_sentences.insert(0, sent)
-                        overlap_chars += sent_chars
-                    else:
-                        break
-
-                current_chunk = overlap_sentences
-                current_chars = overlap_chars
-
-            current_chunk.append(sentence)
-            current_chars += sentence_chars
-
-        # Add final chunk
-        if current_chunk:
-            chunk_text = ' '.join(current_chunk)
-            chunks.append({
-                'title': f"{title} (Part {len(chunks) + 1})" if len(chunks) > 0 else title,
-                'text': chunk_text,
-                'char_count': len(chunk_text)
-            })
+        while True:
+            try:
+                result = (
+                    self.supabase_client.table('knowledge_embeddings')
+                    .select('file_name, section_title, metadata')
+                    .eq('project_type', project_type)
+                    .order('id')
+                    .range(start, start + MANIFEST_PAGE_SIZE - 1)
+                    .execute()
+                )
+            except Exception as e:
+                raise Exception(f"Failed to load existing chunks from Supabase: {e}")
 
-        return chunks
+            rows = result.data or []
+            for row in rows:
+                manifest.setdefault(row['file_name'], {})[row['section_title']] = row.get('metadata') or {}
+
+            if len(rows) < MANIFEST_PAGE_SIZE:
+                break
+            start += MANIFEST_PAGE_SIZE
+
+        return manifest
+
+    def delete_sections(self, project_type: str, file_name: str, section_titles: List[str]) -> int:
+        """Delete chunks whose sections no longer exist in the source file"""
+        if not section_titles:
+            return 0
+
+        try:
+            result = (
+                self.supabase_client.table('knowledge_embeddings')
+                .delete()
+                .eq('project_type', project_type)
+                .eq('file_name', file_name)
+                .in_('section_title', section_titles)
+                .execute()
+            )
+            return len(result.data) if result.data else 0
+        except Exception as e:
+            raise Exception(f"Failed to delete stale chunks from Supabase: {e}")
+
+    def delete_file(self, project_type: str, file_name: str) -> int:
+        """Delete every chunk of a file that was removed from the folder"""
+        try:
+            result = (
+                self.supabase_client.table('knowledge_embeddings')
+                .delete()
+                .eq('project_type', project_type)
+                .eq('file_name', file_name)
+                .execute()
+            )
+            return len(result.data) if result.data else 0
+        except Exception as e:
+            raise Exception(f"Failed to delete chunks of {file_name}: {e}")
+
+    def bump_ingest_version(self, project_type: str) -> Optional[int]:
+        """Bump the ingest version of a project_type so retrieval caches drop its results"""
+        try:
+            result = self.supabase_client.rpc(
+                'bump_knowledge_ingest_version', {'target_project_type': project_type}
+            ).execute()
+            return result.data
+        except Exception as e:
+            print(f"⚠️  Could not bump ingest version (retrieval caches expire by TTL instead): {e}")
+            return None
+
+    def generate_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding for a single text using Gemini (served from cache when possible)"""
+        if self.cache:
+            cached = self.cache.get(EMBEDDING_MODEL, text)
+            if cached is not None:
+                return np.asarray(cached, dtype=self.embedding_dtype)
 
-    def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for a single text using Gemini"""
         for attempt in range(MAX_RETRIES):
             try:
+                self.api_calls += 1
                 result = genai.embed_content(
                     model=EMBEDDING_MODEL,
                     content=text,
                     task_type="retrieval_document"
                 )
-                return result['embedding']
+                embedding = np.asarray(result['embedding'], dtype=np.float32)
+                if self.cache:
+                    self.cache.put(EMBEDDING_MODEL, text, embedding)
+                return embedding.astype(self.embedding_dtype, copy=False)
             except Exception as e:
                 if attempt < MAX_RETRIES - 1:
                     wait_time = RETRY_DELAY * (2 ** attempt)  # Exponential backoff
@@ -182,162 +334,331 @@ class KnowledgeEmbedder:
                 else:
                     raise Exception(f"Failed to generate embedding after {MAX_RETRIES} attempts: {e}")
 
-    def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+    def generate_embeddings_batch(self, texts: List[str]) -> List[np.ndarray]:
         """Generate embeddings for multiple texts"""
         embeddings = []
         for text in texts:
+            calls_before = self.api_calls
             embedding = self.generate_embedding(text)
             embeddings.append(embedding)
-            time.sleep(0.1)  # Rate limiting
+            if self.api_calls != calls_before:
+                time.sleep(0.1)  # Rate limiting (cache hits are free)
         return embeddings
 
-    def upsert_to_supabase(self, chunks: List[Dict], project_type: str, file_name: str):
-        """Upload chunks with embeddings to Supabase"""
-        records = []
-
-        for chunk in chunks:
-            record = {
-                'project_type': project_type,
-                'file_name': file_name,
-                'section_title': chunk['title'],
-                'chunk_text': chunk['text'],
-                'embedding': chunk['embedding'],
-                'metadata': {
-                    'char_count': chunk['char_count'],
-                    'chunk_index': chunk.get('index', 0)
-                }
+    def build_record(self, chunk: Dict, project_type: str, file_name: str) -> Dict:
+        """Build the knowledge_embeddings row for an embedded chunk"""
+        return {
+            'project_type': project_type,
+            'file_name': file_name,
+            'section_title': chunk['title'],
+            'chunk_text': chunk['text'],
+            'embedding': format_vector(chunk['embedding']),
+            'metadata': {
+                'char_count': chunk['char_count'],
+                'chunk_index': chunk.get('index', 0),
+                'chunk_id': chunk.get('chunk_id'),
+                'content_hash': chunk['content_hash']
             }
-            records.append(record)
-
-        # Upsert to Supabase
-        try:
-            result = self.supabase_client.table('knowledge_embeddings').insert(records).execute()
-            return len(result.data) if result.data else 0
-        except Exception as e:
-            raise Exception(f"Failed to upsert to Supabase: {e}")
-
-    def process_file(self, file_path: Path, project_type: str, dry_run: bool = False) -> Dict:
-        """Process a single markdown file"""
-        file_name = file_path.name
-
-        # Read file
-        content = self.read_markdown_file(file_path)
+        }
 
-        # Extract sections
-        sections = self.extract_sections(content, file_name)
-        print(f"  - Found {len(sections)} sections")
+    def build_metadata_record(self, chunk: Dict, metadata: Dict, project_type: str, file_name: str) -> Dict:
+        """
+        Build a row that rewrites only the metadata of a stored chunk.
+        chunk_text is NOT NULL so it has to be sent too; embedding is left out,
+        so the upsert keeps the stored vector.
+        """
+        return {
+            'project_type': project_type,
+            'file_name': file_name,
+            'section_title': chunk['title'],
+            'chunk_text': chunk['text'],
+            'metadata': metadata
+        }
 
-        # Chunk sections
-        all_chunks = []
-        for section in sections:
-            chunks = self.chunk_section(section)
-            all_chunks.extend(chunks)
+    def create_writer(self) -> StreamingUpserter:
+        """Create the batched upsert writer for knowledge_embeddings"""
+        return StreamingUpserter(
+            self.supabase_client,
+            'knowledge_embeddings',
+            on_conflict=UPSERT_CONFLICT_COLUMNS,
+            max_rows=UPLOAD_MAX_ROWS,
+            max_bytes=UPLOAD_MAX_BYTES
+        )
+
+    def process_file(self, file_path: Path, project_type: str, dry_run: bool = False,
+                     existing: Optional[Dict[str, Dict]] = None,
+                     writer: Optional[StreamingUpserter] = None,
+                     file_name: Optional[str] = None) -> Dict:
+        """
+        Process a single markdown file.
+        `existing` maps section_title -> stored metadata for rows already stored;
+        only chunks whose content_hash differs are embedded and handed to
+        `writer`; unchanged chunks that moved only get their chunk_index updated.
+        Without a writer, the file's records are written before returning.
+        """
+        chunked = chunk_file(str(file_path), file_name or file_path.name,
+                             self.chunk_size, self.chunk_overlap, self.chunk_unit)
+        return self.process_chunks(chunked, project_type, dry_run, existing, writer)
+
+    def process_chunks(self, chunked: Dict, project_type: str, dry_run: bool = False,
+                       existing: Optional[Dict[str, Dict]] = None,
+                       writer: Optional[StreamingUpserter] = None) -> Dict:
+        """Embed and queue the new/changed chunks of a file produced by chunk_file()"""
+        file_name = chunked['file_name']
+        all_chunks = chunked['chunks']
+        existing = existing or {}
+        print(f"  - Found {chunked['section_count']} sections")
 
         # Check if any sections were split
-        split_count = len(all_chunks) - len(sections)
+        split_count = len(all_chunks) - chunked['section_count']
         if split_count > 0:
             print(f"  - Created {len(all_chunks)} chunks ({split_count} sections split)")
         else:
             print(f"  - Created {len(all_chunks)} chunks")
 
+        # Diff against the stored manifest
+        changed_chunks = [c for c in all_chunks
+                          if (existing.get(c['title']) or {}).get('content_hash') != c['content_hash']]
+        changed_titles = {c['title'] for c in changed_chunks}
+        # Unchanged chunks shifted by sections added/removed above them
+        moved_chunks = [c for c in all_chunks if c['title'] not in changed_titles
+                        and existing[c['title']].get('chunk_index') != c['index']]
+        current_titles = {c['title'] for c in all_chunks}
+        stale_titles = [title for title in existing if title not in current_titles]
+        unchanged = len(all_chunks) - len(changed_chunks)
+
+        print(f"  - {len(changed_chunks)} new/changed, {unchanged} unchanged ({len(moved_chunks)} moved), "
+              f"{len(stale_titles)} removed")
+
+        result = {
+            'file_name': file_name,
+            'chunks': len(all_chunks),
+            'embedded': 0,
+            'uploaded': 0,
+            'unchanged': unchanged,
+            'reindexed': 0,
+            'deleted': 0,
+            'error': None
+        }
+
         if dry_run:
             print(f"  - [DRY RUN] Skipping embedding and upload")
-            return {
-                'file_name': file_name,
-                'chunks': len(all_chunks),
-                'uploaded': 0,
-                'error': None
-            }
+            return result
 
-        # Generate embeddings
-        print(f"  - Generating embeddings...")
-        try:
-            texts = [chunk['text'] for chunk in all_chunks]
-            
-            for i, chunk in enumerate(all_chunks):
-                embedding = self.generate_embedding(chunk['text'])
-                chunk['embedding'] = embedding
-                chunk['index'] = i
-                
-                # Progress indicator
-                if (i + 1) % 10 == 0 or i == len(all_chunks) - 1:
-                    print(f"    Embedded {i + 1}/{len(all_chunks)} chunks")
+        own_writer = writer is None
+        if own_writer:
+            writer = self.create_writer()
+            writer.start()
 
-            # Upload to Supabase
-            print(f"  - Uploading to Supabase...")
-            uploaded = self.upsert_to_supabase(all_chunks, project_type, file_name)
-            print(f"  ✅ Uploaded {uploaded} chunks")
+        try:
+            # Generate embeddings for new/changed chunks only; each record is
+            # queued for upload as soon as it is embedded
+            if changed_chunks:
+                print(f"  - Generating embeddings...")
+            for i, chunk in enumerate(changed_chunks):
+                chunk['embedding'] = self.generate_embedding(chunk['text'])
+                writer.add(self.build_record(chunk, project_type, file_name))
+                result['embedded'] += 1
 
-            return {
-                'file_name': file_name,
-                'chunks': len(all_chunks),
-                'uploaded': uploaded,
-                'error': None
-            }
+                # Progress indicator
+                if (i + 1) % 10 == 0 or i == len(changed_chunks) - 1:
+                    print(f"    Embedded {i + 1}/{len(changed_chunks)} chunks")
+
+            if own_writer:
+                writer.close()
+                result['uploaded'] = writer.written_by_key.get(file_name, 0)
+                result['error'] = writer.errors_by_key.get(file_name)
+                print(f"  ✅ Upserted {result['uploaded']} chunks")
+            elif changed_chunks:
+                print(f"  - Queued {len(changed_chunks)} chunks for upload")
+
+            # Keep chunk_index in step for chunks that only moved, in one
+            # batched upsert. These rows have no embedding column, so they get
+            # their own writer: PostgREST takes the column list of a bulk
+            # upsert from its rows, and mixing them with full records would
+            # null out embeddings.
+            if moved_chunks:
+                metadata_writer = self.create_writer()
+                metadata_writer.start()
+                for chunk in moved_chunks:
+                    metadata = {**existing[chunk['title']], 'chunk_index': chunk['index']}
+                    metadata_writer.add(self.build_metadata_record(chunk, metadata, project_type, file_name))
+                metadata_writer.close()
+                result['reindexed'] = metadata_writer.written_by_key.get(file_name, 0)
+                if file_name in metadata_writer.errors_by_key:
+                    raise Exception(metadata_writer.errors_by_key[file_name])
+                print(f"  🔢 Updated chunk_index of {result['reindexed']} moved chunks")
+
+            # Remove sections that no longer exist
+            if stale_titles:
+                result['deleted'] = self.delete_sections(project_type, file_name, stale_titles)
+                print(f"  🗑️  Deleted {result['deleted']} stale chunks")
+
+            if not changed_chunks and not moved_chunks and not stale_titles:
+                print(f"  ✅ Up to date")
+
+            return result
 
         except Exception as e:
             print(f"  ❌ Error: {e}")
-            return {
-                'file_name': file_name,
-                'chunks': len(all_chunks),
-                'uploaded': 0,
-                'error': str(e)
-            }
+            result['error'] = str(e)
+            if own_writer:
+                writer.close()
+            return result
+
+    def process_folder(self, folder_path: Path, project_type: str, dry_run: bool = False,
+                       prune: bool = False, recursive: bool = True,
+                       workers: Optional[int] = None) -> Dict:
+        """
+        Process all markdown files in a folder (and its subfolders by default).
 
-    def process_folder(self, folder_path: Path, project_type: str, dry_run: bool = False) -> Dict:
-        """Process all markdown files in a folder"""
+        Reading and chunking run in a process pool of `workers` processes;
+        finished files are embedded and queued for upload in completion order,
+        so the pool keeps chunking while the main process embeds.
+        With prune=True, chunks of files that are no longer in the folder are deleted.
+        """
         # Find all .md files
-        md_files = sorted(folder_path.glob('*.md'))
+        md_files = discover_markdown_files(folder_path, recursive)
+        workers = max(1, workers or os.cpu_count() or 1)
 
         if not md_files:
             print(f"⚠️  No .md files found in {folder_path}")
             return {
                 'total_files': 0,
                 'total_chunks': 0,
+                'total_embedded': 0,
                 'total_uploaded': 0,
+                'total_unchanged': 0,
+                'total_deleted': 0,
                 'errors': 0,
                 'results': []
             }
 
         print(f"\n📁 Processing folder: {folder_path}")
         print(f"📋 Project type: {project_type}")
-        print(f"📄 Found {len(md_files)} markdown files\n")
+        print(f"📄 Found {len(md_files)} markdown files")
+        print(f"🧵 Chunking with {min(workers, len(md_files))} worker process(es)")
+
+        manifest = self.fetch_manifest(project_type)
+        print(f"🧾 {sum(len(v) for v in manifest.values())} chunks already stored\n")
 
+        file_names = {path: relative_file_name(path, folder_path) for path in md_files}
         results = []
         total_chunks = 0
+        total_embedded = 0
         total_uploaded = 0
-        errors = 0
+        total_unchanged = 0
+        total_deleted = 0
 
-        for i, file_path in enumerate(md_files, 1):
-            print(f"[{i}/{len(md_files)}] Processing: {file_path.name}")
+        # One writer for the whole folder: batches span files and uploads
+        # overlap with embedding of the following chunks
+        writer = None
+        if not dry_run:
+            writer = self.create_writer()
+            writer.start()
+
+        for i, (file_name, chunked, error) in enumerate(self._iter_chunked(md_files, file_names, workers), 1):
+            print(f"[{i}/{len(md_files)}] Processing: {file_name}")
 
             try:
-                result = self.process_file(file_path, project_type, dry_run)
+                if error:
+                    raise Exception(error)
+                result = self.process_chunks(chunked, project_type, dry_run,
+                                             manifest.get(file_name), writer)
                 results.append(result)
                 total_chunks += result['chunks']
-                total_uploaded += result['uploaded']
-                if result['error']:
-                    errors += 1
+                total_embedded += result['embedded']
+                total_unchanged += result['unchanged']
+                total_deleted += result['deleted']
             except Exception as e:
-                print(f"  ❌ Fatal error processing {file_path.name}: {e}")
+                print(f"  ❌ Fatal error processing {file_name}: {e}")
                 results.append({
-                    'file_name': file_path.name,
+                    'file_name': file_name,
                     'chunks': 0,
+                    'embedded': 0,
                     'uploaded': 0,
+                    'unchanged': 0,
+                    'reindexed': 0,
+                    'deleted': 0,
                     'error': str(e)
                 })
-                errors += 1
 
+            uploaded_so_far = writer.total_written if writer else 0
+            print(f"  📊 Progress: {i}/{len(md_files)} files, {total_chunks} chunks, "
+                  f"{total_embedded} embedded, {uploaded_so_far} uploaded")
             print()  # Blank line between files
 
+        if writer:
+            print(f"⏳ Waiting for uploads to finish...")
+            writer.close()
+            print(f"✅ Upserted {writer.total_written} chunks in {writer.batches} batches\n")
+            for result in results:
+                result['uploaded'] = writer.written_by_key.get(result['file_name'], 0)
+                if not result['error']:
+                    result['error'] = writer.errors_by_key.get(result['file_name'])
+            total_uploaded = writer.total_written
+
+        errors = sum(1 for result in results if result['error'])
+
+        # Files that were stored before but are gone from the folder
+        removed_files = sorted(set(manifest) - set(file_names.values()))
+        if removed_files:
+            if not prune:
+                print(f"ℹ️  {len(removed_files)} stored files are not in the folder (use --prune to delete them)")
+            elif dry_run:
+                print(f"[DRY RUN] Would delete {len(removed_files)} removed files")
+            else:
+                for file_name in removed_files:
+                    try:
+                        deleted = self.delete_file(project_type, file_name)
+                        total_deleted += deleted
+                        print(f"🗑️  Deleted {deleted} chunks of removed file {file_name}")
+                    except Exception as e:
+                        print(f"  ❌ {e}")
+                        errors += 1
+            print()
+
+        # Anything written or deleted invalidates cached retrieval results
+        if not dry_run and (total_uploaded or total_deleted):
+            version = self.bump_ingest_version(project_type)
+            if version is not None:
+                print(f"🔖 Ingest version of '{project_type}' is now {version}\n")
+
         return {
             'total_files': len(md_files),
             'total_chunks': total_chunks,
+            'total_embedded': total_embedded,
             'total_uploaded': total_uploaded,
+            'total_unchanged': total_unchanged,
+            'total_deleted': total_deleted,
             'errors': errors,
             'results': results
         }
 
+    def _iter_chunked(self, md_files: List[Path], file_names: Dict[Path, str], workers: int):
+        """Yield (file_name, chunked, error) for every file, in completion order"""
+        if workers == 1 or len(md_files) == 1:
+            for path in md_files:
+                try:
+                    chunked = chunk_file(str(path), file_names[path],
+                                         self.chunk_size, self.chunk_overlap, self.chunk_unit)
+                    yield file_names[path], chunked, None
+                except Exception as e:
+                    yield file_names[path], None, str(e)
+            return
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(md_files))) as pool:
+            futures = {
+                pool.submit(chunk_file, str(path), file_names[path],
+                            self.chunk_size, self.chunk_overlap, self.chunk_unit): file_names[path]
+                for path in md_files
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, str(e)
+
 
 def main():
     """Main entry point"""
@@ -371,6 +692,72 @@ Examples:
         help='Process files and show chunks without uploading to database'
     )
 
+    parser.add_argument(
+        '--prune',
+        action='store_true',
+        help='Delete stored chunks of files that no longer exist in the folder'
+    )
+
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=TARGET_CHUNK_SIZE_MAX,
+        help=f'Maximum chunk size in --chunk-unit units (default: {TARGET_CHUNK_SIZE_MAX})'
+    )
+
+    parser.add_argument(
+        '--chunk-overlap',
+        type=int,
+        default=CHUNK_OVERLAP,
+        help=f'Overlap between consecutive chunks (default: {CHUNK_OVERLAP})'
+    )
+
+    parser.add_argument(
+        '--chunk-unit',
+        choices=SIZE_UNITS,
+        default=CHUNK_SIZE_UNIT,
+        help=f'Measure chunk size in characters or approximate tokens (default: {CHUNK_SIZE_UNIT})'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Processes used to read and chunk files (default: CPU count)'
+    )
+
+    parser.add_argument(
+        '--no-recursive',
+        action='store_true',
+        help='Only process .md files directly inside the folder'
+    )
+
+    parser.add_argument(
+        '--cache-path',
+        default=os.getenv('EMBEDDING_CACHE_PATH', DEFAULT_CACHE_PATH),
+        help=f'Local embedding cache file (default: {DEFAULT_CACHE_PATH})'
+    )
+
+    parser.add_argument(
+        '--cache-max-mb',
+        type=int,
+        default=DEFAULT_CACHE_MAX_MB,
+        help=f'Maximum size of cached vectors in MB (default: {DEFAULT_CACHE_MAX_MB})'
+    )
+
+    parser.add_argument(
+        '--embedding-dtype',
+        choices=['float32', 'float16'],
+        default=EMBEDDING_DTYPE,
+        help=f'In-memory type of embeddings before upload (default: {EMBEDDING_DTYPE})'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always call the embedding API, bypassing the local cache'
+    )
+
     args = parser.parse_args()
 
     # Validate folder exists
@@ -398,24 +785,48 @@ Examples:
 
     # Initialize embedder
     print("🚀 Initializing Gemini Embedder (FREE)...")
+    cache = None
+    if not args.no_cache:
+        try:
+            cache = EmbeddingCache(args.cache_path, max_bytes=args.cache_max_mb * 1024 * 1024)
+            print(f"💾 Embedding cache: {args.cache_path} ({cache.stats()['entries']} entries)")
+        except Exception as e:
+            print(f"⚠️  Embedding cache disabled: {e}")
+
     try:
-        embedder = KnowledgeEmbedder(gemini_key, supabase_url, supabase_key)
+        embedder = KnowledgeEmbedder(
+            gemini_key, supabase_url, supabase_key, cache,
+            chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, chunk_unit=args.chunk_unit,
+            embedding_dtype=args.embedding_dtype
+        )
     except Exception as e:
         print(f"❌ Error initializing embedder: {e}")
         sys.exit(1)
 
     # Process folder
     start_time = time.time()
-    summary = embedder.process_folder(folder_path, args.project_type, args.dry_run)
+    summary = embedder.process_folder(
+        folder_path, args.project_type, args.dry_run, args.prune,
+        recursive=not args.no_recursive, workers=args.workers
+    )
     elapsed = time.time() - start_time
 
+    if cache:
+        cache.close()
+
     # Print summary
     print("=" * 60)
     print("📊 SUMMARY")
     print("=" * 60)
     print(f"Files processed: {summary['total_files']}")
     print(f"Total chunks: {summary['total_chunks']}")
+    print(f"Unchanged (skipped): {summary['total_unchanged']}")
+    print(f"Embedded: {summary['total_embedded']}")
     print(f"Total uploaded: {summary['total_uploaded']}")
+    print(f"Deleted: {summary['total_deleted']}")
+    print(f"Embedding API calls: {embedder.api_calls}")
+    if cache:
+        print(f"Cache hits/misses: {cache.hits}/{cache.misses}")
     print(f"Errors: {summary['errors']}")
     print(f"Time elapsed: {elapsed:.2f}s")
 
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Offset-based Text Chunker for Sparkfluence RAG
+
+Splits a section into overlapping chunks at sentence boundaries. The engine
+only tracks (start, end) offsets into the original string: sentences are never
+re-joined, overlap is found by binary search over prefix sums of the sentence
+sizes, and every chunk is produced with a single slice, so the cost is linear
+in the length of the input. Sentence offsets and sizes come from C-level
+passes (re.split, map, accumulate) rather than a Python loop per sentence,
+and in token mode the text is tokenized once.
+
+Sizes can be measured in characters (default) or approximate tokens. Every
+chunk gets a stable ID derived from its title and text, so the same input
+always yields the same IDs.
+
+Usage:
+  from chunker import chunk_text
+  chunks = chunk_text(section_text, "Hook Formulas", max_size=1000, overlap=100)
+  chunks = chunk_text(section_text, "Hook Formulas", max_size=250, overlap=25, unit='tokens')
+"""
+
+import hashlib
+import re
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from operator import add, sub
+from typing import Dict, List, Tuple
+
+# Sentence-ending punctuation and the whitespace after it; split keeps it
+# (captured) so the piece lengths add up to offsets into the text
+SENTENCE_BOUNDARY = re.compile(r'([.!?]\s+)')
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+SIZE_UNITS = ('chars', 'tokens')
+
+
+def count_tokens(text: str, start: int = 0, end: int = None) -> int:
+    """Approximate token count (words and punctuation) of text[start:end]"""
+    end = len(text) if end is None else end
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text, start, end))
+
+
+def sentence_sizes(text: str, unit: str = 'chars') -> Tuple[List[int], List[int], List[int]]:
+    """
+    Sentence offsets of text and the prefix sums of their sizes:
+    (starts, ends, prefix) with prefix[k] = total size of sentences before k.
+    """
+    if unit not in SIZE_UNITS:
+        raise ValueError(f"Unknown size unit '{unit}', expected one of {SIZE_UNITS}")
+
+    # body, punctuation + whitespace, body, ...; a sentence keeps its
+    # punctuation, so every sentence but the last ends one past its body
+    pieces = SENTENCE_BOUNDARY.split(text)
+    offsets = [0]
+    offsets.extend(accumulate(map(len, pieces)))
+    starts = offsets[0::2]
+    ends = offsets[1::2]
+    ends[:-1] = map(add, ends[:-1], [1] * (len(ends) - 1))
+
+    if unit == 'tokens':
+        # The punctuation is always exactly one more token
+        sizes = map(add, map(len, map(TOKEN_PATTERN.findall, pieces[0::2])),
+                    [1] * (len(starts) - 1) + [0])
+    else:
+        sizes = map(sub, ends, starts)
+    prefix = [0]
+    prefix.extend(accumulate(sizes))
+    return starts, ends, prefix
+
+
+def chunk_id(title: str, text: str) -> str:
+    """Stable chunk identifier: same title and text always give the same ID"""
+    return hashlib.sha256(f"{title}\0{text}".encode('utf-8')).hexdigest()[:16]
+
+
+def chunk_spans(text: str, max_size: int, overlap: int, unit: str = 'chars') -> List[Tuple[int, int]]:
+    """
+    Return (start, end) offsets of overlapping chunks of text.
+
+    Sentences are accumulated until adding the next one would exceed max_size;
+    the next chunk then starts with the longest run of trailing sentences whose
+    total size fits in overlap. A single sentence larger than max_size becomes
+    its own chunk.
+
+    Sentence sizes are turned into prefix sums once, and each chunk boundary is
+    found with a binary search, so the Python-level work is per chunk rather
+    than per sentence.
+    """
+    return _spans(*sentence_sizes(text, unit), max_size, overlap)
+
+
+def _spans(starts: List[int], ends: List[int], prefix: List[int],
+           max_size: int, overlap: int) -> List[Tuple[int, int]]:
+    count = len(starts)
+    spans: List[Tuple[int, int]] = []
+    first = 0  # first sentence of the current chunk
+    min_next = 1  # the sentence after the last one already placed in the chunk
+
+    while True:
+        # First sentence that no longer fits; a chunk always takes at least
+        # the sentences already placed in it
+        overflow = max(bisect_right(prefix, prefix[first] + max_size) - 1, min_next)
+        if overflow >= count:
+            spans.append((starts[first], ends[count - 1]))
+            return spans
+
+        spans.append((starts[first], ends[overflow - 1]))
+
+        # Longest suffix of the chunk that fits in the overlap budget; the
+        # overflowing sentence is always placed in the next chunk
+        first = bisect_left(prefix, prefix[overflow] - overlap, first, overflow)
+        min_next = overflow + 1
+
+
+def chunk_text(text: str, title: str, max_size: int, overlap: int, unit: str = 'chars') -> List[Dict]:
+    """
+    Chunk a section's text. Sections that fit in max_size are returned whole;
+    larger ones are split and titled "<title> (Part n)".
+    """
+    if unit == 'chars' and len(text) <= max_size:
+        spans = [(0, len(text))]
+    else:
+        starts, ends, prefix = sentence_sizes(text, unit)
+        if prefix[-1] <= max_size:
+            spans = [(0, len(text))]
+        else:
+            spans = _spans(starts, ends, prefix, max_size, overlap)
+
+    chunks = []
+    for i, (start, end) in enumerate(spans):
+        chunk_title = f"{title} (Part {i + 1})" if len(spans) > 1 else title
+        chunk = text[start:end]
+        chunks.append({
+            'title': chunk_title,
+            'text': chunk,
+            'char_count': len(chunk),
+            'start': start,
+            'end': end,
+            'chunk_id': chunk_id(chunk_title, chunk)
+        })
+
+    return chunks
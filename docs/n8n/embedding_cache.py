@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Persistent Embedding Cache for Sparkfluence RAG
+
+Stores Gemini embeddings on disk in a single SQLite file, keyed by
+(embedding model, sha256 of the normalized text). chunk_and_embed.py checks
+the cache before calling the API, so dry runs, failed runs and interrupted
+bulk ingests never pay for the same text twice.
+
+Vectors are stored as raw float32 blobs. The cache is bounded by entry count
+and total vector bytes; when either limit is exceeded the least recently used
+entries are evicted. Both totals are kept in a one-row side table by
+triggers, so checking the limits doesn't scan the cache.
+
+Usage:
+  cache = EmbeddingCache(".embedding_cache.sqlite", max_bytes=512 * 1024 * 1024)
+  vector = cache.get(EMBEDDING_MODEL, text)
+  if vector is None:
+      vector = embed(text)
+      cache.put(EMBEDDING_MODEL, text, vector)
+"""
+
+import hashlib
+import sqlite3
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+# Defaults
+DEFAULT_MAX_ENTRIES = 500_000
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB of vector data
+EVICT_CHECK_INTERVAL = 100  # puts between limit checks
+EVICT_TARGET_RATIO = 0.9  # evict down to 90% of the limit to avoid thrashing
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so formatting-only edits hit the same cache entry"""
+    return ' '.join(text.split())
+
+
+def text_hash(text: str) -> str:
+    """sha256 of the normalized text"""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed LRU cache of embedding vectors"""
+
+    def __init__(self, path: Union[str, Path], max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_check = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)')
+        self._create_size_table()
+
+    def _create_size_table(self):
+        """Running entry/byte totals, maintained by triggers (seeded once from existing caches)"""
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    entries INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL
+                )
+            """)
+            self.conn.execute(
+                'INSERT OR IGNORE INTO cache_size (id, entries, bytes) '
+                'SELECT 1, COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings'
+            )
+            self.conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS embeddings_size_insert AFTER INSERT ON embeddings
+                BEGIN
+                    UPDATE cache_size SET entries = entries + 1, bytes = bytes + LENGTH(NEW.vector) WHERE id = 1;
+                END
+            """)
+            self.conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS embeddings_size_delete AFTER DELETE ON embeddings
+                BEGIN
+                    UPDATE cache_size SET entries = entries - 1, bytes = bytes - LENGTH(OLD.vector) WHERE id = 1;
+                END
+            """)
+            self.conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS embeddings_size_update AFTER UPDATE OF vector ON embeddings
+                BEGIN
+                    UPDATE cache_size SET bytes = bytes - LENGTH(OLD.vector) + LENGTH(NEW.vector) WHERE id = 1;
+                END
+            """)
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Return the cached vector for (model, text), or None"""
+        key = text_hash(text)
+        row = self.conn.execute(
+            'SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?',
+            (model, key)
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.conn.execute(
+            'UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?',
+            (time.time(), model, key)
+        )
+        vector = array('f')
+        vector.frombytes(row[0])
+        return vector.tolist()
+
+    def put(self, model: str, text: str, vector: Sequence[float]):
+        """Store a vector, evicting old entries when the cache is over its limits"""
+        now = time.time()
+        blob = array('f', vector).tobytes()
+        # Upsert rather than INSERT OR REPLACE: REPLACE's implicit delete doesn't fire the size trigger
+        self.conn.execute(
+            'INSERT INTO embeddings (model, text_hash, dim, vector, created_at, last_used) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (model, text_hash) DO UPDATE SET '
+            'dim = excluded.dim, vector = excluded.vector, created_at = excluded.created_at, '
+            'last_used = excluded.last_used',
+            (model, text_hash(text), len(vector), blob, now, now)
+        )
+
+        self._puts_since_check += 1
+        if self._puts_since_check >= EVICT_CHECK_INTERVAL:
+            self.evict()
+
+    def stats(self) -> Dict[str, int]:
+        """Entry count and total vector bytes currently stored"""
+        entries, total_bytes = self.conn.execute(
+            'SELECT entries, bytes FROM cache_size WHERE id = 1'
+        ).fetchone()
+        return {'entries': entries, 'bytes': total_bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def evict(self) -> int:
+        """Drop least recently used entries until both limits are satisfied"""
+        self._puts_since_check = 0
+        stats = self.stats()
+        if stats['entries'] <= self.max_entries and stats['bytes'] <= self.max_bytes:
+            return 0
+
+        avg_bytes = stats['bytes'] / stats['entries'] if stats['entries'] else 0
+        target_entries = int(self.max_entries * EVICT_TARGET_RATIO)
+        if avg_bytes:
+            target_entries = min(target_entries, int(self.max_bytes * EVICT_TARGET_RATIO / avg_bytes))
+        to_remove = max(stats['entries'] - target_entries, 0)
+
+        self.conn.execute(
+            'DELETE FROM embeddings WHERE rowid IN '
+            '(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)',
+            (to_remove,)
+        )
+        return to_remove
+
+    def clear(self, model: Optional[str] = None):
+        """Remove all entries, or only the entries of one model"""
+        if model:
+            self.conn.execute('DELETE FROM embeddings WHERE model = ?', (model,))
+        else:
+            self.conn.execute('DELETE FROM embeddings')
+
+    def close(self):
+        """Apply limits and close the database"""
+        self.evict()
+        self.conn.close()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Vector Index Manager for Sparkfluence RAG
+
+Keeps the pgvector ANN index sized for the corpus instead of the hand-tuned
+`ivfflat ... WITH (lists = 100)`. For every project_type it:
+
+  1. measures the corpus size (knowledge_corpus_stats)
+  2. picks an index method and build parameters
+       < EXACT_SEARCH_MAX_ROWS rows   -> no ANN index (exact sequential scan)
+       hnsw (default)                 -> m / ef_construction by corpus size
+       ivfflat (--method ivfflat)     -> lists = rows / 1000 (sqrt(rows) above 1M)
+  3. rebuilds that project_type's partial index (rebuild_knowledge_index)
+  4. sweeps the search parameter (ivfflat.probes / hnsw.ef_search) over a
+     held-out query set, measuring recall@k against exact local search and
+     latency through match_knowledge_tuned, and stores the smallest value that
+     reaches --target-recall in knowledge_index_settings
+
+Requires migration 20251215100000_add_knowledge_index_management.sql.
+Queries should call match_knowledge_tuned to pick up the stored parameters.
+
+Usage:
+  python manage_index.py stats
+  python manage_index.py rebuild --project-type viral_script
+  python manage_index.py rebuild --project-type image_video --method ivfflat
+  python manage_index.py sweep --project-type viral_script --queries 100 --k 10
+  python manage_index.py tune --project-type viral_script            # rebuild + sweep
+  python manage_index.py rebuild --project-type viral_script --print-sql
+
+Environment Variables:
+  - SUPABASE_URL: Your Supabase project URL
+  - SUPABASE_SERVICE_KEY: Your Supabase service role key
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from vector_store import LocalVectorIndex, export_snapshot, normalize_rows
+
+try:
+    from supabase import create_client
+except ImportError as e:
+    print(f"❌ Error: Missing required dependency: {e}")
+    print("Please install dependencies:")
+    print("  pip install -r requirements.txt")
+    sys.exit(1)
+
+# Load environment variables
+load_dotenv()
+
+# Constants
+PROJECT_TYPES = ['viral_script', 'image_video']
+EXACT_SEARCH_MAX_ROWS = 10_000  # below this a sequential scan is exact and fast enough
+IVFFLAT_SQRT_THRESHOLD = 1_000_000  # pgvector guidance: rows/1000 lists, sqrt(rows) above 1M
+DEFAULT_TARGET_RECALL = 0.95
+DEFAULT_SWEEP_QUERIES = 100
+DEFAULT_K = 10
+PROBE_CANDIDATES = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+EF_SEARCH_CANDIDATES = [10, 20, 40, 64, 100, 150, 200, 300, 400]
+
+
+def recommend_parameters(row_count: int, method: Optional[str] = None) -> Dict:
+    """Choose an index method and build parameters for a corpus size"""
+    if method is None:
+        method = 'exact' if row_count < EXACT_SEARCH_MAX_ROWS else 'hnsw'
+
+    params = {'method': method, 'lists': None, 'probes': None, 'm': None,
+              'ef_construction': None, 'ef_search': None, 'row_count': row_count}
+
+    if method == 'ivfflat':
+        if row_count > IVFFLAT_SQRT_THRESHOLD:
+            lists = int(math.sqrt(row_count))
+        else:
+            lists = max(1, row_count // 1000)
+        params['lists'] = lists
+        params['probes'] = max(1, int(math.sqrt(lists)))
+    elif method == 'hnsw':
+        large = row_count > IVFFLAT_SQRT_THRESHOLD
+        params['m'] = 24 if large else 16
+        params['ef_construction'] = 128 if large else 64
+        params['ef_search'] = 40
+
+    return params
+
+
+def rebuild_sql(project_type: str, params: Dict) -> str:
+    """Equivalent DDL, for running by hand when the RPC would hit a statement timeout"""
+    index_name = f"idx_knowledge_embeddings_vector_{project_type}"
+    lines = [f"DROP INDEX IF EXISTS {index_name};"]
+    if params['method'] == 'ivfflat':
+        lines.append(f"CREATE INDEX {index_name} ON knowledge_embeddings USING ivfflat "
+                     f"(embedding vector_cosine_ops) WITH (lists = {params['lists']}) "
+                     f"WHERE project_type = '{project_type}';")
+    elif params['method'] == 'hnsw':
+        lines.append(f"CREATE INDEX {index_name} ON knowledge_embeddings USING hnsw "
+                     f"(embedding vector_cosine_ops) WITH (m = {params['m']}, "
+                     f"ef_construction = {params['ef_construction']}) "
+                     f"WHERE project_type = '{project_type}';")
+    # match_knowledge needs the global index until every project_type has its own
+    partial_indexes = ', '.join(f"'idx_knowledge_embeddings_vector_{name}'" for name in PROJECT_TYPES)
+    lines.append("DO $$ BEGIN\n"
+                 "  IF NOT EXISTS (SELECT 1 FROM unnest(ARRAY[" + partial_indexes + "]) AS t(name)\n"
+                 "                 WHERE to_regclass(t.name) IS NULL) THEN\n"
+                 "    DROP INDEX IF EXISTS idx_knowledge_embeddings_vector;\n"
+                 "  END IF;\n"
+                 "END $$;")
+    lines.append("ANALYZE knowledge_embeddings;")
+    return '\n'.join(lines)
+
+
+class IndexManager:
+    """Measures, rebuilds and tunes the knowledge_embeddings vector index"""
+
+    def __init__(self, supabase_url: str, supabase_key: str):
+        self.client = create_client(supabase_url, supabase_key)
+
+    def corpus_stats(self) -> Dict[str, int]:
+        """Row count per project_type"""
+        result = self.client.rpc('knowledge_corpus_stats', {}).execute()
+        stats = {project_type: 0 for project_type in PROJECT_TYPES}
+        for row in result.data or []:
+            stats[row['project_type']] = int(row['row_count'])
+        return stats
+
+    def load_settings(self, project_type: str) -> Optional[Dict]:
+        result = (
+            self.client.table('knowledge_index_settings')
+            .select('*')
+            .eq('project_type', project_type)
+            .execute()
+        )
+        return result.data[0] if result.data else None
+
+    def save_settings(self, project_type: str, params: Dict):
+        record = {'project_type': project_type, **params,
+                  'updated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+        self.client.table('knowledge_index_settings').upsert(record, on_conflict='project_type').execute()
+
+    def rebuild(self, project_type: str, params: Dict) -> str:
+        """Drop and recreate the partial index of one project_type"""
+        result = self.client.rpc('rebuild_knowledge_index', {
+            'target_project_type': project_type,
+            'index_method': params['method'],
+            'index_lists': params['lists'],
+            'index_m': params['m'],
+            'index_ef_construction': params['ef_construction']
+        }).execute()
+        self.save_settings(project_type, params)
+        return result.data
+
+    def query(self, embedding: np.ndarray, project_type: str, k: int,
+              probes: Optional[int] = None, ef_search: Optional[int] = None,
+              exact: Optional[bool] = None) -> List[str]:
+        """Run match_knowledge_tuned with explicit search parameters, return ids"""
+        result = self.client.rpc('match_knowledge_tuned', {
+            'query_embedding': [float(x) for x in embedding],
+            'match_threshold': -1.0,
+            'match_count': k,
+            'filter_project_type': project_type,
+            'search_probes': probes,
+            'search_ef': ef_search,
+            'exact_search': exact
+        }).execute()
+        return [row['id'] for row in result.data or []]
+
+    def sweep(self, project_type: str, snapshot: LocalVectorIndex, queries: np.ndarray, k: int,
+              target_recall: float) -> Dict:
+        """
+        Measure recall@k and latency for each search-parameter candidate and
+        store the cheapest one that reaches target_recall.
+        """
+        lo, hi = snapshot.project_types.get(project_type, (0, 0))
+        settings = self.load_settings(project_type) or recommend_parameters(hi - lo)
+        method = settings['method']
+
+        truth = [[m['id'] for m in matches]
+                 for matches in snapshot.search_batch(queries, k=k, threshold=-1.0, project_type=project_type)]
+
+        if method == 'ivfflat':
+            knob, candidates = 'probes', [p for p in PROBE_CANDIDATES if p <= (settings.get('lists') or 1)]
+        elif method == 'hnsw':
+            knob, candidates = 'ef_search', [e for e in EF_SEARCH_CANDIDATES if e >= k]
+        else:
+            knob, candidates = None, [None]
+
+        print(f"\n🔬 Sweep for {project_type} ({method}), {len(queries)} queries, k={k}")
+        print(f"  {knob or 'exact':>10} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+
+        chosen = None
+        rows = []
+        for value in candidates:
+            latencies = []
+            found = []
+            for query in queries:
+                start = time.perf_counter()
+                found.append(self.query(query, project_type, k,
+                                        probes=value if knob == 'probes' else None,
+                                        ef_search=value if knob == 'ef_search' else None,
+                                        exact=True if knob is None else None))
+                latencies.append(time.perf_counter() - start)
+
+            hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+            total = sum(len(t) for t in truth) or 1
+            recall = hits / total
+            p50 = float(np.percentile(latencies, 50) * 1000)
+            p95 = float(np.percentile(latencies, 95) * 1000)
+            rows.append({'value': value, 'recall': recall, 'p50_ms': p50, 'p95_ms': p95})
+            print(f"  {str(value if value is not None else '-'):>10} {recall:>9.3f} {p50:>8.1f} {p95:>8.1f}")
+
+            if recall >= target_recall:
+                chosen = rows[-1]
+                break
+
+        if chosen is None:
+            chosen = max(rows, key=lambda r: r['recall'])
+            print(f"  ⚠️  Target recall {target_recall} not reached, using best observed")
+
+        params = {key: settings.get(key) for key in
+                  ('method', 'lists', 'probes', 'm', 'ef_construction', 'ef_search', 'row_count')}
+        if knob:
+            params[knob] = chosen['value']
+        params['recall_at_k'] = chosen['recall']
+        params['p95_ms'] = chosen['p95_ms']
+        self.save_settings(project_type, params)
+        print(f"  ✅ Stored {knob or 'exact'}={chosen['value']} (recall@{k} {chosen['recall']:.3f}, "
+              f"p95 {chosen['p95_ms']:.1f} ms)")
+        return {'project_type': project_type, 'knob': knob, 'results': rows, 'chosen': chosen}
+
+
+def held_out_queries(snapshot: LocalVectorIndex, project_type: str, count: int,
+                     queries_file: Optional[str], seed: int = 7) -> np.ndarray:
+    """
+    Query set for the sweep: embeddings from --queries-file (JSON list of
+    vectors) or, by default, perturbed copies of stored embeddings.
+    """
+    if queries_file:
+        with open(queries_file, 'r', encoding='utf-8') as f:
+            return normalize_rows(np.asarray(json.load(f), dtype=np.float32))
+
+    lo, hi = snapshot.project_types.get(project_type, (0, 0))
+    if hi <= lo:
+        return np.zeros((0, snapshot.embeddings.shape[1]), dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(lo, hi, count)
+    base = np.asarray(snapshot.embeddings[picks], dtype=np.float32)
+    noise = rng.standard_normal(base.shape).astype(np.float32) * np.float32(0.3 / math.sqrt(base.shape[1]))
+    return normalize_rows(base + noise)
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='Size, rebuild and tune the knowledge_embeddings vector index',
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('command', choices=['stats', 'rebuild', 'sweep', 'tune'])
+    parser.add_argument('--project-type', choices=PROJECT_TYPES,
+                        help='Project type to act on (default: all)')
+    parser.add_argument('--method', choices=['exact', 'ivfflat', 'hnsw'],
+                        help='Force an index method instead of choosing by corpus size')
+    parser.add_argument('--queries', type=int, default=DEFAULT_SWEEP_QUERIES,
+                        help=f'Held-out queries sampled for the sweep (default: {DEFAULT_SWEEP_QUERIES})')
+    parser.add_argument('--queries-file', help='JSON list of query embeddings to use instead of samples')
+    parser.add_argument('--snapshot', help='Existing vector_store.py snapshot used as ground truth')
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--target-recall', type=float, default=DEFAULT_TARGET_RECALL)
+    parser.add_argument('--print-sql', action='store_true',
+                        help='Print the rebuild DDL instead of executing it')
+    args = parser.parse_args()
+
+    supabase_url = os.getenv('SUPABASE_URL')
+    supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
+    if not supabase_url or not supabase_key:
+        print("❌ Error: SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+        sys.exit(1)
+
+    manager = IndexManager(supabase_url, supabase_key)
+    project_types = [args.project_type] if args.project_type else PROJECT_TYPES
+    stats = manager.corpus_stats()
+
+    print("📊 Corpus size")
+    for project_type in PROJECT_TYPES:
+        recommended = recommend_parameters(stats[project_type], args.method)
+        print(f"  - {project_type}: {stats[project_type]} rows -> {recommended['method']}"
+              + (f" lists={recommended['lists']} probes={recommended['probes']}" if recommended['lists'] else '')
+              + (f" m={recommended['m']} ef_construction={recommended['ef_construction']}" if recommended['m'] else ''))
+
+    if args.command in ('rebuild', 'tune'):
+        for project_type in project_types:
+            params = recommend_parameters(stats[project_type], args.method)
+            if args.print_sql:
+                print(f"\n-- {project_type}\n{rebuild_sql(project_type, params)}")
+                continue
+            print(f"\n🔧 Rebuilding {project_type} index ({params['method']})...")
+            start = time.time()
+            manager.rebuild(project_type, params)
+            print(f"  ✅ Done in {time.time() - start:.1f}s")
+
+    if args.command in ('sweep', 'tune') and not args.print_sql:
+        if args.snapshot:
+            snapshot = LocalVectorIndex.load(args.snapshot)
+        else:
+            prefix = Path(tempfile.mkdtemp(prefix='sparkfluence_index_')) / 'knowledge'
+            print(f"\n📦 Exporting ground-truth snapshot to {prefix}...")
+            export_snapshot(manager.client, prefix)
+            snapshot = LocalVectorIndex.load(prefix)
+
+        for project_type in project_types:
+            queries = held_out_queries(snapshot, project_type, args.queries, args.queries_file)
+            if len(queries) == 0:
+                print(f"\n⚠️  No embeddings for {project_type}, skipping sweep")
+                continue
+            manager.sweep(project_type, snapshot, queries, args.k, args.target_recall)
+
+
+if __name__ == '__main__':
+    main()
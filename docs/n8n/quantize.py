@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Compact Embedding Storage for Sparkfluence RAG
+
+Scalar quantization of L2-normalized embedding matrices:
+
+  float32  4 bytes/dim  exact
+  float16  2 bytes/dim  ~3 significant digits, recall practically unchanged;
+                        saves memory and disk only: numpy's float16 -> float32
+                        cast is slow, so a single-query search is several times
+                        slower than float32 (search_batch amortizes the cast)
+  int8     1 byte/dim   symmetric per-row scale (max |x| -> 127), one float32
+                        scale per row; scores are dequantized per block
+
+Used by vector_store.py snapshots (`export --dtype`), the ingestion pipeline
+(`chunk_and_embed.py --embedding-dtype`) and bench_quantization.py.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+QUANTIZATION_DTYPES = ('float32', 'float16', 'int8')
+INT8_LEVELS = 127
+
+
+def quantize(matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Quantize an (n, dim) float matrix.
+    Returns (codes, scales); scales is None except for int8.
+    """
+    if dtype not in QUANTIZATION_DTYPES:
+        raise ValueError(f"Unknown dtype '{dtype}', expected one of {', '.join(QUANTIZATION_DTYPES)}")
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype != 'int8':
+        return matrix.astype(dtype), None
+
+    scales = np.abs(matrix).max(axis=-1, keepdims=True) / INT8_LEVELS
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales), -INT8_LEVELS, INT8_LEVELS).astype(np.int8)
+    return codes, scales[..., 0].astype(np.float32)
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Back to float32 (codes may be a slice of a memory-mapped matrix)"""
+    matrix = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        matrix *= np.asarray(scales, dtype=np.float32)[..., None]
+    return matrix
+
+
+def bytes_per_row(dimension: int, dtype: str) -> int:
+    """Storage per embedding, including the int8 scale"""
+    if dtype == 'int8':
+        return dimension + 4
+    return dimension * np.dtype(dtype).itemsize
+
+
+def format_vector(vector: Sequence[float]) -> str:
+    """
+    pgvector text literal '[0.1,0.2,...]'; accepted by PostgREST for vector/halfvec columns.
+    9 significant digits round-trip every float32 exactly.
+    """
+    values = np.asarray(vector, dtype=np.float32)
+    return '[' + ','.join(np.char.mod('%.9g', values)) + ']'
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Retrieval Cache for Sparkfluence Script Generation
+
+Script generation asks the knowledge base the same questions over and over.
+KnowledgeRetriever wraps query embedding + vector search with two cache levels:
+
+  L1  normalized query text          -> query embedding   (per embedding model)
+  L2  (embedding hash, project_type,
+       k, threshold, ingest version) -> result ids + similarity
+
+Both levels are LRU with a TTL. Matched rows are kept in a shared id -> row
+cache so L2 only stores ids. The ingest version of each project_type is read
+from knowledge_ingest_versions (bumped by chunk_and_embed.py after every run
+that changed the knowledge base) at most every VERSION_CHECK_INTERVAL seconds;
+a new version drops that project_type's L2 entries, so re-ingesting never
+serves stale results.
+
+Search goes through the match_knowledge RPC, or through a LocalVectorIndex
+snapshot when one is given.
+
+Usage:
+  retriever = KnowledgeRetriever(supabase_client)
+  matches = retriever.search("hook formulas for finance tiktok", project_type="viral_script", k=8)
+  print(retriever.stats())
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+# Defaults
+EMBEDDING_MODEL = "models/text-embedding-004"
+QUERY_CACHE_SIZE = 2048  # L1 entries
+QUERY_CACHE_TTL = 24 * 3600  # seconds; embeddings only change with the model
+RESULT_CACHE_SIZE = 4096  # L2 entries
+RESULT_CACHE_TTL = 3600  # seconds
+ROW_CACHE_SIZE = 20000  # chunk rows referenced by cached results
+VERSION_CHECK_INTERVAL = 30  # seconds between ingest version reads
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, max_entries: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < self.clock():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (self.clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches predicate"""
+        with self._lock:
+            doomed = [key for key in self._data if predicate(key)]
+            for key in doomed:
+                del self._data[key]
+            return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def embedding_hash(embedding: np.ndarray) -> str:
+    """Key for an embedding: hash of its float32 bytes"""
+    return hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+
+
+class KnowledgeRetriever:
+    """Cached query embedding and knowledge search"""
+
+    def __init__(self, supabase_client=None, embed_fn: Optional[Callable[[str], List[float]]] = None,
+                 local_index=None, embedding_model: str = EMBEDDING_MODEL,
+                 clock: Callable[[], float] = time.monotonic):
+        if supabase_client is None and local_index is None:
+            raise ValueError("KnowledgeRetriever needs a Supabase client or a LocalVectorIndex")
+
+        self.client = supabase_client
+        self.local_index = local_index
+        self.embedding_model = embedding_model
+        self.embed_fn = embed_fn or self._embed_with_gemini
+        self.clock = clock
+
+        self.query_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL, clock)
+        self.result_cache = TTLCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, clock)
+        self.row_cache = TTLCache(ROW_CACHE_SIZE, RESULT_CACHE_TTL, clock)
+
+        self.versions: Dict[str, int] = {}
+        self._versions_checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _embed_with_gemini(self, text: str) -> List[float]:
+        import google.generativeai as genai
+
+        result = genai.embed_content(model=self.embedding_model, content=text, task_type="retrieval_query")
+        return result['embedding']
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """L1: normalized query text -> embedding (the key is exactly the text that gets embedded)"""
+        text = normalize_text(text)
+        key = (self.embedding_model, text)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = np.asarray(self.embed_fn(text), dtype=np.float32)
+            self.query_cache.set(key, embedding)
+        return embedding
+
+    def refresh_versions(self, force: bool = False):
+        """Re-read ingest versions (throttled) and invalidate project types that changed"""
+        if self.client is None:
+            return
+
+        with self._lock:
+            now = self.clock()
+            if not force and self._versions_checked_at is not None and \
+                    now - self._versions_checked_at < VERSION_CHECK_INTERVAL:
+                return
+            self._versions_checked_at = now
+
+        try:
+            result = self.client.table('knowledge_ingest_versions').select('project_type, version').execute()
+        except Exception:
+            return  # keep serving with the versions we have
+
+        for row in result.data or []:
+            project_type, version = row['project_type'], int(row['version'])
+            if self.versions.get(project_type, version) != version:
+                self.invalidate(project_type)
+            self.versions[project_type] = version
+
+    def invalidate(self, project_type: Optional[str] = None) -> int:
+        """Drop cached results of one project_type (or of all project types)"""
+        if project_type is None:
+            dropped = len(self.result_cache)
+            self.result_cache.clear()
+            return dropped
+        # Unfiltered searches (project_type None) cover every project type
+        return self.result_cache.invalidate(lambda key: key[1] in (project_type, None))
+
+    def _version_key(self, project_type: Optional[str]) -> Tuple:
+        if project_type is None:
+            return tuple(sorted(self.versions.items()))
+        return (self.versions.get(project_type, 0),)
+
+    def _search_backend(self, embedding: np.ndarray, project_type: Optional[str], k: int,
+                        threshold: float) -> List[Dict]:
+        if self.local_index is not None:
+            return self.local_index.search(embedding, k=k, threshold=threshold, project_type=project_type)
+
+        result = self.client.rpc('match_knowledge', {
+            'query_embedding': [float(x) for x in embedding],
+            'match_threshold': threshold,
+            'match_count': k,
+            'filter_project_type': project_type
+        }).execute()
+        return result.data or []
+
+    def search(self, query: str, project_type: Optional[str] = None, k: int = 10,
+               threshold: float = 0.5) -> List[Dict]:
+        """Embed (cached) and search (cached); returns match_knowledge-shaped rows"""
+        self.refresh_versions()
+        embedding = self.embed_query(query)
+        key = (embedding_hash(embedding), project_type, k, round(threshold, 6), self._version_key(project_type))
+
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            rows = []
+            for row_id, similarity in cached:
+                row = self.row_cache.get(row_id)
+                if row is None:
+                    break  # row evicted; fall through to a fresh search
+                rows.append({**row, 'similarity': similarity})
+            else:
+                return rows
+
+        matches = self._search_backend(embedding, project_type, k, threshold)
+        for match in matches:
+            self.row_cache.set(match['id'], {key_: value for key_, value in match.items() if key_ != 'similarity'})
+        self.result_cache.set(key, [(match['id'], match['similarity']) for match in matches])
+        return matches
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters per cache level"""
+        return {
+            name: {'entries': len(cache), 'hits': cache.hits, 'misses': cache.misses}
+            for name, cache in (('query', self.query_cache), ('result', self.result_cache))
+        }
@@ -32,7 +32,10 @@ CREATE TABLE IF NOT EXISTS knowledge_embeddings (
 -- ============================================================================
 -- Using IVFFlat for efficient approximate nearest neighbor search
 -- Lists parameter: 100 (good for up to 10K vectors)
--- For larger datasets (>100K vectors), increase lists to sqrt(total_rows)
+-- As the corpus grows, let manage_index.py size per-project_type indexes and
+-- tune probes/ef_search (needs migration 20251215100000_add_knowledge_index_management.sql):
+--   python manage_index.py tune
+-- This global index is dropped once every project_type has a partial index.
 CREATE INDEX IF NOT EXISTS idx_knowledge_embeddings_vector
 ON knowledge_embeddings
 USING ivfflat (embedding vector_cosine_ops)
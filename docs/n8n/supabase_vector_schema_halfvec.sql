@@ -0,0 +1,78 @@
+-- ============================================================================
+-- Sparkfluence RAG Vector Database Schema - halfvec (float16) Variant
+-- ============================================================================
+-- Purpose: Optional compact storage for knowledge embeddings. Run AFTER
+--          supabase_vector_schema.sql. Requires pgvector >= 0.7.0 (halfvec).
+--
+-- A halfvec(768) is 2 bytes/dim (~1.5 KB per row) instead of 4 bytes/dim for
+-- VECTOR(768); recall of cosine top-k is practically unchanged
+-- (python bench_quantization.py measures it on your data).
+--
+-- Option A (default, below): keep the float32 column and index a halfvec
+--   expression. The ANN index is half the size and match_knowledge keeps
+--   working; match_knowledge_halfvec searches the compact index and re-ranks
+--   the candidates with the full-precision column.
+-- Option B (commented, end of file): convert the column itself to halfvec to
+--   also halve table storage. Irreversible precision loss; match_knowledge
+--   must then take a HALFVEC(768) query.
+-- ============================================================================
+
+-- 1. Compact ANN index on the halfvec expression
+-- ============================================================================
+CREATE INDEX IF NOT EXISTS idx_knowledge_embeddings_halfvec
+ON knowledge_embeddings
+USING hnsw ((embedding::halfvec(768)) halfvec_cosine_ops);
+
+-- 2. Search the halfvec index, re-rank with full precision
+-- ============================================================================
+CREATE OR REPLACE FUNCTION match_knowledge_halfvec(
+  query_embedding VECTOR(768),
+  match_threshold FLOAT DEFAULT 0.5,
+  match_count INT DEFAULT 10,
+  filter_project_type TEXT DEFAULT NULL,
+  rerank_factor INT DEFAULT 4
+)
+RETURNS TABLE (
+  id UUID,
+  project_type TEXT,
+  file_name TEXT,
+  section_title TEXT,
+  chunk_text TEXT,
+  metadata JSONB,
+  similarity FLOAT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH candidates AS (
+    SELECT ke.*
+    FROM knowledge_embeddings ke
+    WHERE filter_project_type IS NULL OR ke.project_type = filter_project_type
+    ORDER BY ke.embedding::halfvec(768) <=> query_embedding::halfvec(768)
+    LIMIT match_count * rerank_factor
+  )
+  SELECT
+    c.id,
+    c.project_type,
+    c.file_name,
+    c.section_title,
+    c.chunk_text,
+    c.metadata,
+    1 - (c.embedding <=> query_embedding) AS similarity
+  FROM candidates c
+  WHERE 1 - (c.embedding <=> query_embedding) > match_threshold
+  ORDER BY c.embedding <=> query_embedding
+  LIMIT match_count;
+$$;
+
+-- 3. Option B: store the column as halfvec (uncomment to apply)
+-- ============================================================================
+-- DROP INDEX IF EXISTS idx_knowledge_embeddings_halfvec;
+-- DROP INDEX IF EXISTS idx_knowledge_embeddings_vector;
+-- ALTER TABLE knowledge_embeddings
+--   ALTER COLUMN embedding TYPE halfvec(768) USING embedding::halfvec(768);
+-- CREATE INDEX idx_knowledge_embeddings_vector
+--   ON knowledge_embeddings USING hnsw (embedding halfvec_cosine_ops);
+-- -- Then recreate match_knowledge with `query_embedding HALFVEC(768)`.
+-- -- chunk_and_embed.py needs no change: it uploads '[...]' text literals,
+-- -- which PostgREST casts to either column type.
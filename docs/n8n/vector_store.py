@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Local Vector Retrieval Engine for Sparkfluence RAG
+
+In-process alternative to the match_knowledge SQL function. The
+knowledge_embeddings table is exported once to a local snapshot:
+
+  <prefix>.npy   embedding matrix, one L2-normalized embedding per row,
+                 rows grouped by project_type; float32, float16 or int8
+                 (see quantize.py)
+  <prefix>.scales.npy  per-row scales (int8 snapshots only)
+  <prefix>.json  row metadata (id, project_type, file_name, section_title,
+                 chunk_text, metadata) plus the row range of each project_type
+
+The matrix is memory-mapped on load, so opening a snapshot is instant and
+pages are shared between processes. Top-k cosine queries are a single
+matrix-vector (or matrix-matrix for batches) product over the rows of the
+requested project_type, followed by argpartition. Compact (float16/int8)
+snapshots are converted block by block while scoring, so a float32 copy never
+exists for more than SCORE_BLOCK_ROWS rows at a time; int8 row scales are
+applied to the scores rather than to every element.
+
+Usage:
+  python vector_store.py export --out snapshots/knowledge
+  python vector_store.py export --out snapshots/knowledge --dtype int8
+  python vector_store.py stats --snapshot snapshots/knowledge
+
+  index = LocalVectorIndex.load("snapshots/knowledge")
+  matches = index.search(query_embedding, k=10, threshold=0.5, project_type="viral_script")
+  matches = index.search_hybrid("#fyp hook formula", query_embedding, k=10, project_type="viral_script")
+
+Environment Variables (export only):
+  - SUPABASE_URL: Your Supabase project URL
+  - SUPABASE_SERVICE_KEY: Your Supabase service role key
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from bm25 import RRF_K, BM25Index, reciprocal_rank_fusion
+from quantize import QUANTIZATION_DTYPES, quantize
+
+EMBEDDING_DIMENSION = 768
+EXPORT_PAGE_SIZE = 500  # rows per request when exporting
+SCORE_BLOCK_ROWS = 2048  # rows converted to float32 at once when scoring compact snapshots
+SNAPSHOT_VERSION = 2
+HYBRID_CANDIDATES = 50  # rows taken from each ranking before fusion
+
+
+def parse_embedding(value: Union[str, Sequence[float]]) -> np.ndarray:
+    """pgvector columns come back from PostgREST as '[0.1,0.2,...]' strings"""
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so cosine similarity is a dot product"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _snapshot_paths(prefix: Union[str, Path]) -> Tuple[Path, Path]:
+    prefix = Path(prefix)
+    return prefix.with_suffix('.npy'), prefix.with_suffix('.json')
+
+
+def _scales_path(prefix: Union[str, Path]) -> Path:
+    return Path(prefix).with_suffix('.scales.npy')
+
+
+def write_snapshot(prefix: Union[str, Path], rows: List[Dict], embeddings: np.ndarray,
+                   dtype: str = 'float32') -> Dict:
+    """
+    Write a snapshot from row metadata and a matching (n, dim) embedding matrix.
+    Rows are reordered so each project_type occupies one contiguous range.
+    The matrix is stored as `dtype` (float32, float16 or int8).
+    """
+    matrix_path, meta_path = _snapshot_paths(prefix)
+    matrix_path.parent.mkdir(parents=True, exist_ok=True)
+
+    order = sorted(range(len(rows)), key=lambda i: rows[i]['project_type'])
+    rows = [rows[i] for i in order]
+    embeddings = normalize_rows(np.asarray(embeddings, dtype=np.float32)[order]) if rows else \
+        np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32)
+
+    ranges: Dict[str, List[int]] = {}
+    for i, row in enumerate(rows):
+        ranges.setdefault(row['project_type'], [i, i])[1] = i + 1
+
+    codes, scales = quantize(embeddings, dtype)
+    np.save(matrix_path, codes)
+    if scales is not None:
+        np.save(_scales_path(prefix), scales)
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'count': len(rows),
+        'dimension': int(embeddings.shape[1]),
+        'dtype': dtype,
+        'project_types': ranges,
+        'rows': rows
+    }
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return meta
+
+
+def export_snapshot(supabase_client, prefix: Union[str, Path], project_type: Optional[str] = None,
+                    dtype: str = 'float32') -> Dict:
+    """Page through knowledge_embeddings and write a local snapshot"""
+    rows: List[Dict] = []
+    vectors: List[np.ndarray] = []
+    start = 0
+
+    while True:
+        query = (
+            supabase_client.table('knowledge_embeddings')
+            .select('id, project_type, file_name, section_title, chunk_text, metadata, embedding')
+        )
+        if project_type:
+            query = query.eq('project_type', project_type)
+        result = query.order('id').range(start, start + EXPORT_PAGE_SIZE - 1).execute()
+
+        page = result.data or []
+        for row in page:
+            if row.get('embedding') is None:
+                continue
+            vectors.append(parse_embedding(row.pop('embedding')))
+            rows.append(row)
+
+        if len(page) < EXPORT_PAGE_SIZE:
+            break
+        start += EXPORT_PAGE_SIZE
+
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32)
+    return write_snapshot(prefix, rows, matrix, dtype)
+
+
+class LocalVectorIndex:
+    """Exact top-k cosine search over a memory-mapped embedding matrix"""
+
+    def __init__(self, embeddings: np.ndarray, rows: List[Dict], project_types: Dict[str, Sequence[int]],
+                 scales: Optional[np.ndarray] = None):
+        self.embeddings = embeddings
+        self.scales = scales
+        self.rows = rows
+        self.project_types = {name: (int(lo), int(hi)) for name, (lo, hi) in project_types.items()}
+        self._lexical: Optional[BM25Index] = None
+
+    @classmethod
+    def load(cls, prefix: Union[str, Path], mmap: bool = True) -> 'LocalVectorIndex':
+        """Open a snapshot written by write_snapshot/export_snapshot"""
+        matrix_path, meta_path = _snapshot_paths(prefix)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot {prefix} has format version {meta.get('version')}, expected "
+                             f"{SNAPSHOT_VERSION}; re-export it (python vector_store.py export --out {prefix})")
+        embeddings = np.load(matrix_path, mmap_mode='r' if mmap else None)
+        if embeddings.shape != (meta['count'], meta['dimension']) or embeddings.dtype.name != meta['dtype']:
+            raise ValueError(f"Snapshot {prefix} matrix is {embeddings.dtype.name} {embeddings.shape}, metadata says "
+                             f"{meta['dtype']} ({meta['count']}, {meta['dimension']}); re-export it")
+        scales = np.load(_scales_path(prefix)) if meta.get('dtype') == 'int8' else None
+        return cls(embeddings, meta['rows'], meta['project_types'], scales)
+
+    @classmethod
+    def from_matrix(cls, embeddings: np.ndarray, rows: List[Dict], project_types: Dict[str, Sequence[int]],
+                    dtype: str = 'float32') -> 'LocalVectorIndex':
+        """Build an in-memory index, quantizing a float matrix to `dtype`"""
+        codes, scales = quantize(embeddings, dtype)
+        return cls(codes, rows, project_types, scales)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def dtype(self) -> str:
+        return self.embeddings.dtype.name
+
+    @property
+    def nbytes(self) -> int:
+        return self.embeddings.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _range(self, project_type: Optional[str]) -> Tuple[int, int]:
+        if project_type is None:
+            return 0, len(self.rows)
+        return self.project_types.get(project_type, (0, 0))
+
+    def scores(self, queries: np.ndarray, project_type: Optional[str] = None) -> Tuple[np.ndarray, int]:
+        """
+        Cosine similarity of each query against the rows of project_type.
+        Returns (scores of shape (n_queries, n_rows), offset of the first row).
+        """
+        lo, hi = self._range(project_type)
+        queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if self.embeddings.dtype == np.float32:
+            return queries @ self.embeddings[lo:hi].T, lo
+
+        scores = np.empty((queries.shape[0], hi - lo), dtype=np.float32)
+        for start in range(lo, hi, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, hi)
+            block = np.asarray(self.embeddings[start:end], dtype=np.float32)
+            scores[:, start - lo:end - lo] = queries @ block.T
+        if self.scales is not None:
+            scores *= self.scales[lo:hi]  # int8: scale once per row instead of per element
+        return scores, lo
+
+    def search_batch(self, queries: np.ndarray, k: int = 10, threshold: float = 0.5,
+                     project_type: Optional[str] = None) -> List[List[Dict]]:
+        """Top-k matches for each query, same shape as match_knowledge rows"""
+        scores, offset = self.scores(queries, project_type)
+        n_rows = scores.shape[1]
+        if n_rows == 0:
+            return [[] for _ in range(scores.shape[0])]
+
+        k = min(k, n_rows)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for q, candidates in enumerate(top):
+            candidate_scores = scores[q, candidates]
+            order = np.argsort(-candidate_scores, kind='stable')
+            matches = []
+            for idx, score in zip(candidates[order], candidate_scores[order]):
+                if score <= threshold:
+                    break
+                row = self.rows[offset + int(idx)]
+                matches.append({**row, 'similarity': float(score)})
+            results.append(matches)
+        return results
+
+    def search(self, query: Sequence[float], k: int = 10, threshold: float = 0.5,
+               project_type: Optional[str] = None) -> List[Dict]:
+        """Top-k matches for one query embedding"""
+        return self.search_batch(np.asarray(query, dtype=np.float32)[None, :], k, threshold, project_type)[0]
+
+    @property
+    def lexical(self) -> BM25Index:
+        """BM25 index over section_title + chunk_text, built on first use"""
+        if self._lexical is None:
+            self._lexical = BM25Index.from_rows(self.rows)
+        return self._lexical
+
+    def search_hybrid(self, query_text: str, query_embedding: Sequence[float], k: int = 10,
+                      project_type: Optional[str] = None, candidates: int = HYBRID_CANDIDATES,
+                      rrf_k: int = RRF_K) -> List[Dict]:
+        """
+        Lexical (BM25) + vector top candidates fused with reciprocal rank fusion.
+        Same row shape as the match_knowledge_hybrid SQL function.
+        """
+        lo, hi = self._range(project_type)
+        if hi <= lo:
+            return []
+
+        scores, offset = self.scores(np.asarray(query_embedding, dtype=np.float32), project_type)
+        scores = scores[0]
+        n = min(candidates, hi - lo)
+        top = np.argpartition(-scores, n - 1)[:n]
+        vector_ranking = [offset + int(i) for i in top[np.argsort(-scores[top], kind='stable')]]
+        lexical_ranking = [row for row, _ in self.lexical.search(query_text, candidates, lo, hi)]
+
+        vector_ranks = {row: rank for rank, row in enumerate(vector_ranking, start=1)}
+        lexical_ranks = {row: rank for rank, row in enumerate(lexical_ranking, start=1)}
+        matches = []
+        for row, score in reciprocal_rank_fusion([vector_ranking, lexical_ranking], rrf_k)[:k]:
+            matches.append({
+                **self.rows[row],
+                'similarity': float(scores[row - offset]) if row in vector_ranks else None,
+                'vector_rank': vector_ranks.get(row),
+                'lexical_rank': lexical_ranks.get(row),
+                'score': score
+            })
+        return matches
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Local vector snapshot tools for Sparkfluence RAG')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = sub.add_parser('export', help='Export knowledge_embeddings to a local snapshot')
+    export_parser.add_argument('--out', required=True, help='Snapshot path prefix, e.g. snapshots/knowledge')
+    export_parser.add_argument('--project-type', choices=['viral_script', 'image_video'])
+    export_parser.add_argument('--dtype', choices=QUANTIZATION_DTYPES, default='float32',
+                               help='Storage type of the snapshot matrix (default: float32)')
+
+    stats_parser = sub.add_parser('stats', help='Show snapshot size per project type')
+    stats_parser.add_argument('--snapshot', required=True, help='Snapshot path prefix')
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        from dotenv import load_dotenv
+        from supabase import create_client
+
+        load_dotenv()
+        supabase_url = os.getenv('SUPABASE_URL')
+        supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
+        if not supabase_url or not supabase_key:
+            print("❌ Error: SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+            sys.exit(1)
+
+        meta = export_snapshot(create_client(supabase_url, supabase_key), args.out, args.project_type, args.dtype)
+        print(f"✅ Exported {meta['count']} {args.dtype} embeddings to {args.out}.npy / {args.out}.json")
+        for name, (lo, hi) in meta['project_types'].items():
+            print(f"  - {name}: {hi - lo}")
+
+    elif args.command == 'stats':
+        index = LocalVectorIndex.load(args.snapshot)
+        print(f"📦 {len(index)} {index.dtype} embeddings, {index.nbytes / (1024 * 1024):.1f} MB")
+        for name, (lo, hi) in index.project_types.items():
+            print(f"  - {name}: {hi - lo}")
+
+
+if __name__ == '__main__':
+    main()
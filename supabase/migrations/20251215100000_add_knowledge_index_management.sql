@@ -0,0 +1,174 @@
+-- ============================================================================
+-- Knowledge Embeddings - ANN Index Management
+-- ============================================================================
+-- Purpose: Let docs/n8n/manage_index.py size and rebuild the vector index per
+-- project_type instead of a hand-tuned global `ivfflat (lists = 100)`.
+--
+-- Adds:
+--   - knowledge_index_settings: chosen method/parameters and last sweep result
+--   - knowledge_corpus_stats(): row count per project_type
+--   - rebuild_knowledge_index(): (re)creates a partial ANN index per project_type
+--     and, once every project_type has one, drops the global
+--     idx_knowledge_embeddings_vector they replace
+--   - match_knowledge_tuned(): match_knowledge that applies the stored
+--     probes / ef_search and can use the partial index of its project_type;
+--     method 'exact' really scans (no ANN index at all)
+-- ============================================================================
+
+-- 1. Settings table (one row per project_type)
+CREATE TABLE IF NOT EXISTS knowledge_index_settings (
+  project_type TEXT PRIMARY KEY CHECK (project_type IN ('viral_script', 'image_video')),
+  method TEXT NOT NULL DEFAULT 'exact' CHECK (method IN ('exact', 'ivfflat', 'hnsw')),
+  lists INT,
+  probes INT,
+  m INT,
+  ef_construction INT,
+  ef_search INT,
+  row_count INT,
+  recall_at_k FLOAT,
+  p95_ms FLOAT,
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+ALTER TABLE knowledge_index_settings ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access" ON knowledge_index_settings;
+CREATE POLICY "Service role full access"
+  ON knowledge_index_settings
+  FOR ALL
+  USING (auth.role() = 'service_role');
+
+DROP POLICY IF EXISTS "Authenticated users can read" ON knowledge_index_settings;
+CREATE POLICY "Authenticated users can read"
+  ON knowledge_index_settings
+  FOR SELECT
+  USING (auth.role() = 'authenticated');
+
+-- 2. Corpus size per project_type
+CREATE OR REPLACE FUNCTION knowledge_corpus_stats()
+RETURNS TABLE (project_type TEXT, row_count BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT ke.project_type, COUNT(*) AS row_count
+  FROM knowledge_embeddings ke
+  GROUP BY ke.project_type
+  ORDER BY ke.project_type;
+$$;
+
+-- 3. Rebuild the partial ANN index of one project_type
+-- method = 'exact' only drops the index (sequential scan is exact and fast for
+-- small corpora). Index name: idx_knowledge_embeddings_vector_<project_type>
+-- The global idx_knowledge_embeddings_vector (supabase_vector_schema.sql) is
+-- only dropped once every project_type has its own partial index: until then
+-- match_knowledge (called by the n8n workflows) still needs it for the project
+-- types that have none. match_knowledge_tuned disables index scans for
+-- 'exact' project types, so the global index never shadows an exact scan.
+CREATE OR REPLACE FUNCTION rebuild_knowledge_index(
+  target_project_type TEXT,
+  index_method TEXT,
+  index_lists INT DEFAULT NULL,
+  index_m INT DEFAULT NULL,
+  index_ef_construction INT DEFAULT NULL
+)
+RETURNS TEXT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, extensions
+AS $$
+DECLARE
+  index_name TEXT := 'idx_knowledge_embeddings_vector_' || target_project_type;
+BEGIN
+  IF target_project_type NOT IN ('viral_script', 'image_video') THEN
+    RAISE EXCEPTION 'Unknown project_type %', target_project_type;
+  END IF;
+
+  EXECUTE format('DROP INDEX IF EXISTS %I', index_name);
+
+  IF index_method = 'ivfflat' THEN
+    EXECUTE format(
+      'CREATE INDEX %I ON knowledge_embeddings USING ivfflat (embedding vector_cosine_ops) '
+      'WITH (lists = %s) WHERE project_type = %L',
+      index_name, COALESCE(index_lists, 100), target_project_type
+    );
+  ELSIF index_method = 'hnsw' THEN
+    EXECUTE format(
+      'CREATE INDEX %I ON knowledge_embeddings USING hnsw (embedding vector_cosine_ops) '
+      'WITH (m = %s, ef_construction = %s) WHERE project_type = %L',
+      index_name, COALESCE(index_m, 16), COALESCE(index_ef_construction, 64), target_project_type
+    );
+  ELSIF index_method <> 'exact' THEN
+    RAISE EXCEPTION 'Unknown index method %', index_method;
+  END IF;
+
+  IF NOT EXISTS (
+    SELECT 1
+    FROM unnest(ARRAY['viral_script', 'image_video']) AS t(project_type)
+    WHERE to_regclass('idx_knowledge_embeddings_vector_' || t.project_type) IS NULL
+  ) THEN
+    DROP INDEX IF EXISTS idx_knowledge_embeddings_vector;
+  END IF;
+
+  ANALYZE knowledge_embeddings;
+  RETURN index_name;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION rebuild_knowledge_index(TEXT, TEXT, INT, INT, INT) FROM PUBLIC, anon, authenticated;
+
+-- 4. Similarity search using the tuned parameters
+-- The project_type is inlined as a literal so the planner can pick that
+-- project_type's partial index; probes/ef_search default to the stored
+-- settings, probes otherwise to sqrt(lists) (pgvector's recommendation, lists
+-- defaulting to 100). When the stored method is 'exact' (or exact_search is
+-- set) index scans are disabled for the query so the result is the true
+-- top-k, whatever indexes exist.
+DROP FUNCTION IF EXISTS match_knowledge_tuned(VECTOR(768), FLOAT, INT, TEXT, INT, INT);
+
+CREATE OR REPLACE FUNCTION match_knowledge_tuned(
+  query_embedding VECTOR(768),
+  match_threshold FLOAT DEFAULT 0.5,
+  match_count INT DEFAULT 10,
+  filter_project_type TEXT DEFAULT NULL,
+  search_probes INT DEFAULT NULL,
+  search_ef INT DEFAULT NULL,
+  exact_search BOOLEAN DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  project_type TEXT,
+  file_name TEXT,
+  section_title TEXT,
+  chunk_text TEXT,
+  metadata JSONB,
+  similarity FLOAT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  settings knowledge_index_settings%ROWTYPE;
+BEGIN
+  IF filter_project_type IS NOT NULL THEN
+    SELECT * INTO settings FROM knowledge_index_settings s WHERE s.project_type = filter_project_type;
+  END IF;
+
+  PERFORM set_config('ivfflat.probes',
+    COALESCE(search_probes, settings.probes, GREATEST(1, floor(sqrt(COALESCE(settings.lists, 100))))::INT)::TEXT, true);
+  PERFORM set_config('hnsw.ef_search', COALESCE(search_ef, settings.ef_search, 40)::TEXT, true);
+  IF COALESCE(exact_search, settings.method = 'exact', false) THEN
+    PERFORM set_config('enable_indexscan', 'off', true);
+  END IF;
+
+  RETURN QUERY EXECUTE format(
+    'SELECT ke.id, ke.project_type, ke.file_name, ke.section_title, ke.chunk_text, ke.metadata, '
+    '       1 - (ke.embedding <=> $1) AS similarity '
+    'FROM knowledge_embeddings ke '
+    'WHERE %s AND 1 - (ke.embedding <=> $1) > $2 '
+    'ORDER BY ke.embedding <=> $1 '
+    'LIMIT $3',
+    CASE WHEN filter_project_type IS NULL THEN 'TRUE'
+         ELSE format('ke.project_type = %L', filter_project_type) END
+  )
+  USING query_embedding, match_threshold, match_count;
+END;
+$$;
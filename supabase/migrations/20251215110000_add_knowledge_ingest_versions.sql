@@ -0,0 +1,44 @@
+-- ============================================================================
+-- Knowledge Embeddings - Ingest Versions
+-- ============================================================================
+-- Purpose: A monotonically increasing version per project_type. chunk_and_embed.py
+-- bumps it after every run that changed the knowledge base, and retrieval
+-- caches (docs/n8n/retrieval_cache.py) key their results on it, so
+-- re-ingesting a project type invalidates its cached search results.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS knowledge_ingest_versions (
+  project_type TEXT PRIMARY KEY CHECK (project_type IN ('viral_script', 'image_video')),
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+INSERT INTO knowledge_ingest_versions (project_type)
+VALUES ('viral_script'), ('image_video')
+ON CONFLICT (project_type) DO NOTHING;
+
+ALTER TABLE knowledge_ingest_versions ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role full access" ON knowledge_ingest_versions;
+CREATE POLICY "Service role full access"
+  ON knowledge_ingest_versions
+  FOR ALL
+  USING (auth.role() = 'service_role');
+
+DROP POLICY IF EXISTS "Authenticated users can read" ON knowledge_ingest_versions;
+CREATE POLICY "Authenticated users can read"
+  ON knowledge_ingest_versions
+  FOR SELECT
+  USING (auth.role() = 'authenticated');
+
+-- Atomically increment and return the new version
+CREATE OR REPLACE FUNCTION bump_knowledge_ingest_version(target_project_type TEXT)
+RETURNS BIGINT
+LANGUAGE sql
+AS $$
+  INSERT INTO knowledge_ingest_versions (project_type, version, updated_at)
+  VALUES (target_project_type, 1, NOW())
+  ON CONFLICT (project_type)
+  DO UPDATE SET version = knowledge_ingest_versions.version + 1, updated_at = NOW()
+  RETURNING version;
+$$;
@@ -0,0 +1,107 @@
+-- ============================================================================
+-- Knowledge Embeddings - Hybrid Lexical + Vector Search
+-- ============================================================================
+-- Purpose: Exact-term queries (hashtags, platform names, hook formulas) are
+-- answered poorly by cosine distance alone. Adds a precomputed full-text
+-- index and match_knowledge_hybrid(), which fuses full-text and vector
+-- rankings with reciprocal rank fusion (RRF):
+--
+--   score = 1 / (rrf_k + vector_rank) + 1 / (rrf_k + lexical_rank)
+--
+-- The 'simple' text search configuration is used because the knowledge base
+-- mixes Indonesian and English; it lowercases without stemming or stop words.
+-- Its parser treats '#' as a separator, so "#fyp" and "fyp" are the same
+-- lexeme. The query is tokenized by the same parser and its lexemes are OR'd
+-- (a row matching any term is a candidate, ranked by ts_rank_cd), like BM25.
+-- docs/n8n/bm25.py implements the same tokenization and fusion for the
+-- local engine.
+-- ============================================================================
+
+-- 1. Generated tsvector column (section titles weigh more than body text)
+ALTER TABLE knowledge_embeddings
+  ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+  GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', COALESCE(section_title, '')), 'A') ||
+    setweight(to_tsvector('simple', COALESCE(chunk_text, '')), 'B')
+  ) STORED;
+
+-- 2. GIN index for full-text matching
+CREATE INDEX IF NOT EXISTS idx_knowledge_embeddings_search_vector
+ON knowledge_embeddings
+USING GIN (search_vector);
+
+-- 3. Hybrid search function
+-- Each side contributes its top candidate_count rows; rows found by only one
+-- side get that side's term only. similarity is the cosine similarity (NULL
+-- when the row was not a vector candidate).
+CREATE OR REPLACE FUNCTION match_knowledge_hybrid(
+  query_text TEXT,
+  query_embedding VECTOR(768),
+  match_count INT DEFAULT 10,
+  filter_project_type TEXT DEFAULT NULL,
+  candidate_count INT DEFAULT 50,
+  rrf_k INT DEFAULT 60
+)
+RETURNS TABLE (
+  id UUID,
+  project_type TEXT,
+  file_name TEXT,
+  section_title TEXT,
+  chunk_text TEXT,
+  metadata JSONB,
+  similarity FLOAT,
+  vector_rank INT,
+  lexical_rank INT,
+  score FLOAT
+)
+LANGUAGE sql
+STABLE
+AS $$
+  WITH vector_hits AS (
+    SELECT
+      ke.id,
+      1 - (ke.embedding <=> query_embedding) AS similarity,
+      ROW_NUMBER() OVER (ORDER BY ke.embedding <=> query_embedding)::INT AS rank
+    FROM knowledge_embeddings ke
+    WHERE filter_project_type IS NULL OR ke.project_type = filter_project_type
+    ORDER BY ke.embedding <=> query_embedding
+    LIMIT candidate_count
+  ),
+  lexical_hits AS (
+    SELECT
+      ke.id,
+      ROW_NUMBER() OVER (ORDER BY ts_rank_cd(ke.search_vector, q.query) DESC)::INT AS rank
+    FROM knowledge_embeddings ke,
+         (SELECT to_tsquery('simple', string_agg(quote_literal(t.lexeme), ' | ')) AS query
+          FROM unnest(to_tsvector('simple', query_text)) AS t) AS q
+    WHERE ke.search_vector @@ q.query
+      AND (filter_project_type IS NULL OR ke.project_type = filter_project_type)
+    ORDER BY ts_rank_cd(ke.search_vector, q.query) DESC
+    LIMIT candidate_count
+  ),
+  fused AS (
+    SELECT
+      COALESCE(v.id, l.id) AS id,
+      v.similarity,
+      v.rank AS vector_rank,
+      l.rank AS lexical_rank,
+      COALESCE(1.0 / (rrf_k + v.rank), 0) + COALESCE(1.0 / (rrf_k + l.rank), 0) AS score
+    FROM vector_hits v
+    FULL OUTER JOIN lexical_hits l ON l.id = v.id
+  )
+  SELECT
+    ke.id,
+    ke.project_type,
+    ke.file_name,
+    ke.section_title,
+    ke.chunk_text,
+    ke.metadata,
+    f.similarity,
+    f.vector_rank,
+    f.lexical_rank,
+    f.score::FLOAT
+  FROM fused f
+  JOIN knowledge_embeddings ke ON ke.id = f.id
+  ORDER BY f.score DESC
+  LIMIT match_count;
+$$;
@@ -0,0 +1,38 @@
+-- ============================================================================
+-- Image Generation Jobs - Request Fingerprint
+-- ============================================================================
+-- Purpose: Identical generation requests (a retried or regenerated session,
+-- a shared template) should cost one provider call, not one per job.
+-- request_fingerprint is a hash of the normalized inputs that determine the
+-- image (prompt, segment type, style, aspect ratio, provider, character
+-- reference, shot type, emotion); see job_worker.image_request_fingerprint.
+--
+-- The worker uses it to:
+--   * complete a job from a recent completed job with the same fingerprint
+--   * claim pending jobs with the same fingerprint and complete them from
+--     the one provider call it makes
+-- ============================================================================
+
+DO $do_block$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'image_generation_jobs' AND column_name = 'request_fingerprint'
+    ) THEN
+        ALTER TABLE image_generation_jobs
+        ADD COLUMN request_fingerprint TEXT;
+
+        COMMENT ON COLUMN image_generation_jobs.request_fingerprint IS
+            'SHA-256 of the normalized generation inputs; jobs with equal fingerprints share one generated image';
+    END IF;
+END $do_block$;
+
+-- Most recent completed result of a fingerprint
+CREATE INDEX IF NOT EXISTS idx_image_jobs_fingerprint_completed
+ON image_generation_jobs(request_fingerprint, completed_at DESC)
+WHERE status = 2 AND image_url IS NOT NULL;
+
+-- Pending jobs waiting for the same result
+CREATE INDEX IF NOT EXISTS idx_image_jobs_fingerprint_pending
+ON image_generation_jobs(request_fingerprint)
+WHERE status = 0;
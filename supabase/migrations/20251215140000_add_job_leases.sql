@@ -0,0 +1,124 @@
+-- ============================================================================
+-- Generation Jobs - Worker Leases
+-- ============================================================================
+-- Purpose: A worker that crashes after claiming a job left it at status 1
+-- (processing) forever, and select_pending kept treating its session as the
+-- active one. Every claim now records who holds the job and until when:
+--
+--   worker_id         id of the worker process holding the job
+--   lease_expires_at  the job is given up if the lease isn't renewed by then
+--
+-- Workers claim with a conditional update (status = 0 -> 1) and renew their
+-- leases with a heartbeat while the provider call runs. Jobs submitted to
+-- VEO get one longer lease (VEO_LEASE_SECONDS) covering the render.
+-- reclaim_expired_job_leases() returns every job whose lease expired to
+-- pending (or failed, once out of retries) in one statement per table.
+-- ============================================================================
+
+-- 1. Lease columns
+DO $do_block$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'image_generation_jobs' AND column_name = 'worker_id'
+    ) THEN
+        ALTER TABLE image_generation_jobs ADD COLUMN worker_id TEXT;
+
+        COMMENT ON COLUMN image_generation_jobs.worker_id IS
+            'Worker process holding the job while it is processing';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'image_generation_jobs' AND column_name = 'lease_expires_at'
+    ) THEN
+        ALTER TABLE image_generation_jobs ADD COLUMN lease_expires_at TIMESTAMP WITH TIME ZONE;
+
+        COMMENT ON COLUMN image_generation_jobs.lease_expires_at IS
+            'Processing job is reclaimed when its worker has not renewed the lease by this time';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'video_generation_jobs' AND column_name = 'worker_id'
+    ) THEN
+        ALTER TABLE video_generation_jobs ADD COLUMN worker_id TEXT;
+
+        COMMENT ON COLUMN video_generation_jobs.worker_id IS
+            'Worker process holding the job while it is processing';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'video_generation_jobs' AND column_name = 'lease_expires_at'
+    ) THEN
+        ALTER TABLE video_generation_jobs ADD COLUMN lease_expires_at TIMESTAMP WITH TIME ZONE;
+
+        COMMENT ON COLUMN video_generation_jobs.lease_expires_at IS
+            'Processing job is reclaimed when its worker (or VEO render) has not finished by this time';
+    END IF;
+END $do_block$;
+
+-- 2. Expiry scans only look at processing rows
+CREATE INDEX IF NOT EXISTS idx_image_jobs_lease
+ON image_generation_jobs(lease_expires_at) WHERE status = 1;
+
+CREATE INDEX IF NOT EXISTS idx_video_jobs_lease
+ON video_generation_jobs(lease_expires_at) WHERE status = 1;
+
+-- 3. Reaper
+-- Processing rows without a lease (set by Edge Functions or workers from
+-- before this migration) are reclaimed once not updated for
+-- orphan_after_seconds. Each reclaim counts as a retry; a job out of
+-- retries fails instead of going back to the queue. Video jobs lose their
+-- veo_uuid so they are submitted again.
+CREATE OR REPLACE FUNCTION reclaim_expired_job_leases(
+  max_retries INT DEFAULT 3,
+  orphan_after_seconds INT DEFAULT 3600
+)
+RETURNS TABLE (
+  job_table TEXT,
+  job_id UUID,
+  job_status INT
+)
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  WITH image_reclaimed AS (
+    UPDATE image_generation_jobs j
+    SET
+      status = CASE WHEN COALESCE(j.retry_count, 0) + 1 >= max_retries THEN 3 ELSE 0 END,
+      retry_count = COALESCE(j.retry_count, 0) + 1,
+      error_message = 'LEASE_EXPIRED: ' || COALESCE(j.worker_id, 'unknown worker') || ' stopped renewing',
+      completed_at = CASE WHEN COALESCE(j.retry_count, 0) + 1 >= max_retries THEN NOW() ELSE NULL END,
+      worker_id = NULL,
+      lease_expires_at = NULL
+    WHERE j.status = 1
+      AND (j.lease_expires_at < NOW()
+           OR (j.lease_expires_at IS NULL
+               AND j.updated_at < NOW() - make_interval(secs => orphan_after_seconds)))
+    RETURNING 'image_generation_jobs'::TEXT, j.id, j.status
+  ),
+  video_reclaimed AS (
+    UPDATE video_generation_jobs j
+    SET
+      status = CASE WHEN COALESCE(j.retry_count, 0) + 1 >= max_retries THEN 3 ELSE 0 END,
+      retry_count = COALESCE(j.retry_count, 0) + 1,
+      error_message = 'LEASE_EXPIRED: ' || COALESCE(j.worker_id, 'unknown worker') || ' stopped renewing',
+      completed_at = CASE WHEN COALESCE(j.retry_count, 0) + 1 >= max_retries THEN NOW() ELSE NULL END,
+      veo_uuid = NULL,
+      worker_id = NULL,
+      lease_expires_at = NULL
+    WHERE j.status = 1
+      AND (j.lease_expires_at < NOW()
+           OR (j.lease_expires_at IS NULL
+               AND j.updated_at < NOW() - make_interval(secs => orphan_after_seconds)))
+    RETURNING 'video_generation_jobs'::TEXT, j.id, j.status
+  )
+  SELECT * FROM image_reclaimed
+  UNION ALL
+  SELECT * FROM video_reclaimed;
+$$;
+
+REVOKE ALL ON FUNCTION reclaim_expired_job_leases(INT, INT) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,180 @@
+-- ============================================================================
+-- Generation Jobs - Queue Indexes and Archival
+-- ============================================================================
+-- Purpose: The worker's queue scans (select_pending, check_processing_jobs)
+-- only care about pending/processing rows, but finished rows pile up in the
+-- same tables forever and the plain status indexes grow with them.
+--
+-- 1. Partial indexes covering only active rows (status 0/1), in the order
+--    the worker takes jobs (segment_number), so queue scans stay
+--    O(active jobs) however long the history gets
+-- 2. Archive tables: finished rows (completed/failed) not updated for N
+--    days move there, the full row kept as JSONB (safe against columns
+--    added to the hot tables later)
+-- 3. archive_finished_generation_jobs(): moves one batch per table; the
+--    worker (job_worker.BackgroundWorker) calls it periodically
+-- ============================================================================
+
+-- 1. Active-queue indexes
+-- select_pending: status = 0 [AND session_id = ?] ORDER BY segment_number,
+-- and status = 1 for the active session
+CREATE INDEX IF NOT EXISTS idx_image_jobs_active
+ON image_generation_jobs(status, segment_number) WHERE status IN (0, 1);
+
+CREATE INDEX IF NOT EXISTS idx_image_jobs_active_session
+ON image_generation_jobs(session_id, status, segment_number) WHERE status IN (0, 1);
+
+CREATE INDEX IF NOT EXISTS idx_video_jobs_active
+ON video_generation_jobs(status, segment_number) WHERE status IN (0, 1);
+
+CREATE INDEX IF NOT EXISTS idx_video_jobs_active_session
+ON video_generation_jobs(session_id, status, segment_number) WHERE status IN (0, 1);
+
+-- check_processing_jobs: processing rows submitted to VEO
+CREATE INDEX IF NOT EXISTS idx_video_jobs_processing_veo
+ON video_generation_jobs(veo_uuid) WHERE status = 1 AND veo_uuid IS NOT NULL;
+
+-- Session lookups (get_session_jobs, Edge Functions)
+CREATE INDEX IF NOT EXISTS idx_image_jobs_session_id ON image_generation_jobs(session_id);
+CREATE INDEX IF NOT EXISTS idx_video_jobs_session_id ON video_generation_jobs(session_id);
+
+-- Archival candidates
+CREATE INDEX IF NOT EXISTS idx_image_jobs_finished
+ON image_generation_jobs(updated_at) WHERE status IN (2, 3);
+
+CREATE INDEX IF NOT EXISTS idx_video_jobs_finished
+ON video_generation_jobs(updated_at) WHERE status IN (2, 3);
+
+-- Superseded: whole-table status indexes (the partial ones above serve the
+-- queue) and a duplicate session index from the first image jobs migration
+DROP INDEX IF EXISTS idx_image_jobs_status;
+DROP INDEX IF EXISTS idx_image_generation_jobs_status;
+DROP INDEX IF EXISTS idx_image_jobs_pending;
+DROP INDEX IF EXISTS idx_image_generation_jobs_session_id;
+DROP INDEX IF EXISTS idx_video_jobs_status;
+DROP INDEX IF EXISTS idx_video_jobs_pending;
+
+-- 2. Archive tables
+CREATE TABLE IF NOT EXISTS image_generation_jobs_archive (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL,
+    session_id TEXT NOT NULL,
+    segment_number INTEGER,
+    status INTEGER NOT NULL,
+    topic TEXT,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    job JSONB NOT NULL -- the full image_generation_jobs row
+);
+
+CREATE TABLE IF NOT EXISTS video_generation_jobs_archive (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL,
+    session_id TEXT NOT NULL,
+    segment_number INTEGER,
+    status INTEGER NOT NULL,
+    topic TEXT,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    job JSONB NOT NULL -- the full video_generation_jobs row
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_jobs_archive_user_session ON image_generation_jobs_archive(user_id, session_id);
+CREATE INDEX IF NOT EXISTS idx_image_jobs_archive_session_id ON image_generation_jobs_archive(session_id);
+CREATE INDEX IF NOT EXISTS idx_video_jobs_archive_user_session ON video_generation_jobs_archive(user_id, session_id);
+CREATE INDEX IF NOT EXISTS idx_video_jobs_archive_session_id ON video_generation_jobs_archive(session_id);
+
+ALTER TABLE image_generation_jobs_archive ENABLE ROW LEVEL SECURITY;
+ALTER TABLE video_generation_jobs_archive ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view their own archived image jobs" ON image_generation_jobs_archive;
+CREATE POLICY "Users can view their own archived image jobs"
+    ON image_generation_jobs_archive FOR SELECT
+    USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Service role has full access to archived image jobs" ON image_generation_jobs_archive;
+CREATE POLICY "Service role has full access to archived image jobs"
+    ON image_generation_jobs_archive FOR ALL
+    USING (auth.jwt() ->> 'role' = 'service_role');
+
+DROP POLICY IF EXISTS "Users can view their own archived video jobs" ON video_generation_jobs_archive;
+CREATE POLICY "Users can view their own archived video jobs"
+    ON video_generation_jobs_archive FOR SELECT
+    USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Service role has full access to archived video jobs" ON video_generation_jobs_archive;
+CREATE POLICY "Service role has full access to archived video jobs"
+    ON video_generation_jobs_archive FOR ALL
+    USING (auth.jwt() ->> 'role' = 'service_role');
+
+COMMENT ON TABLE image_generation_jobs_archive IS 'Finished image jobs moved out of the queue table by archive_finished_generation_jobs()';
+COMMENT ON TABLE video_generation_jobs_archive IS 'Finished video jobs moved out of the queue table by archive_finished_generation_jobs()';
+
+-- 3. Archival
+-- Moves up to batch_size finished rows per table, oldest first; rows locked
+-- by a concurrent update are left for the next run. Returns the number of
+-- rows moved per table (a full batch means there is more to move).
+CREATE OR REPLACE FUNCTION archive_finished_generation_jobs(
+  older_than_days INT DEFAULT 90,
+  batch_size INT DEFAULT 5000
+)
+RETURNS TABLE (
+  job_table TEXT,
+  archived_count BIGINT
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  cutoff TIMESTAMP WITH TIME ZONE := NOW() - make_interval(days => older_than_days);
+BEGIN
+  WITH moved AS (
+    DELETE FROM image_generation_jobs j
+    WHERE j.id IN (
+      SELECT f.id FROM image_generation_jobs f
+      WHERE f.status IN (2, 3) AND f.updated_at < cutoff
+      ORDER BY f.updated_at
+      LIMIT batch_size
+      FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*
+  ),
+  inserted AS (
+    INSERT INTO image_generation_jobs_archive
+      (id, user_id, session_id, segment_number, status, topic, created_at, updated_at, job)
+    SELECT m.id, m.user_id, m.session_id, m.segment_number, m.status, m.topic, m.created_at, m.updated_at, to_jsonb(m)
+    FROM moved m
+    ON CONFLICT (id) DO NOTHING
+    RETURNING 1
+  )
+  SELECT 'image_generation_jobs', COUNT(*) INTO job_table, archived_count FROM inserted;
+  RETURN NEXT;
+
+  WITH moved AS (
+    DELETE FROM video_generation_jobs j
+    WHERE j.id IN (
+      SELECT f.id FROM video_generation_jobs f
+      WHERE f.status IN (2, 3) AND f.updated_at < cutoff
+      ORDER BY f.updated_at
+      LIMIT batch_size
+      FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*
+  ),
+  inserted AS (
+    INSERT INTO video_generation_jobs_archive
+      (id, user_id, session_id, segment_number, status, topic, created_at, updated_at, job)
+    SELECT m.id, m.user_id, m.session_id, m.segment_number, m.status, m.topic, m.created_at, m.updated_at, to_jsonb(m)
+    FROM moved m
+    ON CONFLICT (id) DO NOTHING
+    RETURNING 1
+  )
+  SELECT 'video_generation_jobs', COUNT(*) INTO job_table, archived_count FROM inserted;
+  RETURN NEXT;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION archive_finished_generation_jobs(INT, INT) FROM PUBLIC, anon, authenticated;
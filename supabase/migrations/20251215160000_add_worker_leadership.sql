@@ -0,0 +1,80 @@
+-- ============================================================================
+-- Background Worker - Leader Election
+-- ============================================================================
+-- Purpose: With WORKER_MODE=embedded every API process (uvicorn --workers N)
+-- would start its own BackgroundWorker. Only the holder of a lease row in
+-- worker_leadership runs it; the other processes stand by and take over
+-- once the holder stops renewing.
+--
+-- A row lease instead of a Postgres advisory lock: PostgREST runs every
+-- request on a pooled connection, so a session-level lock would not stay
+-- with the process that took it.
+--
+--   try_acquire_worker_leadership(name, holder, lease_seconds)
+--       takes the lease if it is free or expired, renews it if the holder
+--       already has it; TRUE when the caller holds it afterwards
+--   release_worker_leadership(name, holder)
+--       gives it up (clean shutdown) so a standby takes over right away
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS worker_leadership (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    acquired_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+ALTER TABLE worker_leadership ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service role has full access to worker leadership" ON worker_leadership;
+CREATE POLICY "Service role has full access to worker leadership"
+    ON worker_leadership FOR ALL
+    USING (auth.jwt() ->> 'role' = 'service_role');
+
+COMMENT ON TABLE worker_leadership IS 'Leases deciding which API process runs the embedded background worker';
+
+CREATE OR REPLACE FUNCTION try_acquire_worker_leadership(
+  lock_name TEXT,
+  holder_id TEXT,
+  lease_seconds INT DEFAULT 30
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  current_holder TEXT;
+BEGIN
+  INSERT INTO worker_leadership AS l (name, holder, acquired_at, expires_at)
+  VALUES (lock_name, holder_id, NOW(), NOW() + make_interval(secs => lease_seconds))
+  ON CONFLICT (name) DO UPDATE
+    SET holder = EXCLUDED.holder,
+        acquired_at = CASE WHEN l.holder = EXCLUDED.holder THEN l.acquired_at ELSE NOW() END,
+        expires_at = EXCLUDED.expires_at
+    WHERE l.holder = EXCLUDED.holder OR l.expires_at < NOW()
+  RETURNING l.holder INTO current_holder;
+
+  RETURN current_holder IS NOT NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION release_worker_leadership(
+  lock_name TEXT,
+  holder_id TEXT
+)
+RETURNS BOOLEAN
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  WITH released AS (
+    DELETE FROM worker_leadership
+    WHERE name = lock_name AND holder = holder_id
+    RETURNING 1
+  )
+  SELECT EXISTS (SELECT 1 FROM released);
+$$;
+
+REVOKE ALL ON FUNCTION try_acquire_worker_leadership(TEXT, TEXT, INT) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION release_worker_leadership(TEXT, TEXT) FROM PUBLIC, anon, authenticated;
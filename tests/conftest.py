@@ -0,0 +1,15 @@
+"""
+Sparkfluence unit tests
+
+The backend (backend/) and the RAG tooling (docs/n8n/) import their modules
+flat, as when run from their own directory; both are put on sys.path here.
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+for directory in (ROOT / 'backend', ROOT / 'docs' / 'n8n'):
+    if str(directory) not in sys.path:
+        sys.path.insert(0, str(directory))
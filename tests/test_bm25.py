@@ -0,0 +1,96 @@
+"""bm25: tokenization, BM25 scoring and reciprocal rank fusion"""
+
+import math
+
+import numpy as np
+import pytest
+
+from bm25 import BM25_B, BM25_K1, BM25Index, reciprocal_rank_fusion, tokenize
+
+DOCUMENTS = [
+    'Hook formula: question hook for #FYP reels',
+    'Retention tips: keep every scene short',
+    'TikTok hook examples and hook templates',
+    'Caption ideas for Instagram reels',
+]
+
+
+def test_tokenize_splits_like_simple_parser():
+    assert tokenize('#FYP viral_hook') == ['fyp', 'viral', 'hook']
+    assert tokenize('Hook-formula: 3 detik!') == ['hook', 'formula', '3', 'detik']
+    assert tokenize('Konten kreatör') == ['konten', 'kreatör']
+    assert tokenize('  ') == []
+
+
+def test_scores_match_okapi_bm25():
+    index = BM25Index(DOCUMENTS)
+    lengths = [len(tokenize(d)) for d in DOCUMENTS]
+    avg = sum(lengths) / len(lengths)
+
+    def expected(row, term):
+        tf = tokenize(DOCUMENTS[row]).count(term)
+        df = sum(term in tokenize(d) for d in DOCUMENTS)
+        if not tf:
+            return 0.0
+        idf = math.log(1 + (len(DOCUMENTS) - df + 0.5) / (df + 0.5))
+        return idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[row] / avg))
+
+    scores = index.scores('hook reels')
+    for row in range(len(DOCUMENTS)):
+        assert scores[row] == pytest.approx(expected(row, 'hook') + expected(row, 'reels'), rel=1e-5)
+
+
+def test_query_terms_are_ored():
+    index = BM25Index(DOCUMENTS)
+    rows = {row for row, _ in index.search('hook instagram')}
+    assert rows == {0, 2, 3}
+    assert index.search('unknownterm') == []
+
+
+def test_hashtag_matches_plain_term():
+    index = BM25Index(DOCUMENTS)
+    assert [row for row, _ in index.search('fyp')] == [0]
+    assert [row for row, _ in index.search('#fyp')] == [0]
+
+
+def test_search_orders_and_limits():
+    index = BM25Index(DOCUMENTS)
+    results = index.search('hook reels', k=2)
+    assert len(results) == 2
+    assert results[0][1] >= results[1][1]
+    full = index.search('hook reels', k=10)
+    assert results == full[:2]
+
+
+def test_search_within_a_row_range():
+    index = BM25Index(DOCUMENTS)
+    assert [row for row, _ in index.search('hook', lo=1, hi=4)] == [2]
+    assert np.array_equal(index.scores('hook', 1, 4), index.scores('hook')[1:4])
+
+
+def test_from_rows_indexes_titles():
+    index = BM25Index.from_rows([
+        {'section_title': 'Hook Formulas', 'chunk_text': 'Open with a question.'},
+        {'section_title': None, 'chunk_text': 'Close with a CTA.'},
+    ])
+    assert [row for row, _ in index.search('formulas')] == [0]
+    assert [row for row, _ in index.search('cta')] == [1]
+
+
+def test_empty_index():
+    index = BM25Index([])
+    assert index.search('hook') == []
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], rrf_k=60)
+    scores = dict(fused)
+    assert scores[1] == pytest.approx(1 / 61 + 1 / 62)
+    assert scores[3] == pytest.approx(1 / 63 + 1 / 61)
+    assert scores[2] == pytest.approx(1 / 62)
+    assert [row for row, _ in fused] == [1, 3, 2]
+
+
+def test_reciprocal_rank_fusion_breaks_ties_by_row():
+    assert [row for row, _ in reciprocal_rank_fusion([[5, 4], [4, 5]])] == [4, 5]
+    assert reciprocal_rank_fusion([]) == []
@@ -0,0 +1,128 @@
+"""chunker: sentence offsets, chunk spans and overlap"""
+
+import random
+
+import pytest
+
+from chunker import chunk_id, chunk_spans, chunk_text, count_tokens, sentence_sizes
+
+WORDS = ['hook', 'viral', 'retensi', 'audience', 'CTA', 'scroll', 'B-roll', 'caption', 'trend', 'fyp']
+
+
+def make_text(sentences, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(sentences):
+        words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 20)))
+        parts.append(words.capitalize() + rng.choice('.!?') + rng.choice([' ', '  ', '\n', '\n\n']))
+    return ''.join(parts).rstrip()
+
+
+def sentence_spans(text):
+    starts, ends, _ = sentence_sizes(text)
+    return list(zip(starts, ends))
+
+
+def test_sentence_offsets_keep_the_punctuation():
+    text = 'First one.  Second one!\nThird?'
+    assert [text[s:e] for s, e in sentence_spans(text)] == ['First one.', 'Second one!', 'Third?']
+
+
+def test_sentence_sizes_in_tokens():
+    starts, ends, prefix = sentence_sizes('Hi there, you. Ok!', 'tokens')
+    assert (starts, ends) == ([0, 15], [14, 18])
+    assert prefix == [0, 5, 7]
+    assert prefix[-1] == count_tokens('Hi there, you. Ok!')
+
+
+def test_small_example():
+    text = 'Aaaa. Bbbb. Cccc. Dddd.'
+    assert chunk_spans(text, 10, 5) == [(0, 11), (6, 17), (12, 23)]
+    assert chunk_spans(text, 10, 0) == [(0, 11), (12, 23)]
+
+
+@pytest.mark.parametrize('max_size,overlap', [(200, 0), (200, 40), (500, 100), (80, 79)])
+def test_spans_cover_the_text_at_sentence_boundaries(max_size, overlap):
+    text = make_text(120, seed=max_size + overlap)
+    sentences = sentence_spans(text)
+    starts = {s for s, _ in sentences}
+    ends = {e for _, e in sentences}
+    spans = chunk_spans(text, max_size, overlap)
+
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(text)
+    for start, end in spans:
+        assert start in starts and end in ends
+    for (prev_start, prev_end), (start, end) in zip(spans, spans[1:]):
+        assert prev_start <= start and prev_end < end  # progress (an overlap may take a whole chunk)
+        assert start <= prev_end or not text[prev_end:start].strip()  # no gap
+
+
+@pytest.mark.parametrize('max_size,overlap', [(200, 0), (200, 40), (500, 100)])
+def test_chunk_and_overlap_sizes(max_size, overlap):
+    text = make_text(120, seed=7)
+    sentences = sentence_spans(text)
+    size = {s: e - s for s, e in sentences}
+
+    def content(start, end):
+        """Size of the sentences in text[start:end]"""
+        return sum(size[s] for s, e in sentences if s >= start and e <= end)
+
+    spans = chunk_spans(text, max_size, overlap)
+    assert len(spans) > 1
+    for (prev_start, prev_end), (start, end) in zip(spans, spans[1:]):
+        assert content(start, prev_end) <= overlap
+        if overlap == 0:
+            assert start > prev_end
+    for start, end in spans:
+        single = sum(1 for s, e in sentences if s >= start and e <= end) == 1
+        assert content(start, end) <= max_size or single
+
+
+def test_oversized_sentence_is_its_own_chunk():
+    long = 'X' * 50 + '.'
+    text = f'Aa. {long} Bb.'
+    spans = chunk_spans(text, 20, 0)
+    assert (4, 4 + len(long)) in spans
+
+
+def test_chunk_text_slices_match_offsets():
+    text = make_text(60, seed=3)
+    chunks = chunk_text(text, 'Hook Formulas', max_size=300, overlap=60)
+    assert len(chunks) > 1
+    for i, chunk in enumerate(chunks, start=1):
+        assert chunk['text'] == text[chunk['start']:chunk['end']]
+        assert chunk['char_count'] == len(chunk['text'])
+        assert chunk['title'] == f'Hook Formulas (Part {i})'
+        assert chunk['chunk_id'] == chunk_id(chunk['title'], chunk['text'])
+
+
+def test_chunk_text_keeps_small_sections_whole():
+    for unit in ('chars', 'tokens'):
+        chunks = chunk_text('Short. Section.', 'Intro', max_size=100, overlap=10, unit=unit)
+        assert len(chunks) == 1
+        assert chunks[0]['title'] == 'Intro'
+        assert (chunks[0]['start'], chunks[0]['end']) == (0, len('Short. Section.'))
+
+
+def test_token_unit_limits_tokens():
+    text = make_text(80, seed=11)
+    chunks = chunk_text(text, 'Tokens', max_size=60, overlap=10, unit='tokens')
+    assert len(chunks) > 1
+    for chunk in chunks:
+        single = len(sentence_spans(chunk['text'])) == 1
+        assert count_tokens(chunk['text']) <= 60 or single
+
+
+def test_chunk_ids_are_stable():
+    text = make_text(40, seed=5)
+    first = [c['chunk_id'] for c in chunk_text(text, 'Title', 200, 20)]
+    assert first == [c['chunk_id'] for c in chunk_text(text, 'Title', 200, 20)]
+    assert len(set(first)) == len(first)
+
+
+def test_unknown_unit_is_rejected():
+    with pytest.raises(ValueError):
+        chunk_spans('Some text. More text.', 10, 0, unit='words')
+    with pytest.raises(ValueError):
+        chunk_text('Some text. More text.' * 20, 'Title', 10, 0, unit='words')
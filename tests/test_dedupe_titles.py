@@ -0,0 +1,33 @@
+"""chunk_and_embed.dedupe_titles: unique section titles within a file"""
+
+import pytest
+
+pytest.importorskip('google.generativeai')
+pytest.importorskip('supabase')
+
+from chunk_and_embed import dedupe_titles  # noqa: E402
+
+
+def titles(*names):
+    return [{'title': name} for name in names]
+
+
+def test_unique_titles_are_unchanged():
+    chunks = dedupe_titles(titles('Hooks', 'Examples', 'Outro'))
+    assert [c['title'] for c in chunks] == ['Hooks', 'Examples', 'Outro']
+
+
+def test_repeated_titles_get_a_suffix():
+    chunks = dedupe_titles(titles('Examples', 'Examples', 'Examples'))
+    assert [c['title'] for c in chunks] == ['Examples', 'Examples (2)', 'Examples (3)']
+
+
+def test_suffix_skips_titles_already_in_the_file():
+    chunks = dedupe_titles(titles('Examples', 'Examples (2)', 'Examples', 'Examples'))
+    assert [c['title'] for c in chunks] == ['Examples', 'Examples (2)', 'Examples (3)', 'Examples (4)']
+
+
+def test_titles_end_up_unique():
+    chunks = dedupe_titles(titles('A', 'A', 'A (2)', 'A (2)', 'A'))
+    result = [c['title'] for c in chunks]
+    assert len(set(result)) == len(result)
@@ -0,0 +1,251 @@
+"""edge_resilience: circuit breaker, adaptive timeout and hedged requests"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import edge_resilience
+from edge_resilience import (
+    EDGE_MIN_SAMPLES, CircuitBreaker, CircuitOpenError, EdgeFunction, EdgeFunctionTimeout, EdgeResilience, is_failure
+)
+
+
+def status_error(code):
+    request = httpx.Request('POST', 'https://example.supabase.co/functions/v1/check-video-status')
+    return httpx.HTTPStatusError(str(code), request=request, response=httpx.Response(code, request=request))
+
+
+def expire_cooldown(breaker):
+    breaker.opened_at -= breaker.cooldown
+
+
+@pytest.fixture
+def short_timeouts(monkeypatch):
+    """Timeouts of a fraction of a second instead of 10-120s"""
+    monkeypatch.setattr(edge_resilience, 'EDGE_MIN_TIMEOUT', 0.05)
+    monkeypatch.setattr(edge_resilience, 'EDGE_MAX_TIMEOUT', 0.2)
+
+
+def test_is_failure():
+    assert is_failure(status_error(502))
+    assert not is_failure(status_error(404))
+    assert is_failure(EdgeFunctionTimeout())
+    assert is_failure(httpx.ConnectError('refused'))
+    assert not is_failure(ValueError('bad payload'))
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=3, cooldown=60)
+    assert not breaker.failure() and not breaker.failure()
+    breaker.success()  # resets the count
+    assert not breaker.failure() and not breaker.failure()
+    assert breaker.failure()  # third in a row opens
+    assert breaker.state == 'open'
+    assert not breaker.allow() and not breaker.available()
+    assert 0 < breaker.retry_after() <= 60
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failures=1, cooldown=60)
+    breaker.failure()
+    expire_cooldown(breaker)
+
+    assert breaker.available()  # doesn't take the trial
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow() and not breaker.available()
+
+    breaker.success()
+    assert breaker.state == 'closed'
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(failures=5, cooldown=60)
+    for _ in range(5):
+        breaker.failure()
+    expire_cooldown(breaker)
+    assert breaker.allow()
+    assert breaker.failure()  # a single failure in half-open state
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_timeout_needs_samples_and_idempotence():
+    fn = EdgeFunction('check-video-status')
+    fn.adaptive = True
+    assert fn.timeout() == edge_resilience.EDGE_MAX_TIMEOUT
+
+    fn.latencies.extend([1.0] * (EDGE_MIN_SAMPLES - 1) + [8.0])
+    assert fn.timeout() == 16.0  # 2 x p99
+    fn.adaptive = False
+    assert fn.timeout() == edge_resilience.EDGE_MAX_TIMEOUT
+
+
+def test_timeout_is_clamped():
+    fn = EdgeFunction('check-video-status')
+    fn.adaptive = True
+    fn.latencies.extend([0.1] * EDGE_MIN_SAMPLES)
+    assert fn.timeout() == edge_resilience.EDGE_MIN_TIMEOUT
+    fn.latencies.extend([500.0] * EDGE_MIN_SAMPLES)
+    assert fn.timeout() == edge_resilience.EDGE_MAX_TIMEOUT
+
+
+def test_hedge_budget():
+    fn = EdgeFunction('check-video-status')
+    fn.calls = 1
+    assert fn.hedge_delay() is None  # not enough samples
+    fn.latencies.extend(float(i) for i in range(1, 101))
+    assert fn.hedge_delay() == 96.0  # p95
+    fn.calls, fn.hedges = 20, 2
+    assert fn.hedge_delay() is None  # 10% of the calls already hedged
+    fn.calls = 21
+    assert fn.hedge_delay() == 96.0
+
+
+def test_call_records_latency_and_result():
+    edge = EdgeResilience()
+
+    async def send(timeout):
+        return {'status': 'ok', 'timeout': timeout}
+
+    result = asyncio.run(edge.call('generate-images', send))
+    assert result == {'status': 'ok', 'timeout': edge_resilience.EDGE_MAX_TIMEOUT}
+    fn = edge.function('generate-images')
+    assert (fn.calls, len(fn.latencies), fn.breaker.state) == (1, 1, 'closed')
+    assert edge.stats()['generate-images']['calls'] == 1
+
+
+def test_open_circuit_fails_fast():
+    edge = EdgeResilience()
+    edge.function('generate-videos').breaker = CircuitBreaker(failures=2, cooldown=60)
+    sent = []
+
+    async def send(timeout):
+        sent.append(timeout)
+        raise status_error(503)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(httpx.HTTPStatusError):
+                await edge.call('generate-videos', send)
+        with pytest.raises(CircuitOpenError) as error:
+            await edge.call('generate-videos', send)
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert len(sent) == 2
+    assert error.function == 'generate-videos' and error.retry_after > 0
+    assert not edge.available('generate-videos')
+
+
+def test_client_errors_do_not_open_the_circuit():
+    edge = EdgeResilience()
+    edge.function('generate-images').breaker = CircuitBreaker(failures=1, cooldown=60)
+
+    async def send(timeout):
+        raise status_error(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(edge.call('generate-images', send))
+    assert edge.function('generate-images').breaker.state == 'closed'
+
+
+def test_timeout_is_recorded_as_a_sample(short_timeouts):
+    edge = EdgeResilience()
+
+    async def send(timeout):
+        await asyncio.sleep(5)
+
+    with pytest.raises(EdgeFunctionTimeout):
+        asyncio.run(edge.call('check-video-status', send, idempotent=True))
+    fn = edge.function('check-video-status')
+    assert list(fn.latencies) == [0.2]
+    assert fn.breaker.failures == 1
+
+
+def test_hedge_answers_when_the_first_request_is_slow(short_timeouts):
+    edge = EdgeResilience()
+    fn = edge.function('check-video-status')
+    fn.latencies.extend([0.01] * EDGE_MIN_SAMPLES)
+    attempts = []
+
+    async def send(timeout):
+        attempts.append(timeout)
+        if len(attempts) == 1:
+            await asyncio.sleep(5)  # stuck first request
+            return 'first'
+        return 'hedge'
+
+    assert asyncio.run(edge.call('check-video-status', send, idempotent=True)) == 'hedge'
+    assert len(attempts) == 2
+    assert fn.hedges == 1
+    assert fn.breaker.state == 'closed'
+
+
+def test_no_hedge_when_the_first_request_is_fast(short_timeouts):
+    edge = EdgeResilience()
+    fn = edge.function('check-video-status')
+    fn.latencies.extend([0.05] * EDGE_MIN_SAMPLES)
+    attempts = []
+
+    async def send(timeout):
+        attempts.append(timeout)
+        return 'first'
+
+    assert asyncio.run(edge.call('check-video-status', send, idempotent=True)) == 'first'
+    assert len(attempts) == 1 and fn.hedges == 0
+
+
+def test_non_idempotent_calls_are_never_hedged(short_timeouts):
+    edge = EdgeResilience()
+    fn = edge.function('generate-videos')
+    fn.latencies.extend([0.01] * EDGE_MIN_SAMPLES)
+    attempts = []
+
+    async def send(timeout):
+        attempts.append(timeout)
+        await asyncio.sleep(0.05)
+        return 'done'
+
+    assert asyncio.run(edge.call('generate-videos', send)) == 'done'
+    assert attempts == [edge_resilience.EDGE_MAX_TIMEOUT] and fn.hedges == 0
+
+
+def test_hedged_call_fails_when_both_attempts_fail(short_timeouts):
+    edge = EdgeResilience()
+    fn = edge.function('check-video-status')
+    fn.latencies.extend([0.01] * EDGE_MIN_SAMPLES)
+    attempts = []
+
+    async def send(timeout):
+        attempts.append(timeout)
+        await asyncio.sleep(0.03)
+        raise status_error(500)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(edge.call('check-video-status', send, idempotent=True))
+    assert len(attempts) == 2
+    assert fn.breaker.failures == 1  # one logical call
+
+
+def test_cancelled_trial_frees_the_half_open_slot():
+    edge = EdgeResilience()
+    breaker = edge.function('check-video-status').breaker = CircuitBreaker(failures=1, cooldown=60)
+    breaker.failure()
+    expire_cooldown(breaker)
+
+    async def send(timeout):
+        await asyncio.sleep(5)
+
+    async def scenario():
+        task = asyncio.create_task(edge.call('check-video-status', send))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert breaker.state == 'half_open' and not breaker.trial_running
+    assert breaker.allow()
@@ -0,0 +1,130 @@
+"""embedding_cache.EmbeddingCache: round trip, LRU eviction and the size triggers"""
+
+import itertools
+import sqlite3
+
+import pytest
+
+import embedding_cache
+from embedding_cache import EmbeddingCache
+
+MODEL = 'models/text-embedding-004'
+DIM = 4
+ROW_BYTES = DIM * 4  # float32 blobs
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing time.time(), so last_used never ties"""
+    ticks = itertools.count(1_700_000_000)
+    monkeypatch.setattr(embedding_cache.time, 'time', lambda: float(next(ticks)))
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = EmbeddingCache(tmp_path / 'cache.sqlite', max_entries=10, max_bytes=10 * ROW_BYTES)
+    yield cache
+    cache.conn.close()
+
+
+def vector(i):
+    return [float(i), 0.5, -0.25, 1.0]
+
+
+def counted(cache):
+    """Entry/byte totals computed from the table itself"""
+    return cache.conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings').fetchone()
+
+
+def test_round_trip_and_hit_counts(cache):
+    cache.put(MODEL, 'hook formula', vector(1))
+    assert cache.get(MODEL, 'hook formula') == vector(1)
+    assert cache.get(MODEL, 'other text') is None
+    assert cache.get('other-model', 'hook formula') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+
+def test_whitespace_only_edits_share_an_entry(cache):
+    cache.put(MODEL, 'hook   formula\n', vector(1))
+    assert cache.get(MODEL, ' hook formula') == vector(1)
+
+
+def test_size_triggers_follow_put_upsert_delete_and_clear(cache):
+    for i in range(3):
+        cache.put(MODEL, f'text {i}', vector(i))
+    assert (cache.stats()['entries'], cache.stats()['bytes']) == counted(cache) == (3, 3 * ROW_BYTES)
+
+    # Same key again: an update, not a second entry
+    cache.put(MODEL, 'text 0', vector(9) + [1.0, 2.0])
+    assert (cache.stats()['entries'], cache.stats()['bytes']) == counted(cache) == (3, 3 * ROW_BYTES + 8)
+    assert cache.get(MODEL, 'text 0') == vector(9) + [1.0, 2.0]
+
+    cache.put('other-model', 'text 0', vector(0))
+    cache.clear('other-model')
+    assert (cache.stats()['entries'], cache.stats()['bytes']) == counted(cache)
+
+    cache.clear()
+    assert (cache.stats()['entries'], cache.stats()['bytes']) == counted(cache) == (0, 0)
+
+
+def test_evict_drops_least_recently_used_entries(cache):
+    for i in range(15):
+        cache.put(MODEL, f'text {i}', vector(i))
+    cache.get(MODEL, 'text 0')  # used recently: survives
+
+    removed = cache.evict()
+
+    target = int(cache.max_entries * embedding_cache.EVICT_TARGET_RATIO)
+    assert removed == 15 - target
+    assert cache.stats()['entries'] == target
+    assert cache.get(MODEL, 'text 0') == vector(0)
+    assert cache.get(MODEL, 'text 1') is None  # oldest unused
+    assert cache.get(MODEL, 'text 14') == vector(14)
+
+
+def test_evict_enforces_the_byte_limit(tmp_path, clock):
+    cache = EmbeddingCache(tmp_path / 'cache.sqlite', max_entries=1000, max_bytes=5 * ROW_BYTES)
+    for i in range(8):
+        cache.put(MODEL, f'text {i}', vector(i))
+    cache.evict()
+    stats = cache.stats()
+    assert stats['bytes'] <= cache.max_bytes * embedding_cache.EVICT_TARGET_RATIO
+    assert cache.get(MODEL, 'text 7') == vector(7)
+    cache.conn.close()
+
+
+def test_evict_is_a_no_op_within_limits(cache):
+    cache.put(MODEL, 'text', vector(1))
+    assert cache.evict() == 0
+    assert cache.stats()['entries'] == 1
+
+
+def test_put_checks_limits_every_interval(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(embedding_cache, 'EVICT_CHECK_INTERVAL', 5)
+    cache = EmbeddingCache(tmp_path / 'cache.sqlite', max_entries=3)
+    for i in range(4):
+        cache.put(MODEL, f'text {i}', vector(i))
+    assert cache.stats()['entries'] == 4  # not checked yet
+    cache.put(MODEL, 'text 4', vector(4))
+    assert cache.stats()['entries'] == int(3 * embedding_cache.EVICT_TARGET_RATIO)
+    cache.conn.close()
+
+
+def test_reopening_seeds_the_size_table_once(tmp_path, clock):
+    path = tmp_path / 'cache.sqlite'
+    cache = EmbeddingCache(path)
+    for i in range(3):
+        cache.put(MODEL, f'text {i}', vector(i))
+    cache.close()
+
+    # A cache written before the size table existed is seeded from its rows
+    conn = sqlite3.connect(str(path))
+    conn.executescript('DROP TABLE cache_size; DROP TRIGGER embeddings_size_insert; '
+                       'DROP TRIGGER embeddings_size_delete; DROP TRIGGER embeddings_size_update;')
+    conn.close()
+
+    for _ in range(2):
+        cache = EmbeddingCache(path)
+        assert (cache.stats()['entries'], cache.stats()['bytes']) == counted(cache) == (3, 3 * ROW_BYTES)
+        cache.close()
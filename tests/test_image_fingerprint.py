@@ -0,0 +1,67 @@
+"""job_worker.image_request_fingerprint: identical generation inputs hash alike"""
+
+from job_worker import image_request_fingerprint
+
+JOB = {
+    'visual_prompt': 'A creator filming a Reel in Jakarta at night',
+    'segment_type': 'HOOK',
+    'style': 'cinematic',
+    'aspect_ratio': '9:16',
+    'provider': 'gemini',
+    'character_ref_png': 'https://example.com/Ref.png',
+    'character_description': 'Young woman, red hijab',
+    'shot_type': 'B-ROLL',
+    'emotion': 'excited'
+}
+
+
+def fingerprint(**changes):
+    return image_request_fingerprint({**JOB, **changes})
+
+
+def test_same_inputs_same_fingerprint():
+    assert fingerprint() == image_request_fingerprint(dict(JOB))
+    assert len(fingerprint()) == 64
+
+
+def test_unrelated_fields_are_ignored():
+    assert fingerprint(id='job-1', user_id='u1', status=0) == fingerprint(id='job-2', user_id='u2', status=2)
+
+
+def test_whitespace_is_normalized():
+    assert fingerprint(visual_prompt='  A creator filming a Reel\n in  Jakarta\tat night ') == fingerprint()
+
+
+def test_unicode_is_nfkc_normalized():
+    # Fullwidth letters and a non-breaking space are NFKC-equivalent to ASCII
+    assert fingerprint(visual_prompt='A creator filming a Ｒｅｅｌ in\u00a0Jakarta at night') == fingerprint()
+    assert fingerprint(aspect_ratio='９:１６') == fingerprint()
+
+
+def test_enum_fields_ignore_case():
+    assert fingerprint(segment_type='hook', style='Cinematic', shot_type='b-roll',
+                       provider='Gemini', emotion='EXCITED') == fingerprint()
+
+
+def test_free_text_keeps_case():
+    assert fingerprint(visual_prompt=JOB['visual_prompt'].lower()) != fingerprint()
+    assert fingerprint(character_description='young woman, red hijab') != fingerprint()
+    assert fingerprint(character_ref_png='https://example.com/ref.png') != fingerprint()
+
+
+def test_missing_fields_use_column_defaults():
+    job = {k: v for k, v in JOB.items() if k not in ('style', 'aspect_ratio', 'shot_type')}
+    assert image_request_fingerprint(job) == fingerprint()
+    assert image_request_fingerprint({**job, 'style': None}) == fingerprint()
+
+
+def test_missing_and_empty_are_alike():
+    assert fingerprint(emotion=None) == fingerprint(emotion='')
+
+
+def test_generation_inputs_change_the_fingerprint():
+    base = fingerprint()
+    assert fingerprint(visual_prompt='Another prompt') != base
+    assert fingerprint(aspect_ratio='16:9') != base
+    assert fingerprint(provider='openai') != base
+    assert fingerprint(emotion='calm') != base
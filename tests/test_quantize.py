@@ -0,0 +1,66 @@
+"""quantize: int8/float16 round trip error and the pgvector text format"""
+
+import numpy as np
+import pytest
+
+from quantize import INT8_LEVELS, bytes_per_row, dequantize, format_vector, quantize
+
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((64, 768)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def test_float32_is_exact(matrix):
+    codes, scales = quantize(matrix, 'float32')
+    assert scales is None
+    assert np.array_equal(dequantize(codes), matrix)
+
+
+def test_float16_round_trip(matrix):
+    codes, scales = quantize(matrix, 'float16')
+    assert codes.dtype == np.float16 and scales is None
+    assert np.allclose(dequantize(codes), matrix, rtol=1e-3, atol=1e-4)
+
+
+def test_int8_round_trip(matrix):
+    codes, scales = quantize(matrix, 'int8')
+    assert codes.dtype == np.int8 and scales.shape == (len(matrix),)
+    assert np.abs(codes).max() == INT8_LEVELS  # the row maximum maps to +-127
+    restored = dequantize(codes, scales)
+    # Rounding error is at most half a step per element
+    assert np.all(np.abs(restored - matrix) <= scales[:, None] / 2 + 1e-7)
+    cosine = np.sum(restored * matrix, axis=1) / np.linalg.norm(restored, axis=1)
+    assert cosine.min() > 0.999
+
+
+def test_int8_zero_row(matrix):
+    matrix[3] = 0
+    codes, scales = quantize(matrix, 'int8')
+    assert not codes[3].any()
+    assert np.array_equal(dequantize(codes, scales)[3], matrix[3])
+
+
+def test_unknown_dtype_is_rejected(matrix):
+    with pytest.raises(ValueError):
+        quantize(matrix, 'bfloat16')
+
+
+def test_bytes_per_row():
+    assert bytes_per_row(768, 'float32') == 3072
+    assert bytes_per_row(768, 'float16') == 1536
+    assert bytes_per_row(768, 'int8') == 772
+
+
+def test_format_vector_round_trips_float32(matrix):
+    for row in matrix[:8]:
+        literal = format_vector(row)
+        assert literal.startswith('[') and literal.endswith(']')
+        parsed = np.array(literal[1:-1].split(','), dtype=np.float32)
+        assert np.array_equal(parsed, row)
+
+
+def test_format_vector_accepts_lists():
+    assert format_vector([0.5, -1.0, 0.0]) == '[0.5,-1,0]'
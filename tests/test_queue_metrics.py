@@ -0,0 +1,190 @@
+"""queue_metrics: sliding windows, drain estimate and incremental refresh"""
+
+import asyncio
+import re
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+import queue_metrics
+from queue_metrics import COMPLETED, FAILED, PENDING, PROCESSING, QueueMetrics, QueueStats
+
+NOW = float(int(time.time()))  # QueueMetrics starts its watermarks from the real clock
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Settable time.time() of queue_metrics"""
+    now = [NOW]
+    monkeypatch.setattr(queue_metrics.time, 'time', lambda: now[0])
+    return now
+
+
+def iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def test_active_counts_and_oldest_pending(clock):
+    stats = QueueStats()
+    stats.update('a', PENDING, created_at=NOW - 120)
+    stats.update('b', PENDING, created_at=NOW - 30)
+    stats.update('c', PROCESSING, created_at=NOW - 200)
+    snapshot = stats.snapshot()
+    assert (snapshot['pending'], snapshot['processing']) == (2, 1)
+    assert snapshot['oldest_pending_age_seconds'] == 120
+
+    stats.update('a', PROCESSING)  # keeps its created_at
+    assert stats.active['a'] == (PROCESSING, NOW - 120)
+    assert stats.snapshot()['oldest_pending_age_seconds'] == 30
+
+
+def test_windows_count_recent_completions(clock):
+    stats = QueueStats()
+    stats.update('a', COMPLETED, finished_at=NOW - 30)
+    stats.update('b', FAILED, finished_at=NOW - 200)
+    stats.update('c', COMPLETED, finished_at=NOW - 600)
+    stats.update('d', COMPLETED, finished_at=NOW - 2000)  # older than every window: dropped
+
+    windows = stats.snapshot()['windows']
+    assert windows['60s'] == {'completed': 1, 'failed': 0, 'per_minute': 1.0}
+    assert windows['300s'] == {'completed': 1, 'failed': 1, 'per_minute': 0.4}
+    assert windows['900s'] == {'completed': 2, 'failed': 1, 'per_minute': 0.2}
+
+    clock[0] += 400  # 'c' leaves the largest window
+    assert stats.snapshot()['windows']['900s']['completed'] == 1
+    assert 'c' not in stats.finished_ids
+
+
+def test_finished_job_counted_once_and_removed_from_active(clock):
+    stats = QueueStats()
+    stats.update('a', PROCESSING, created_at=NOW - 10)
+    stats.update('a', COMPLETED, finished_at=NOW - 5)
+    stats.update('a', COMPLETED, finished_at=NOW - 5)  # listener update and refresh page
+    snapshot = stats.snapshot()
+    assert snapshot['processing'] == 0
+    assert snapshot['windows']['60s']['completed'] == 1
+
+
+def test_out_of_order_completions_stay_sorted(clock):
+    stats = QueueStats()
+    stats.update('a', COMPLETED, finished_at=NOW - 10)
+    stats.update('b', COMPLETED, finished_at=NOW - 500)
+    assert [finished_at for finished_at, _, _ in stats.finished] == [NOW - 500, NOW - 10]
+    clock[0] += 450
+    assert stats.snapshot()['windows']['900s']['completed'] == 1
+
+
+def test_drain_estimate(clock):
+    stats = QueueStats()
+    assert stats.snapshot()['estimated_drain_seconds'] == 0  # no backlog
+
+    stats.update('p1', PENDING, created_at=NOW - 60)
+    assert stats.snapshot()['estimated_drain_seconds'] is None  # nothing finished: not draining
+
+    for i in range(10):
+        stats.update(f'done{i}', COMPLETED, finished_at=NOW - 10 * i)
+    # 10 jobs in 300s = 2/min; one job in the backlog drains in 30s
+    assert stats.snapshot()['estimated_drain_seconds'] == 30
+    stats.update('p2', PROCESSING)
+    assert stats.snapshot()['estimated_drain_seconds'] == 60
+
+
+def test_set_counts_overrides_the_active_set(clock):
+    stats = QueueStats()
+    stats.update('a', PENDING, created_at=NOW - 5)
+    stats.set_counts(1500, 12, NOW - 900)
+    snapshot = stats.snapshot()
+    assert (snapshot['pending'], snapshot['processing']) == (1500, 12)
+    assert snapshot['oldest_pending_age_seconds'] == 900
+
+
+def test_record_row_skips_active_rows_of_counted_queues(clock):
+    async def fetch(table, params):
+        return []
+
+    metrics = QueueMetrics(fetch=fetch)
+    metrics.record_row('image_generation_jobs', {'id': 'a', 'status': PENDING})
+    metrics.record_row('image_generation_jobs', {'id': 'b', 'status': COMPLETED, 'completed_at': iso(NOW - 20)})
+    metrics.record_row('unknown_table', {'id': 'c', 'status': COMPLETED})
+    image = metrics.queues['image']
+    assert image.active == {}
+    assert list(image.finished_ids) == ['b']
+
+
+class FakeTable:
+    """Finished rows served with PostgREST's (updated_at, id) keyset filters"""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda row: (row['updated_at'], row['id']))
+        self.requests = []
+
+    async def fetch(self, table, params):
+        self.requests.append(dict(params))
+        if params.get('status') == f'eq.{PENDING}':
+            return [{'created_at': iso(NOW - 300)}]
+        if 'or' in params:
+            updated_at, last_id = re.match(
+                r'\(updated_at\.gt\."(.+?)",and\(updated_at\.eq\."(.+?)",id\.gt\."(.+?)"\)\)', params['or']
+            ).group(1, 3)
+            rows = [row for row in self.rows if (row['updated_at'], row['id']) > (updated_at, last_id)]
+        else:
+            since = params['updated_at'][len('gt.'):]
+            rows = [row for row in self.rows if row['updated_at'] > since]
+        return rows[:int(params['limit'])]
+
+    async def count(self, table, params):
+        return {f'eq.{PENDING}': 3, f'eq.{PROCESSING}': 1}[params['status']]
+
+
+def test_refresh_pages_rows_sharing_updated_at(clock, monkeypatch):
+    monkeypatch.setattr(queue_metrics, 'FINISHED_PAGE_SIZE', 2)
+    shared = iso(NOW - 30)  # one statement finished these together
+    rows = [{'id': f'job-{i}', 'status': COMPLETED, 'updated_at': shared, 'completed_at': shared} for i in range(5)]
+    table = FakeTable(rows)
+    metrics = QueueMetrics(fetch=table.fetch, count=table.count, queues=('image', 'video'))
+
+    asyncio.run(metrics.refresh())
+
+    for queue in ('image', 'video'):
+        snapshot = metrics.queues[queue].snapshot()
+        assert (snapshot['pending'], snapshot['processing']) == (3, 1)
+        assert snapshot['oldest_pending_age_seconds'] == 300
+        assert snapshot['windows']['60s']['completed'] == 5
+    assert metrics.watermarks['image_generation_jobs'] == (shared, 'job-4')
+
+    # Only rows after the watermark are read next time
+    table.rows.append({'id': 'job-0', 'status': FAILED, 'updated_at': iso(NOW - 10), 'completed_at': iso(NOW - 10)})
+    table.requests.clear()
+    asyncio.run(metrics.refresh())
+    finished_requests = [r for r in table.requests if r.get('status', '').startswith('in.')]
+    assert len(finished_requests) == 2  # one page per table
+    assert metrics.watermarks['image_generation_jobs'] == (iso(NOW - 10), 'job-0')
+
+
+def test_refresh_if_stale(clock):
+    table = FakeTable([])
+    metrics = QueueMetrics(fetch=table.fetch, count=table.count)
+
+    async def refresh_twice():
+        await asyncio.gather(metrics.refresh_if_stale(), metrics.refresh_if_stale())
+
+    asyncio.run(refresh_twice())
+    refreshes = len(table.requests)
+    assert refreshes and metrics.refreshed_at == NOW  # concurrent callers shared one refresh
+
+    asyncio.run(metrics.refresh_if_stale())
+    assert len(table.requests) == refreshes
+    clock[0] += queue_metrics.QUEUE_METRICS_REFRESH
+    asyncio.run(metrics.refresh_if_stale())
+    assert len(table.requests) == 2 * refreshes
+
+
+def test_snapshot_shape(clock):
+    metrics = QueueMetrics()
+    metrics.record('combine', 'job-1', PENDING)
+    snapshot = metrics.snapshot()
+    assert set(snapshot['queues']) == {'image', 'video', 'combine'}
+    assert snapshot['queues']['combine']['pending'] == 1
+    assert snapshot['refreshed_at'] is None
+    assert snapshot['windows_seconds'] == list(queue_metrics.WINDOWS)
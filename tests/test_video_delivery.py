@@ -0,0 +1,178 @@
+"""video_delivery.RangeFileResponse: ranges, conditional requests, 416"""
+
+import asyncio
+import os
+from email.utils import formatdate
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from video_delivery import RangeFileResponse, accel_redirect_response, parse_range_header
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / 'final_video.mp4'
+    path.write_bytes(CONTENT)
+    os.utime(path, (1_700_000_000, 1_700_000_000))
+    return path
+
+
+@pytest.fixture
+def client(video):
+    async def endpoint(request):
+        return RangeFileResponse(str(video), chunk_size=1000)
+
+    app = Starlette(routes=[Route('/video', endpoint, methods=['GET', 'HEAD'])])
+    return TestClient(app)
+
+
+def test_parse_range_header():
+    assert parse_range_header('bytes=0-99', 1000) == [(0, 99)]
+    assert parse_range_header('bytes=900-', 1000) == [(900, 999)]
+    assert parse_range_header('bytes=-100', 1000) == [(900, 999)]
+    assert parse_range_header('bytes=0-2000', 1000) == [(0, 999)]
+    assert parse_range_header('bytes=0-9, 5-19, 50-59', 1000) == [(0, 19), (50, 59)]
+    assert parse_range_header('bytes=2000-', 1000) == []
+    assert parse_range_header('bytes=9-0', 1000) is None
+    assert parse_range_header('items=0-9', 1000) is None
+    assert parse_range_header('bytes=a-b', 1000) is None
+
+
+def test_full_file(client):
+    response = client.get('/video')
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers['accept-ranges'] == 'bytes'
+    assert response.headers['content-length'] == str(len(CONTENT))
+    assert response.headers['content-type'] == 'video/mp4'
+    assert response.headers['etag']
+    assert response.headers['last-modified'] == formatdate(1_700_000_000, usegmt=True)
+
+
+def test_single_range(client):
+    response = client.get('/video', headers={'Range': 'bytes=1000-2999'})
+    assert response.status_code == 206
+    assert response.content == CONTENT[1000:3000]
+    assert response.headers['content-range'] == f'bytes 1000-2999/{len(CONTENT)}'
+    assert response.headers['content-length'] == '2000'
+
+
+def test_suffix_and_open_ranges(client):
+    response = client.get('/video', headers={'Range': 'bytes=-100'})
+    assert response.status_code == 206
+    assert response.content == CONTENT[-100:]
+    response = client.get('/video', headers={'Range': 'bytes=10000-'})
+    assert response.content == CONTENT[10000:]
+
+
+def test_multiple_ranges(client):
+    response = client.get('/video', headers={'Range': 'bytes=0-9, 5000-5009'})
+    assert response.status_code == 206
+    content_type = response.headers['content-type']
+    assert content_type.startswith('multipart/byteranges; boundary=')
+    boundary = content_type.split('boundary=')[1]
+    assert response.headers['content-length'] == str(len(response.content))
+
+    parts = response.content.split(f'--{boundary}'.encode())
+    assert parts[-1] == b'--\r\n'
+    bodies = [part.split(b'\r\n\r\n', 1) for part in parts[1:-1]]
+    assert b'Content-Range: bytes 0-9/10240' in bodies[0][0]
+    assert bodies[0][1] == CONTENT[0:10] + b'\r\n'
+    assert b'Content-Range: bytes 5000-5009/10240' in bodies[1][0]
+    assert bodies[1][1] == CONTENT[5000:5010] + b'\r\n'
+
+
+def test_unsatisfiable_range(client):
+    response = client.get('/video', headers={'Range': f'bytes={len(CONTENT)}-'})
+    assert response.status_code == 416
+    assert response.headers['content-range'] == f'bytes */{len(CONTENT)}'
+    assert response.content == b''
+
+
+def test_malformed_range_serves_the_full_file(client):
+    response = client.get('/video', headers={'Range': 'bytes=20-10'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_none_match(client):
+    etag = client.get('/video').headers['etag']
+    response = client.get('/video', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+    assert client.get('/video', headers={'If-None-Match': f'W/{etag}'}).status_code == 304
+    assert client.get('/video', headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_if_modified_since(client):
+    response = client.get('/video', headers={'If-Modified-Since': formatdate(1_700_000_000, usegmt=True)})
+    assert response.status_code == 304
+    response = client.get('/video', headers={'If-Modified-Since': formatdate(1_600_000_000, usegmt=True)})
+    assert response.status_code == 200
+    response = client.get('/video', headers={'If-Modified-Since': 'not a date'})
+    assert response.status_code == 200
+
+
+def test_if_none_match_takes_precedence(client):
+    headers = {'If-None-Match': '"other"', 'If-Modified-Since': formatdate(1_700_000_000, usegmt=True)}
+    assert client.get('/video', headers=headers).status_code == 200
+
+
+def test_if_range(client):
+    etag = client.get('/video').headers['etag']
+    response = client.get('/video', headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert response.status_code == 206
+    response = client.get('/video', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_head(client):
+    response = client.head('/video', headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert response.headers['content-length'] == '100'
+    assert response.content == b''
+
+
+def test_accel_redirect_response():
+    response = accel_redirect_response('/internal/videos/final.mp4')
+    assert response.headers['x-accel-redirect'] == '/internal/videos/final.mp4'
+    assert response.body == b''
+
+
+def call(response, headers, extensions):
+    """Run the response as an ASGI app with the given server extensions; returns the sent messages"""
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': '/video', 'extensions': extensions,
+        'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(response(scope, receive, send))
+    return messages
+
+
+def test_pathsend_for_full_file(video):
+    messages = call(RangeFileResponse(str(video)), {}, {'http.response.pathsend': {}})
+    assert messages[0]['status'] == 200
+    assert messages[1] == {'type': 'http.response.pathsend', 'path': str(video)}
+
+
+def test_zerocopy_for_ranges(video):
+    messages = call(RangeFileResponse(str(video)), {'Range': 'bytes=100-199'}, {'http.response.zerocopy': {}})
+    assert messages[0]['status'] == 206
+    body = messages[1]
+    assert body['type'] == 'http.response.zerocopy'
+    assert (body['offset'], body['count'], body['more_body']) == (100, 100, False)